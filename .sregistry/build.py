@@ -1,40 +1,74 @@
 import json, sys, os
-import shutil, subprocess
+import argparse, shutil, subprocess, time
 from typing import Dict
 import recipe as rc
+import ninja_stats as ns
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import xcc.generator as gn
 
 def main():
-    if len(sys.argv) < 2:
-        print('usage: python3 build.py /path/config.json')
-        exit(0)
+    parser = argparse.ArgumentParser(
+        description='Create the recipes and build the containers. Containers, whose normalized '
+        'recipe was already built, are reused from the image index.')
+    parser.add_argument('config', type=str,
+                        help='json config with the number of compile and linker threads')
+    parser.add_argument('--index', type=str, default=rc.default_index_name,
+                        help='json file with the built images (default: ' + rc.default_index_name + ')')
+    parser.add_argument('--history', type=str, default=ns.default_history_name,
+                        help='json file with the build times of the previous releases (default: '
+                        + ns.default_history_name + ')')
+    parser.add_argument('--force', action='store_true',
+                        help='build all containers, also if a matching image exists')
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help='do not ask for confirmation of the config')
+    args = parser.parse_args()
 
-    check_singularity()
+    singularity_version = check_singularity()
 
     # load the number of compile and link threads from a json file
-    with open(str(sys.argv[1])) as config_file:
+    with open(args.config) as config_file:
         config = json.load(config_file)['build']
         config_file.close()
 
     print('compile threads: ' + str(config['compile_threads']) + '\n'
-          'linker threads: ' + str(config['linker_threads']) + '\n')
+          'linker threads: ' + str(config['linker_threads']) + '\n'
+          'cpu targets: ' + ', '.join([t if t else 'generic' for t in rc.get_cpu_targets(config)]) + '\n')
 
-    answer = ''
+    answer = 'y' if args.yes else ''
     while answer not in ('y', 'n'):
         answer = input('is the config correct? [y/n] : ')
-        if answer == 'y':
-            rc.create(config, False)
-            build(False)
-            rc.create(config, True)
-            build(True)
-        if answer == 'n':
-            exit(1)
-
-def check_singularity():
+    if answer == 'n':
+        exit(1)
+
+    index = rc.load_index(args.index)
+    for cpu_target in rc.get_cpu_targets(config):
+        for libcxx in (False, True):
+            rc.create(config, libcxx, cpu_target)
+            recipe_hash = rc.get_recipe_hash(config, libcxx, cpu_target, [singularity_version])
+            image_name = rc.get_names(libcxx, cpu_target)['image']
+            if not args.force and reuse(index, recipe_hash, image_name):
+                continue
+            start = time.monotonic()
+            build(libcxx, cpu_target)
+            total = time.monotonic() - start
+            index[recipe_hash] = {'image' : os.path.abspath(image_name),
+                                  'sha256' : rc.get_digest(image_name),
+                                  'built' : time.strftime('%Y-%m-%d %H:%M:%S')}
+            rc.save_index(args.index, index)
+            # the analysis of the build times does not stop the pipeline
+            try:
+                ns.track_build(args.history, image_name, rc.get_names(libcxx, cpu_target)['library'],
+                               config, total)
+            except Exception as e:
+                print('could not analyse the build time of ' + image_name + ': ' + str(e))
+
+def check_singularity() -> str:
     """Check if the singularity container software is available and runs 'singularity --version'
 
+    :returns: output of 'singularity --version'
+    :rtype: str
+
     """
     if not shutil.which('singularity'):
         print('could not find singularity')
@@ -42,42 +76,70 @@ def check_singularity():
 
     process = subprocess.Popen(['singularity', '--version'], stdout=subprocess.PIPE)
     output, error = process.communicate()
-    if error is not None:
+    if process.returncode != 0:
         print('could not run "singularity --version"')
         exit(1)
 
     print(output.decode("utf-8"))
+    return output.decode("utf-8").strip()
+
+def reuse(index : Dict[str, Dict[str, str]], recipe_hash : str, image_name : str) -> bool:
+    """Check, if an image of the recipe hash exists and is unchanged. If the image is stored
+    under another name, it is copied to image_name.
+
+    :param index: image index
+    :type index: Dict[str, Dict[str, str]]
+    :param recipe_hash: hash of the normalized recipe (see recipe.get_recipe_hash())
+    :type recipe_hash: str
+    :param image_name: file name of the image
+    :type image_name: str
+    :returns: True, if the image can be reused
+    :rtype: bool
+
+    """
+    entry = index.get(recipe_hash)
+    if entry is None or not os.path.exists(entry['image']):
+        return False
+    if rc.get_digest(entry['image']) != entry['sha256']:
+        print(entry['image'] + ' was changed after the build, rebuild ' + image_name)
+        return False
+
+    if os.path.abspath(image_name) != entry['image']:
+        shutil.copyfile(entry['image'], image_name)
+    print('reuse ' + entry['image'] + ' (built ' + entry['built'] + ') for ' + image_name
+          + ', recipe hash ' + recipe_hash[:12])
+    return True
 
-def build(libcxx : bool):
-    """Generate the singularity recipe and build it.
+def build(libcxx : bool, cpu_target : str = ''):
+    """Build the singularity recipe.
     :param libcxx: build the container with libc++
     :type libcxx: bool
+    :param cpu_target: target cpu, empty for the portable container
+    :type cpu_target: str
 
     """
-    if libcxx:
-        recipe_name = 'recipe_libcxx.def'
-        image_name = 'xeus-cling-cuda-container-cxx.sif'
-        log_name = 'build_libcxx.log'
-    else:
-        recipe_name = 'recipe.def'
-        image_name = 'xeus-cling-cuda-container.sif'
-        log_name = 'build.log'
+    names = rc.get_names(libcxx, cpu_target)
+    recipe_name = names['recipe']
+    image_name = names['image']
+    log_name = names['log']
 
     # build image
     process = subprocess.Popen(['singularity',
                                 'build',
+                                '--force',
                                 '--fakeroot',
                                 image_name,
                                 recipe_name],
                                stdout=subprocess.PIPE)
     output, error = process.communicate()
-    if error is not None:
-        print('"singularity build --fakeroot ' + image_name + ' ' + recipe_name  + '" failed')
-        exit(1)
 
     with open(log_name, 'w') as build_log:
         build_log.write(output.decode('utf-8'))
         build_log.close()
 
+    if process.returncode != 0:
+        print('"singularity build --fakeroot ' + image_name + ' ' + recipe_name  + '" failed')
+        exit(1)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,450 @@
+import sys, json, os
+import argparse, gzip, io, re, shutil, subprocess, tarfile, time
+from typing import Dict, List, Tuple
+import recipe as rc
+
+# history of the build times: variant -> version -> record (see record())
+default_history_name = 'build_history.json'
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Analyse the ninja logs of the container builds: wall time, critical path, '
+        'slowest translation units and the best possible parallel speedup. The results can be '
+        'stored in a local history and are compared with previous releases.')
+    parser.add_argument('sources', type=str, nargs='+',
+                        help='images with ninja logs (see recipe.ninja_log_path), folders with *.ninja_log files\n'
+                        'or build folders of a --keep_build build, which contain .ninja_log files')
+    parser.add_argument('--history', type=str, default=default_history_name,
+                        help='json file with the build times of previous releases (default: '
+                        + default_history_name + ')')
+    parser.add_argument('--variant', type=str, default='',
+                        help='name of the container variant in the history, e.g. xeus-cling-cuda '
+                        '(default: file name of the first source)')
+    parser.add_argument('--version', type=str, default='',
+                        help='container version in the history (default: version of the generator)')
+    parser.add_argument('--config', type=str, default='',
+                        help='json config of build.py, only builds with the same number of threads are compared')
+    parser.add_argument('--record', action='store_true',
+                        help='store the result in the history')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of the slowest translation units (default: 10)')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative increase of a build time, which is a regression (default: 0.1)')
+    parser.add_argument('--min_seconds', type=float, default=60,
+                        help='smaller increases of a build time are not a regression (default: 60)')
+    parser.add_argument('--fail_on_regression', action='store_true',
+                        help='exit with code 2, if a regression was found')
+    args = parser.parse_args()
+
+    projects = {}
+    for source in args.sources:
+        projects.update(collect(source, args.top))
+    if not projects:
+        print('could not find ninja logs in: ' + ', '.join(args.sources))
+        exit(1)
+
+    threads = {}
+    if args.config:
+        with open(args.config) as config_file:
+            config = json.load(config_file)['build']
+        threads = {'compile_threads' : config['compile_threads'],
+                   'linker_threads' : config['linker_threads']}
+
+    variant = args.variant if args.variant else os.path.splitext(os.path.basename(
+        os.path.normpath(args.sources[0])))[0]
+    version = args.version if args.version else rc.get_version()
+    current = {'date' : time.strftime('%Y-%m-%d %H:%M:%S'), 'projects' : projects}
+    current.update(threads)
+
+    print_report(projects)
+    history = load_history(args.history)
+    regressions = find_regressions(history, variant, version, current,
+                                   args.threshold, args.min_seconds)
+    print_regressions(regressions)
+
+    if args.record:
+        record(args.history, variant, version, current)
+
+    if regressions and args.fail_on_regression:
+        exit(2)
+
+def parse_ninja_log(text : str) -> List[Dict]:
+    """Parse a ninja log (format v5). The log contains the steps of all builds in the build
+    folder, only the last build is returned. Commands with several outputs are one step.
+
+    :param text: content of the .ninja_log file
+    :type text: str
+    :returns: steps with start and end time in seconds and the outputs
+    :rtype: List[Dict]
+
+    """
+    entries : Dict[str, Tuple[int, int, str]] = {}
+    last_end = 0
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split('\t')
+        if len(fields) != 5:
+            continue
+        start, end, output, cmd_hash = int(fields[0]), int(fields[1]), fields[3], fields[4]
+        # the times of a new build start again at 0
+        if end < last_end:
+            entries = {}
+        last_end = end
+        entries[output] = (start, end, cmd_hash)
+
+    steps : Dict[Tuple[int, int, str], Dict] = {}
+    for output, (start, end, cmd_hash) in entries.items():
+        key = (start, end, cmd_hash)
+        if key not in steps:
+            steps[key] = {'start' : start / 1000.0, 'end' : end / 1000.0, 'outputs' : []}
+        steps[key]['outputs'].append(output)
+    return sorted(steps.values(), key=lambda s: s['start'])
+
+def parse_ninja_graph(text : str) -> Dict[str, List[str]]:
+    """Parse the output of 'ninja -t graph' (graphviz dot).
+
+    :param text: dot graph
+    :type text: str
+    :returns: dependency graph: output file -> input files
+    :rtype: Dict[str, List[str]]
+
+    """
+    labels : Dict[str, str] = {}
+    edge_nodes = set()
+    inputs : Dict[str, List[str]] = {}
+    node_re = re.compile(r'^"(\w+)" \[label="(.*?)"(, shape=ellipse)?\]$')
+    arrow_re = re.compile(r'^"(\w+)" -> "(\w+)"')
+    for line in text.splitlines():
+        match = node_re.match(line)
+        if match:
+            labels[match.group(1)] = match.group(2)
+            if match.group(3):
+                edge_nodes.add(match.group(1))
+            continue
+        match = arrow_re.match(line)
+        if match:
+            inputs.setdefault(match.group(2), []).append(match.group(1))
+
+    # replace the nodes of commands with several inputs or outputs by their inputs
+    graph : Dict[str, List[str]] = {}
+    for node, node_inputs in inputs.items():
+        if node in edge_nodes:
+            continue
+        files = []
+        for i in node_inputs:
+            files += inputs.get(i, []) if i in edge_nodes else [i]
+        graph[labels.get(node, node)] = [labels.get(f, f) for f in files]
+    return graph
+
+def get_critical_path(steps : List[Dict], graph : Dict[str, List[str]]) -> Tuple[float, List[str]]:
+    """Returns the longest chain of dependent steps. Files, which were not built in the last
+    build, e.g. sources and up to date outputs, take no time.
+
+    :param steps: steps of the last build (see parse_ninja_log())
+    :type steps: List[Dict]
+    :param graph: dependency graph (see parse_ninja_graph())
+    :type graph: Dict[str, List[str]]
+    :returns: length of the critical path in seconds and the outputs of the steps on the path
+    :rtype: Tuple[float, List[str]]
+
+    """
+    duration = {}
+    for step in steps:
+        for output in step['outputs']:
+            duration[output] = step['end'] - step['start']
+
+    # iterative depth-first search, the LLVM graph is too deep for a recursion
+    finish : Dict[str, Tuple[float, str]] = {}
+    for root in graph:
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in finish:
+                continue
+            deps = graph.get(node, [])
+            if not expanded:
+                stack.append((node, True))
+                stack += [(d, False) for d in deps if d not in finish]
+                continue
+            before, previous = max(((finish[d][0], d) for d in deps if d in finish),
+                                   default=(0.0, ''))
+            finish[node] = (before + duration.get(node, 0.0), previous)
+
+    if not finish:
+        return 0.0, []
+    node = max(finish, key=lambda n: finish[n][0])
+    length = finish[node][0]
+    path = []
+    while node:
+        if node in duration:
+            path.append(node)
+        node = finish[node][1]
+    return length, list(reversed(path))
+
+def analyse(log_text : str, graph_text : str = '', top : int = 10) -> Dict:
+    """Returns the build time statistics of a ninja log.
+
+    :param log_text: content of the .ninja_log file
+    :type log_text: str
+    :param graph_text: output of 'ninja -t graph', if empty, the critical path is not computed
+    :type graph_text: str
+    :param top: number of the slowest translation units
+    :type top: int
+    :returns: wall time, sum of all steps, critical path and the slowest translation units
+    :rtype: Dict
+
+    """
+    steps = parse_ninja_log(log_text)
+    if not steps:
+        return {}
+    wall = max(s['end'] for s in steps) - min(s['start'] for s in steps)
+    work = sum(s['end'] - s['start'] for s in steps)
+    longest = max(s['end'] - s['start'] for s in steps)
+
+    stats = {'steps' : len(steps),
+             'wall' : round(wall, 1),
+             'work' : round(work, 1),
+             'parallelism' : round(work / wall, 2) if wall else 0.0}
+    if graph_text:
+        length, path = get_critical_path(steps, parse_ninja_graph(graph_text))
+        stats['critical_path'] = round(length, 1)
+        stats['critical_path_steps'] = len(path)
+        stats['max_speedup'] = round(work / length, 2) if length else 0.0
+    else:
+        # without the dependency graph, the longest step is a lower bound of the critical path
+        stats['max_speedup'] = round(work / longest, 2) if longest else 0.0
+
+    translation_units = [s for s in steps if any(o.endswith('.o') for o in s['outputs'])]
+    translation_units.sort(key=lambda s: s['end'] - s['start'], reverse=True)
+    stats['slowest'] = [[s['outputs'][0], round(s['end'] - s['start'], 1)]
+                        for s in translation_units[:top]]
+    return stats
+
+def read_image_logs(image_name : str, path : str = rc.ninja_log_path) -> Dict[str, bytes]:
+    """Returns the files of the ninja log folder of an image.
+
+    :param image_name: path of the image
+    :type image_name: str
+    :param path: ninja log folder in the image
+    :type path: str
+    :returns: file name -> content
+    :rtype: Dict[str, bytes]
+
+    """
+    process = subprocess.Popen(['singularity', 'exec', image_name, 'tar', '-C', path, '-cf', '-', '.'],
+                               stdout=subprocess.PIPE)
+    output, error = process.communicate()
+    if process.returncode != 0:
+        print('could not read ' + path + ' of ' + image_name)
+        return {}
+
+    files = {}
+    with tarfile.open(fileobj=io.BytesIO(output)) as archive:
+        for member in archive.getmembers():
+            if member.isfile():
+                files[os.path.basename(member.name)] = archive.extractfile(member).read()
+    return files
+
+def read_folder_logs(folder : str) -> Dict[str, bytes]:
+    """Returns the *.ninja_log and *.ninja_graph.gz files of a folder. The .ninja_log files in
+    build folders (--keep_build) are named after the build folder. If ninja is installed, the
+    dependency graph is created from the build folder.
+
+    :param folder: folder with ninja logs or build folders
+    :type folder: str
+    :returns: file name -> content
+    :rtype: Dict[str, bytes]
+
+    """
+    files = {}
+    for root, dirs, names in os.walk(folder):
+        for name in names:
+            if name.endswith('.ninja_log') or name.endswith('.ninja_graph.gz'):
+                with open(os.path.join(root, name), 'rb') as log_file:
+                    files[name if name != '.ninja_log' else os.path.basename(root) + name] = log_file.read()
+        if '.ninja_log' in names and 'build.ninja' in names:
+            # the build folder contains many thousand files, the subfolders are not searched
+            dirs[:] = []
+            if shutil.which('ninja'):
+                process = subprocess.Popen(['ninja', '-C', root, '-t', 'graph'],
+                                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                output, error = process.communicate()
+                if process.returncode == 0:
+                    files[os.path.basename(root) + '.ninja_graph.gz'] = gzip.compress(output)
+    return files
+
+def collect(source : str, top : int = 10) -> Dict[str, Dict]:
+    """Analyse all ninja logs of an image or a folder.
+
+    :param source: image or folder
+    :type source: str
+    :param top: number of the slowest translation units
+    :type top: int
+    :returns: build name -> statistics (see analyse())
+    :rtype: Dict[str, Dict]
+
+    """
+    files = read_folder_logs(source) if os.path.isdir(source) else read_image_logs(source)
+    projects = {}
+    for name in sorted(files):
+        if not name.endswith('.ninja_log'):
+            continue
+        build_name = name[:-len('.ninja_log')]
+        graph = files.get(build_name + '.ninja_graph.gz')
+        stats = analyse(files[name].decode('utf-8'),
+                        gzip.decompress(graph).decode('utf-8') if graph else '', top)
+        if stats:
+            projects[build_name] = stats
+    return projects
+
+def load_history(history_name : str) -> Dict[str, Dict[str, Dict]]:
+    """Load the build time history. Returns an empty history, if the file does not exist.
+
+    :param history_name: path of the history
+    :type history_name: str
+    :returns: variant -> version -> record
+    :rtype: Dict[str, Dict[str, Dict]]
+
+    """
+    if not os.path.exists(history_name):
+        return {}
+    with open(history_name) as history_file:
+        return json.load(history_file)
+
+def record(history_name : str, variant : str, version : str, current : Dict):
+    """Store the build times of a version in the history. An existing record of the same
+    version is replaced, e.g. after a rebuild.
+
+    :param history_name: path of the history
+    :type history_name: str
+    :param variant: name of the container variant
+    :type variant: str
+    :param version: container version
+    :type version: str
+    :param current: record with the date, the number of threads, the total build time and the statistics of the projects
+    :type current: Dict
+
+    """
+    history = load_history(history_name)
+    history.setdefault(variant, {})[version] = current
+    with open(history_name + '.tmp', 'w') as history_file:
+        json.dump(history, history_file, indent=2, sort_keys=True)
+    os.replace(history_name + '.tmp', history_name)
+
+def find_regressions(history : Dict[str, Dict[str, Dict]], variant : str, version : str,
+                     current : Dict, threshold : float = 0.1, min_seconds : float = 60,
+                     window : int = 3) -> List[str]:
+    """Compare the total and per project build times with the median of the last previous
+    releases, which were built with the same number of threads.
+
+    :param history: build time history (see load_history())
+    :type history: Dict[str, Dict[str, Dict]]
+    :param variant: name of the container variant
+    :type variant: str
+    :param version: container version, records of the same version are not compared
+    :type version: str
+    :param current: record of the current build
+    :type current: Dict
+    :param threshold: relative increase, which is a regression
+    :type threshold: float
+    :param min_seconds: smaller absolute increases are ignored
+    :type min_seconds: float
+    :param window: number of previous releases
+    :type window: int
+    :returns: description of each regression
+    :rtype: List[str]
+
+    """
+    def same_threads(r : Dict) -> bool:
+        return all(r.get(k) == current.get(k) for k in ('compile_threads', 'linker_threads'))
+
+    previous = sorted([(r['date'], v, r) for v, r in history.get(variant, {}).items()
+                       if v != version and same_threads(r)])[-window:]
+    if not previous:
+        return []
+
+    def median(values : List[float]) -> float:
+        values = sorted(values)
+        middle = len(values) // 2
+        return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+    def check(name : str, value, baseline_values : List[float]) -> List[str]:
+        if value is None or not baseline_values:
+            return []
+        baseline = median(baseline_values)
+        if value > baseline * (1 + threshold) and value - baseline > min_seconds:
+            return ['{0}: {1:.0f} s, previous releases {2:.0f} s (+{3:.0f} %)'.format(
+                name, value, baseline, (value / baseline - 1) * 100 if baseline else 0)]
+        return []
+
+    versions = ', '.join(v for _, v, _ in previous)
+    regressions = check('total build time', current.get('total'),
+                        [r['total'] for _, _, r in previous if 'total' in r])
+    for project, stats in sorted(current['projects'].items()):
+        for key in ('wall', 'critical_path'):
+            regressions += check(project + ' ' + key.replace('_', ' '), stats.get(key),
+                                 [r['projects'][project][key] for _, _, r in previous
+                                  if key in r['projects'].get(project, {})])
+    return [r + ' [' + versions + ']' for r in regressions]
+
+def track_build(history_name : str, image_name : str, variant : str, config : Dict,
+                total : float) -> List[str]:
+    """Analyse the ninja logs of a new image, compare the build times with the previous
+    releases and store them in the history. Used by build.py after each build.
+
+    :param history_name: path of the history
+    :type history_name: str
+    :param image_name: path of the image
+    :type image_name: str
+    :param variant: name of the container variant, e.g. the library name
+    :type variant: str
+    :param config: Json config with number of compile and linker threads
+    :type config: Dict
+    :param total: runtime of the container build in seconds
+    :type total: float
+    :returns: description of each regression
+    :rtype: List[str]
+
+    """
+    current = {'date' : time.strftime('%Y-%m-%d %H:%M:%S'),
+               'compile_threads' : config['compile_threads'],
+               'linker_threads' : config['linker_threads'],
+               'total' : round(total, 1),
+               'projects' : collect(image_name)}
+    version = rc.get_version()
+
+    print_report(current['projects'])
+    regressions = find_regressions(load_history(history_name), variant, version, current)
+    print_regressions(regressions)
+    record(history_name, variant, version, current)
+    return regressions
+
+def print_report(projects : Dict[str, Dict]):
+    for name, stats in sorted(projects.items()):
+        print(name + ':')
+        print('  steps:          ' + str(stats['steps']))
+        print('  wall time:      {0:.0f} s'.format(stats['wall']))
+        print('  sum of steps:   {0:.0f} s (average parallelism {1:.1f})'.format(
+            stats['work'], stats['parallelism']))
+        if 'critical_path' in stats:
+            print('  critical path:  {0:.0f} s ({1} steps)'.format(
+                stats['critical_path'], stats['critical_path_steps']))
+            print('  max speedup:    {0:.1f}'.format(stats['max_speedup']))
+        else:
+            print('  max speedup:    {0:.1f} (upper bound, no dependency graph)'.format(
+                stats['max_speedup']))
+        print('  slowest translation units:')
+        for output, seconds in stats['slowest']:
+            print('    {0:>8.1f} s  {1}'.format(seconds, output))
+
+def print_regressions(regressions : List[str]):
+    if not regressions:
+        print('no build time regressions')
+        return
+    print('build time regressions:')
+    for regression in regressions:
+        print('  ' + regression)
+
+if __name__ == '__main__':
+    main()
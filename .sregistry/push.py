@@ -1,28 +1,73 @@
 import sys, json, os
-import shutil, subprocess
+import argparse, shutil, subprocess, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import recipe as rc
 
 def main():
-    check_singularity()
+    parser = argparse.ArgumentParser(
+        description='Sign the containers and push them to the sregistry. Each unique image '
+        'is uploaded once, the additional tags are attached afterwards.')
+    parser.add_argument('config', type=str, nargs='?', default='',
+                        help='json config with the target cpus of the containers (optional)')
+    parser.add_argument('--registry', type=str, default='library://sehrig/default',
+                        help='library://<user>/<collection> or a local folder as stand-in for tests\n'
+                        '(default: library://sehrig/default)')
+    parser.add_argument('--version', type=str, default='',
+                        help='version tag, if not set, it is read from the container labels')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='number of containers, which are pushed concurrently, signing is sequential (default: 2)')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='number of attempts of each sign, push and tag command (default: 3)')
+    parser.add_argument('--no_sign', action='store_true',
+                        help='do not sign the containers, e.g. for tests with a local registry')
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help='do not ask for confirmation of the version')
+    args = parser.parse_args()
+
+    registry = get_registry(args.registry, args.retries)
+
+    if not args.no_sign or not args.version or isinstance(registry, LibraryRegistry):
+        check_singularity()
+
+    # the optional config contains the target cpus of the containers
+    cpu_targets = ['']
+    if args.config:
+        with open(args.config) as config_file:
+            cpu_targets = rc.get_cpu_targets(json.load(config_file)['build'])
 
     # extract the version from the container
-    container_version = get_container_version()
+    container_version = args.version if args.version else get_container_version(cpu_targets[0])
     if container_version is None:
         print('could not find container version in xeus-cling-cuda-container')
         exit(1)
 
-    answer = ''
+    answer = 'y' if args.yes else ''
     while answer not in ('y', 'n'):
         answer = input('is version ' + container_version + ' correct? [y/n] : ')
-        if answer == 'y':
-            login_sregistry()
-            sign_container(False)
-            sign_container(True)
-            push_container(container_version, False)
-            push_container('latest', False)
-            push_container(container_version, True)
-            push_container('latest', True)
-        if answer == 'n':
-            exit(1)
+    if answer == 'n':
+        exit(1)
+
+    registry.login()
+
+    variants = [rc.get_names(libcxx, cpu_target)
+                for cpu_target in cpu_targets for libcxx in (False, True)]
+    uploads = UploadIndex()
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [executor.submit(publish, registry, uploads, names, [container_version, 'latest'],
+                                   not args.no_sign, args.retries)
+                   for names in variants]
+        failed = False
+        for names, future in zip(variants, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print('could not publish ' + names['image'] + ': ' + str(e))
+                failed = True
+
+    if failed:
+        exit(1)
 
 def check_singularity():
     """Check if the singularity container software is available and runs 'singularity --version'
@@ -34,21 +79,24 @@ def check_singularity():
 
     process = subprocess.Popen(['singularity', '--version'], stdout=subprocess.PIPE)
     output, error = process.communicate()
-    if error is not None:
+    if process.returncode != 0:
         print('could not run "singularity --version"')
         exit(1)
 
     print(output.decode("utf-8"))
 
-def get_container_version():
+def get_container_version(cpu_target : str = ''):
     """Extract the version from the xeus-cling-cuda-container
 
+    :param cpu_target: target cpu of the container, empty for the portable container
+    :type cpu_target: str
+
     """
-    c_version = 'singularity inspect -d xeus-cling-cuda-container.sif'
+    c_version = 'singularity inspect -d ' + rc.get_names(False, cpu_target)['image']
     p_version = subprocess.Popen(c_version.split(), stdout=subprocess.PIPE)
     output, error = p_version.communicate()
 
-    if error is not None:
+    if p_version.returncode != 0:
         print('could not run: ' + c_version)
         exit(1)
 
@@ -60,57 +108,188 @@ def get_container_version():
 
     return None
 
-def login_sregistry():
-    """Login to the sregistry account
+def run_with_retry(command : List[str], retries : int = 3, delay : float = 5.0):
+    """Run a command. If it fails, it is repeated with an exponential backoff.
+
+    :param command: command and arguments
+    :type command: List[str]
+    :param retries: number of attempts
+    :type retries: int
+    :param delay: waiting time in seconds before the second attempt
+    :type delay: float
 
     """
-    # login to the remote server
-    c_login = 'singularity remote login --tokenfile ' + str(os.getenv("HOME")) + '/.singularity/sylabs-token'
-    p_login = subprocess.Popen(c_login.split())
-    output, error = p_login.communicate()
+    for attempt in range(1, retries + 1):
+        if subprocess.call(command) == 0:
+            return
+        if attempt < retries:
+            print('attempt ' + str(attempt) + ' of "' + ' '.join(command) + '" failed, retry in '
+                  + str(delay) + ' s')
+            time.sleep(delay)
+            delay *= 2
+    raise RuntimeError('could not run: ' + ' '.join(command))
 
-    if error is not None:
-        print('could not run: ' + c_login)
-        exit(1)
+class UploadIndex:
+    """Remembers, which image digest was uploaded under which reference. Shared by all push threads.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uploads : Dict[str, threading.Event] = {}
+        self._refs : Dict[str, str] = {}
+
+    def claim(self, digest : str) -> bool:
+        """Returns True, if the caller has to upload the image, otherwise waits until the
+        upload of the same image by another thread is finished and returns False.
+
+        """
+        with self._lock:
+            event = self._uploads.get(digest)
+            if event is None:
+                self._uploads[digest] = threading.Event()
+                return True
+        event.wait()
+        return False
+
+    def done(self, digest : str, ref : str):
+        with self._lock:
+            self._refs[digest] = ref
+            self._uploads[digest].set()
 
+    def failed(self, digest : str):
+        with self._lock:
+            # another thread can try it again
+            self._uploads.pop(digest).set()
 
-def sign_container(libcxx : bool):
-    """Sign the container with the private key
+    def get_ref(self, digest : str):
+        with self._lock:
+            return self._refs.get(digest)
 
-    :param libcxx: sign the libc++ container version
-    :type libcxx: bool
+class LibraryRegistry:
+    """Sylabs library, which is accessed with the singularity client.
 
     """
-    image_name = 'xeus-cling-cuda-container-cxx.sif' if libcxx else 'xeus-cling-cuda-container.sif'
-    c_sign = 'singularity sign ' + image_name
-    p_sign = subprocess.Popen(c_sign.split())
-    output, error = p_sign.communicate()
+    def __init__(self, url : str, retries : int = 3):
+        self.url = url.rstrip('/')
+        self.retries = retries
 
-    if error is not None:
-        print('could not run: ' + c_sign)
-        exit(1)
+    def login(self):
+        """Login to the sregistry account
+
+        """
+        run_with_retry(['singularity', 'remote', 'login', '--tokenfile',
+                        str(os.getenv("HOME")) + '/.singularity/sylabs-token'], self.retries)
 
+    def push(self, image_name : str, library_name : str, tag : str) -> str:
+        ref = self.url + '/' + library_name + ':' + tag
+        run_with_retry(['singularity', 'push', image_name, ref], self.retries)
+        return ref
 
-def push_container(version : str, libcxx : bool):
-    """upload the image
+    def tag(self, image_name : str, ref : str, library_name : str, tag : str):
+        # the singularity client has no command to tag an existing image. The
+        # library compares the hash of the image before the upload and only
+        # adds the tag, if the image already exists.
+        self.push(image_name, library_name, tag)
 
-    :param version: is used for the tag
-    :type version: str
-    :param libcxx: push the libc++ container version
-    :type libcxx: bool
+class LocalRegistry:
+    """Folder as stand-in for the library, e.g. for tests. Images are stored by digest in
+    <folder>/blobs and tags are files in <folder>/tags/<library_name>/<tag>, which contain
+    the digest.
 
     """
-    image_name = 'xeus-cling-cuda-container-cxx.sif' if libcxx else 'xeus-cling-cuda-container.sif'
-    library_name = 'xeus-cling-cuda-cxx:' if libcxx else 'xeus-cling-cuda:'
+    def __init__(self, path : str):
+        self.path = path
+        # number of uploaded images, to check the deduplication
+        self.uploads = 0
 
-    # upload the container
-    c_push = 'singularity push ' + image_name + ' library://sehrig/default/' + library_name + version
-    p_push = subprocess.Popen(c_push.split())
-    output, error = p_push.communicate()
+    def login(self):
+        os.makedirs(os.path.join(self.path, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(self.path, 'tags'), exist_ok=True)
 
-    if error is not None:
-        print('could not run: ' + c_push)
-        exit(1)
+    def push(self, image_name : str, library_name : str, tag : str) -> str:
+        digest = rc.get_digest(image_name)
+        blob = os.path.join(self.path, 'blobs', digest + '.sif')
+        if not os.path.exists(blob):
+            shutil.copyfile(image_name, blob + '.part')
+            os.replace(blob + '.part', blob)
+            self.uploads += 1
+        self._write_tag(library_name, tag, digest)
+        return library_name + ':' + tag
+
+    def tag(self, image_name : str, ref : str, library_name : str, tag : str):
+        self._write_tag(library_name, tag, rc.get_digest(image_name))
+
+    def _write_tag(self, library_name : str, tag : str, digest : str):
+        tag_dir = os.path.join(self.path, 'tags', library_name)
+        os.makedirs(tag_dir, exist_ok=True)
+        with open(os.path.join(tag_dir, tag), 'w') as tag_file:
+            tag_file.write(digest + '\n')
+
+def get_registry(url : str, retries : int = 3):
+    """Returns the registry for library:// urls, otherwise a local folder registry.
+
+    """
+    if url.startswith('library://'):
+        return LibraryRegistry(url, retries)
+    return LocalRegistry(url)
+
+# singularity sign asks for the passphrase of the key on the terminal, therefore
+# the images are signed one after another
+sign_lock = threading.Lock()
+
+def publish(registry, uploads : UploadIndex, names : Dict[str, str], tags : List[str],
+            sign : bool = True, retries : int = 3, index_name : str = rc.default_index_name):
+    """Sign an image, upload it once under the first tag and attach the other tags. Only
+    one image is signed at the same time, the uploads run concurrently.
+
+    :param registry: LibraryRegistry or LocalRegistry
+    :param uploads: digests of the images, which are already uploaded in this run
+    :type uploads: UploadIndex
+    :param names: names of the container variant (see recipe.get_names())
+    :type names: Dict[str, str]
+    :param tags: tags of the image, e.g. version and latest
+    :type tags: List[str]
+    :param sign: sign the image with the private key before the upload
+    :type sign: bool
+    :param retries: number of attempts of the sign command
+    :type retries: int
+    :param index_name: image index of build.py, which is updated after signing
+    :type index_name: str
+
+    """
+    image_name = names['image']
+    library_name = names['library']
+
+    # signing changes the image, therefore the digest is computed afterwards
+    if sign:
+        unsigned_digest = rc.get_digest(image_name)
+        with sign_lock:
+            run_with_retry(['singularity', 'sign', image_name], retries)
+    digest = rc.get_digest(image_name)
+    if sign:
+        # the image index of build.py should still reuse the signed image
+        rc.update_index_digest(index_name, image_name, unsigned_digest, digest)
+    print(image_name + ': sha256 ' + digest)
+
+    if uploads.claim(digest):
+        try:
+            ref = registry.push(image_name, library_name, tags[0])
+        except Exception:
+            uploads.failed(digest)
+            raise
+        uploads.done(digest, ref)
+        print(image_name + ': uploaded as ' + ref)
+        remaining_tags = tags[1:]
+    else:
+        # an identical image is already uploaded
+        remaining_tags = tags
+    ref = uploads.get_ref(digest)
+    if ref is None:
+        raise RuntimeError('upload of an identical image failed')
+
+    for tag in remaining_tags:
+        registry.tag(image_name, ref, library_name, tag)
+        print(image_name + ': tagged ' + library_name + ':' + tag)
 
 if __name__ == '__main__':
     main()
@@ -1,10 +1,20 @@
-import json, sys, os
-import shutil, subprocess
-from typing import Dict
+import json, sys, os, re
+import shutil, subprocess, hashlib, threading, urllib.request
+from typing import Dict, List
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import xcc.generator as gn
 
+# index of the built images: recipe hash -> image (see build.py)
+default_index_name = 'image_index.json'
+# the push threads update the index concurrently
+_index_lock = threading.Lock()
+# folder in the images, which contains the ninja logs for the build time
+# analysis (see ninja_stats.py)
+ninja_log_path = '/usr/local/share/xcc/ninja_logs'
+# sha256 of the downloaded installers, each url is only downloaded once per run
+_installer_digests : Dict[str, str] = {}
+
 
 def main():
     if len(sys.argv) < 2:
@@ -15,37 +25,228 @@ def main():
         config_file.close()
 
     print('compile threads: ' + str(config['compile_threads']) + '\n'
-          'linker threads: ' + str(config['linker_threads']))
+          'linker threads: ' + str(config['linker_threads']) + '\n'
+          'cpu targets: ' + ', '.join([t if t else 'generic' for t in get_cpu_targets(config)]))
 
-    create(config, True)
-    create(config, False)
+    for cpu_target in get_cpu_targets(config):
+        create(config, True, cpu_target)
+        create(config, False, cpu_target)
 
-def create(config : Dict, libcxx : bool):
-    """Generate the singularity recipe.
+def get_cpu_targets(config : Dict) -> List[str]:
+    """Returns the target cpus of the containers. The optional entry cpu_targets of the
+    json config contains a list of x86-64 microarchitecture levels or -march values,
+    the empty string is the portable container (e.g. ["", "x86-64-v3"]).
 
-    :param config: Json config with number of compile and linker threads
+    :param config: Json config
     :type config: Dict
-    :param libcxx: build the container with libc++
+    :returns: list of target cpus, [''] if the config does not contain cpu_targets
+    :rtype: List[str]
+
+    """
+    return config.get('cpu_targets', [''])
+
+def get_names(libcxx : bool, cpu_target : str = '') -> Dict[str, str]:
+    """Returns the file names of the recipe, image and build log and the library
+    name in the registry of a container variant. The names of the portable
+    containers have no cpu target suffix.
+
+    :param libcxx: container with libc++
     :type libcxx: bool
+    :param cpu_target: target cpu, empty for the portable container
+    :type cpu_target: str
+    :returns: dictionary with the keys recipe, image, log and library
+    :rtype: Dict[str, str]
 
     """
+    target_suffix = '-' + cpu_target if cpu_target else ''
     if libcxx:
-        recipe_name = 'recipe_libcxx.def'
-        image_name = 'xeus-cling-cuda-container-cxx.sif'
-        log_name = 'build_libcxx.log'
+        return {'recipe' : 'recipe_libcxx' + target_suffix + '.def',
+                'image' : 'xeus-cling-cuda-container-cxx' + target_suffix + '.sif',
+                'log' : 'build_libcxx' + target_suffix + '.log',
+                'library' : 'xeus-cling-cuda-cxx' + target_suffix}
     else:
-        recipe_name = 'recipe.def'
-        image_name = 'xeus-cling-cuda-container.sif'
-        log_name = 'build.log'
+        return {'recipe' : 'recipe' + target_suffix + '.def',
+                'image' : 'xeus-cling-cuda-container' + target_suffix + '.sif',
+                'log' : 'build' + target_suffix + '.log',
+                'library' : 'xeus-cling-cuda' + target_suffix}
+
+def gen_recipe(config : Dict, libcxx : bool, cpu_target : str = '') -> str:
+    """Generate the singularity recipe.
+
+    :param config: Json config with number of compile and linker threads
+    :type config: Dict
+    :param libcxx: build the container with libc++
+    :type libcxx: bool
+    :param cpu_target: target cpu, empty for the portable container
+    :type cpu_target: str
+    :returns: recipe
+    :rtype: str
 
-    # generate recipe
+    """
     xcc_gen = gn.XCC_gen(build_prefix='/opt',
                          threads=config['compile_threads'],
                          linker_threads=config['linker_threads'],
-                         build_libcxx=libcxx)
+                         build_libcxx=libcxx,
+                         cpu_target=cpu_target,
+                         ninja_log_path=ninja_log_path)
+    return xcc_gen.gen_release_single_stage().__str__()
+
+def get_version() -> str:
+    """Returns the version of the generated containers.
+
+    :returns: version
+    :rtype: str
+
+    """
+    return gn.XCC_gen().config.version
+
+def get_moving_inputs(recipe : str) -> List[str]:
+    """Returns the current revisions of the sources of the recipe, which are not pinned
+    to a commit: the commit of each git branch or tag (git ls-remote) and the sha256 of
+    each installer script (e.g. Miniconda3-latest). The unversioned conda packages are
+    not resolved.
+
+    :param recipe: singularity recipe
+    :type recipe: str
+    :returns: list of source and revision
+    :rtype: List[str]
+
+    """
+    inputs = []
+    for ref, url in sorted(set(re.findall(r'git clone --depth=1 --branch (\S+) (\S+)', recipe))):
+        output = subprocess.check_output(['git', 'ls-remote', url, ref]).decode('utf-8')
+        # the name can match a branch and a tag
+        revisions = sorted(line.split()[0] for line in output.split('\n') if line.strip())
+        if not revisions:
+            raise RuntimeError('could not resolve ' + ref + ' of ' + url)
+        inputs.append(url + ' ' + ref + ' ' + ','.join(revisions))
+
+    for url in sorted(set(re.findall(r'wget (\S+\.sh)\b', recipe))):
+        if url not in _installer_digests:
+            sha = hashlib.sha256()
+            with urllib.request.urlopen(url) as response:
+                for block in iter(lambda: response.read(1024 * 1024), b''):
+                    sha.update(block)
+            _installer_digests[url] = sha.hexdigest()
+        inputs.append(url + ' ' + _installer_digests[url])
+    return inputs
+
+def get_recipe_hash(config : Dict, libcxx : bool, cpu_target : str = '',
+                    inputs : List[str] = [], resolve : bool = True) -> str:
+    """Returns a hash, which identifies the content of the container. The recipe is
+    normalized: the number of compile and linker threads does not change the content,
+    therefore the recipe is generated with one thread, and empty lines and trailing
+    whitespace are removed. The current revisions of the git branches and installer
+    scripts of the recipe are part of the hash (see get_moving_inputs()).
+
+    :param config: Json config with number of compile and linker threads
+    :type config: Dict
+    :param libcxx: build the container with libc++
+    :type libcxx: bool
+    :param cpu_target: target cpu, empty for the portable container
+    :type cpu_target: str
+    :param inputs: additional pinned inputs, which are not part of the recipe, e.g. the singularity version
+    :type inputs: List[str]
+    :param resolve: resolve the revisions of the moving sources, requires network access
+    :type resolve: bool
+    :returns: sha256 hex digest
+    :rtype: str
+
+    """
+    normalized_config = dict(config)
+    normalized_config['compile_threads'] = 1
+    normalized_config['linker_threads'] = 1
+    recipe = gen_recipe(normalized_config, libcxx, cpu_target)
+    lines = [line.rstrip() for line in recipe.split('\n') if line.strip()]
+    if resolve:
+        inputs = inputs + get_moving_inputs(recipe)
+
+    sha = hashlib.sha256()
+    for part in lines + ['#inputs'] + inputs:
+        sha.update(part.encode('utf-8') + b'\n')
+    return sha.hexdigest()
+
+def create(config : Dict, libcxx : bool, cpu_target : str = ''):
+    """Generate the singularity recipe and write it to the recipe file of the variant.
+
+    :param config: Json config with number of compile and linker threads
+    :type config: Dict
+    :param libcxx: build the container with libc++
+    :type libcxx: bool
+    :param cpu_target: target cpu, empty for the portable container
+    :type cpu_target: str
+
+    """
+    recipe_name = get_names(libcxx, cpu_target)['recipe']
+
     with open(recipe_name, 'w') as recipe_file:
-        recipe_file.write(xcc_gen.gen_release_single_stage().__str__())
+        recipe_file.write(gen_recipe(config, libcxx, cpu_target))
         recipe_file.close()
 
+def get_digest(image_name : str) -> str:
+    """Returns the sha256 digest of an image.
+
+    :param image_name: path of the image
+    :type image_name: str
+    :returns: hex digest
+    :rtype: str
+
+    """
+    sha = hashlib.sha256()
+    with open(image_name, 'rb') as image:
+        for block in iter(lambda: image.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def load_index(index_name : str) -> Dict[str, Dict[str, str]]:
+    """Load the image index. Returns an empty index, if the file does not exist.
+
+    :param index_name: path of the index
+    :type index_name: str
+    :returns: dictionary of recipe hash and image entry (image path, sha256 of the image, build date)
+    :rtype: Dict[str, Dict[str, str]]
+
+    """
+    if not os.path.exists(index_name):
+        return {}
+    with open(index_name) as index_file:
+        return json.load(index_file)
+
+def save_index(index_name : str, index : Dict[str, Dict[str, str]]):
+    """Write the image index atomically.
+
+    :param index_name: path of the index
+    :type index_name: str
+    :param index: image index
+    :type index: Dict[str, Dict[str, str]]
+
+    """
+    with open(index_name + '.tmp', 'w') as index_file:
+        json.dump(index, index_file, indent=2, sort_keys=True)
+    os.replace(index_name + '.tmp', index_name)
+
+def update_index_digest(index_name : str, image_name : str, old_digest : str, new_digest : str):
+    """Update the digest of an image in the index, e.g. after signing the image.
+
+    :param index_name: path of the index
+    :type index_name: str
+    :param image_name: path of the image
+    :type image_name: str
+    :param old_digest: digest of the image in the index
+    :type old_digest: str
+    :param new_digest: new digest of the image
+    :type new_digest: str
+
+    """
+    with _index_lock:
+        index = load_index(index_name)
+        changed = False
+        for entry in index.values():
+            if entry['image'] == os.path.abspath(image_name) and entry['sha256'] == old_digest:
+                entry['sha256'] = new_digest
+                changed = True
+        if changed:
+            save_index(index_name, index)
+
 if __name__ == '__main__':
     main()
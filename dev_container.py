@@ -11,6 +11,7 @@ import argparse
 import sys
 import os
 import xcc.generator as gn
+import xcc.planner as pl
 
 
 def main():
@@ -47,6 +48,45 @@ def main():
                         help='Set prefix folder of Miniconda, Cling and Xeus-Cling. Default: $(pwd)/build')
     parser.add_argument('--keep_build', action='store_true',
                         help='keep source and build files after installation\n')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the source and build folders of a previous build in --build_prefix.\n'
+                        'Existing checkouts are updated and only changed files are rebuilt. If the configure\n'
+                        'options of a project changed, its build folder is removed. Implies --keep_build.')
+    parser.add_argument('--full_build', action='store_true',
+                        help='Build the projects with tests, documentation, benchmarks and examples.\n'
+                        'By default, they are disabled to save build time and disk space.')
+    parser.add_argument('--kernel_cull_idle_timeout', type=int, default=0,
+                        help='Shut down kernels, which are idle for the given number of seconds (default: 0, disabled).')
+    parser.add_argument('--kernel_memory_limit', type=float, default=0,
+                        help='Memory limit of each kernel in GB (default: 0, disabled). Uses a cgroup via systemd-run\n'
+                        'if available, otherwise ulimit. Can be changed at runtime with XCC_KERNEL_MEMORY_LIMIT_KB.')
+    parser.add_argument('--kernel_max_count', type=int, default=0,
+                        help='Maximum number of running kernels per jupyter server (default: 0, no limit).')
+    parser.add_argument('--cling_modules', action='store_true',
+                        help='Prebuild a C++ module of the standard library for each C++ standard at build time.\n'
+                        'The kernels import the module at startup instead of parsing the headers.')
+    parser.add_argument('--cpu_target', type=str, default='',
+                        help='Target cpu of all C/C++ builds and the kernels: a x86-64 microarchitecture level\n'
+                        '(x86-64-v2, x86-64-v3, x86-64-v4) or a -march value (e.g. skylake-avx512).\n'
+                        'The image only runs on cpus, which support the target (default: generic x86-64).')
+    parser.add_argument('--kernel_allocator', type=str, default='glibc',
+                        choices=['glibc', 'jemalloc', 'mimalloc'],
+                        help='Memory allocator of the kernels. jemalloc and mimalloc are installed from conda-forge\n'
+                        'and preloaded in the kernels (default: glibc).')
+    parser.add_argument('--kernel_malloc_arena_max', type=int, default=0,
+                        help='Maximum number of malloc arenas of the kernels. Sets MALLOC_ARENA_MAX, which is\n'
+                        'also the fallback for glibc, and narenas for jemalloc (default: 0, allocator default).')
+    parser.add_argument('--kernel_malloc_decay_ms', type=int, default=-1,
+                        help='Time in ms, after which jemalloc and mimalloc return unused memory to the system\n'
+                        '(default: -1, allocator default).')
+    parser.add_argument('--no_rpath', action='store_true',
+                        help='Extend LD_LIBRARY_PATH with the CUDA libraries and do not set relative RPATHs.\n'
+                        'By default, the CUDA libraries are registered with ldconfig and the projects are\n'
+                        'built with relative RPATHs.')
+
+    parser.add_argument('--no_prefetch', action='store_true',
+                        help='Download the sources in the build step of each project. By default, all sources are\n'
+                        'downloaded concurrently in a single step before the first build starts.')
     parser.add_argument('--help_build_prefix', action='store_true',
                         help='get information about build process')
     parser.add_argument('--clang_version', type=int, default=8,
@@ -64,6 +104,50 @@ def main():
     parser.add_argument('--build_libcxx', action='store_true',
                         help='Set the flag to build the whole stack with libc++. '
                         'Also add the libc++ and libc++abi projects to the llvm build.')
+    parser.add_argument('--cuda_cache_path', type=str, default='',
+                        help='Set CUDA_CACHE_PATH in the CUDA jupyter kernels to store the PTX JIT cache persistent\n'
+                        'outside the read-only container. ${HOME} is expanded at kernel start.\n'
+                        'For example: \'${HOME}/.cache/xeus-cling-cuda/ComputeCache\' (default: not set)')
+    parser.add_argument('--cuda_cache_maxsize', type=int, default=0,
+                        help='Set CUDA_CACHE_MAXSIZE in bytes for the CUDA jupyter kernels.\n'
+                        'Requires --cuda_cache_path (default: driver default)')
+    parser.add_argument('--cuda_cache_warmup', action='store_true',
+                        help='Install the script xcc-warm-cuda-cache, which populates the CUDA cache\n'
+                        'with sample kernels. Run it once on the target system. Requires --cuda_cache_path')
+
+    parser.add_argument('--linker', type=str, default='gold',
+                        choices=['gold', 'lld', 'default'],
+                        help='linker of all projects, lld is installed from the clang toolchain (default: gold)')
+    parser.add_argument('--project_storage', type=str, default='host',
+                        choices=['host', 'overlay', 'scratch'],
+                        help='Storage of the sources and build trees of the runscript (default: host)\n'
+                        'host: --project_path on the host system\n'
+                        'overlay: singularity overlay image (ext3), which is mounted at ' + gn.overlay_project_path + '\n'
+                        '         with -o, a script <recipe>_overlay.sh is created beside the recipe,\n'
+                        '         which creates the image and runs the runscript\n'
+                        'scratch: node-local --scratch_path, the projects are installed in --project_path')
+    parser.add_argument('--overlay_size', type=int, default=100000,
+                        help='size of the overlay image in MB (default: 100000)')
+    parser.add_argument('--scratch_path', type=str, default='/tmp/$USER/xcc_build',
+                        help='build folder of --project_storage scratch, evaluated at runtime (default: /tmp/$USER/xcc_build)')
+    parser.add_argument('--code_index', action='store_true',
+                        help='The runscript merges the compile databases of all cling and xeus-cling builds to\n'
+                        '<project_path>/compile_commands.json and builds a clangd index <project_path>/clangd.dex once.\n'
+                        'The container builds clangd-indexer from the llvm release of the clangd package.\n'
+                        'Use <project_path>/xcc-clangd as clangd executable in the editor.')
+    parser.add_argument('--tmpfs_size', type=float, default=0,
+                        help='Size of the tmpfs in GB, which can be used for builds (default: 0, no tmpfs).\n'
+                        'Projects, whose estimated size fits, are built in --tmpfs_path and removed after\n'
+                        'the installation. The other projects are built in --build_prefix.\n'
+                        'If the tmpfs has not enough free memory at build time, the project is built on disk.')
+    parser.add_argument('--tmpfs_path', type=str, default='/dev/shm/xcc_build',
+                        help='build folder in the tmpfs (default: /dev/shm/xcc_build)\n'
+                        'for docker, set the size of /dev/shm with docker build --shm-size')
+    parser.add_argument('--plan', action='store_true',
+                        help='Estimate peak memory, disk usage and build time of each project for the\n'
+                        'given settings, compare them with the resources of the host and exit.')
+    parser.add_argument('--plan_costs', type=str, default='',
+                        help='json file with costs of past builds, which refines the built-in cost table of --plan')
 
     args = parser.parse_args()
 
@@ -78,7 +162,10 @@ def main():
         sys.exit()
 
     if args.run_command:
-        print('singularity exec --nv -B /run/user/$(id -u):/run/user/$(id -u) <receipt>.sif jupyter-lab')
+        if args.project_storage == 'overlay':
+            print('singularity exec --nv --overlay <overlay>.img:ro -B /run/user/$(id -u):/run/user/$(id -u) <receipt>.sif jupyter-lab')
+        else:
+            print('singularity exec --nv -B /run/user/$(id -u):/run/user/$(id -u) <receipt>.sif jupyter-lab')
         sys.exit()
 
     ##################################################################
@@ -91,6 +178,8 @@ def main():
         print('        you should delete the source and build folders after building the container.')
         print('        If you you want to keep the build inside the container, you should choose an unbound')
         print('        path. For example /opt')
+        print('        With --incremental, the kept source and build folders of a previous build are reused')
+        print('        and only changed files are rebuilt.')
         sys.exit()
 
     # parse number of build threads
@@ -126,12 +215,30 @@ def main():
                          build_prefix=build_prefix,
                          install_prefix='/usr/local',
                          build_type=args.b,
-                         keep_build=args.keep_build,
+                         keep_build=args.keep_build or args.incremental,
                          threads=threads,
                          linker_threads=linker_threads,
                          clang_version=args.clang_version,
                          gen_args=gen_args,
-                         build_libcxx=args.build_libcxx)
+                         build_libcxx=args.build_libcxx,
+                         cuda_cache_path=args.cuda_cache_path,
+                         cuda_cache_maxsize=args.cuda_cache_maxsize,
+                         linker=args.linker,
+                         tmpfs_size=args.tmpfs_size,
+                         tmpfs_path=args.tmpfs_path,
+                         kernel_cull_idle_timeout=args.kernel_cull_idle_timeout,
+                         kernel_memory_limit=args.kernel_memory_limit,
+                         kernel_max_count=args.kernel_max_count,
+                         cling_modules=args.cling_modules,
+                         cpu_target=args.cpu_target,
+                         kernel_allocator=args.kernel_allocator,
+                         kernel_malloc_arena_max=args.kernel_malloc_arena_max,
+                         kernel_malloc_decay_ms=args.kernel_malloc_decay_ms,
+                         incremental=args.incremental,
+                         slim_build=not args.full_build,
+                         cuda_cache_warmup=args.cuda_cache_warmup,
+                         prefetch=not args.no_prefetch,
+                         rpath=not args.no_rpath)
 
     if args.cling_url:
         if args.cling_branch is not None and args.cling_hash is not None:
@@ -142,8 +249,31 @@ def main():
             xcc_gen.cling_branch = args.cling_branch
             xcc_gen.cling_hash = args.cling_hash
 
+    if args.plan:
+        # cling and xeus-cling are built by the runscript in the project path
+        plan_config = xcc_gen.config.get_copy()
+        plan_config.second_build_type = args.second_build
+        print(pl.gen_plan_report(project_list=xcc_gen.project_list,
+                                 config=plan_config,
+                                 build_path=os.path.abspath(args.project_path),
+                                 cost_file=args.plan_costs,
+                                 runscript_projects=['miniconda3', 'jupyterlab', 'cling',
+                                                     'xeus-cling', 'jupyter_kernel']))
+        sys.exit()
+
     stage = xcc_gen.gen_devel_stage(project_path=os.path.abspath(args.project_path),
-                                    dual_build_type = (None if args.second_build == '' else args.second_build))
+                                    dual_build_type = (None if args.second_build == '' else args.second_build),
+                                    project_storage=args.project_storage,
+                                    scratch_path=args.scratch_path,
+                                    code_index=args.code_index)
+
+    if args.project_storage == 'overlay' and args.out:
+        recipe_base = os.path.dirname(os.path.abspath(args.out)) + '/' + \
+            os.path.splitext(os.path.basename(args.out))[0]
+        with open(recipe_base + '_overlay.sh', 'w') as filehandle:
+            filehandle.write(xcc_gen.gen_overlay_script(overlay_image=recipe_base + '_overlay.img',
+                                                        overlay_size=args.overlay_size,
+                                                        container_image=recipe_base + '.sif'))
 
     ##################################################################
     # write to file or stdout
@@ -0,0 +1,101 @@
+"""Script to execute the build steps of the xeus-cling-cuda release
+   recipe or the build steps and the runscript of the dev recipe in a
+   sandbox against tiny fake projects
+
+   run `python harness_container.py --help` to get the harness options
+
+   the script requires hpccm (https://github.com/NVIDIA/hpc-container-maker)
+   and sh, git, cmake, make, tar and wget on the host
+
+   the script is designed to be executed standalone
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import xcc.generator as gn
+import xcc.harness as hn
+
+
+def main():
+    ##################################################################
+    # parse args
+    ##################################################################
+    parser = argparse.ArgumentParser(
+        description='Execute the build steps of the release recipe in a sandbox. The git repositories, '
+        'tarballs and installers are replaced by tiny fake projects, which are served from local bare '
+        'git repositories and a local http server. The harness checks the install layout, the cleanup '
+        'and prints the runtime of each step.',
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sandbox', type=str, default='',
+                        help='empty folder for the fake projects, the build and the installation\n'
+                        '(default: new temporary folder, which is removed if the check succeeds)')
+    parser.add_argument('--keep_build', action='store_true',
+                        help='generate the recipe with --keep_build')
+    parser.add_argument('--incremental', action='store_true',
+                        help='generate the recipe with --incremental and execute the steps twice')
+    parser.add_argument('--build_libcxx', action='store_true',
+                        help='generate the recipe with --build_libcxx')
+    parser.add_argument('--no_miniconda_cleanup', action='store_true',
+                        help='generate the recipe with --no_miniconda_cleanup')
+    parser.add_argument('--dev', action='store_true',
+                        help='execute the build steps and the runscript of the dev recipe with --code_index\n'
+                        'instead of the release recipe, the projects of the runscript are installed in\n'
+                        '<sandbox>/project')
+    parser.add_argument('--second_build', type=str, default='DEBUG',
+                        help='second build type of cling and xeus-cling in the runscript of the dev\n'
+                        'recipe, empty for a single build (default: DEBUG)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='maximum runtime of the steps in seconds (default: 120)')
+    parser.add_argument('--max_time', type=float, default=0,
+                        help='fail, if the whole check takes longer than the given seconds (default: 0, no limit)')
+
+    args = parser.parse_args()
+
+    sandbox = args.sandbox if args.sandbox else tempfile.mkdtemp(prefix='xcc-harness-')
+    sandbox = os.path.abspath(sandbox)
+
+    xcc_gen = gn.XCC_gen(build_prefix=sandbox + '/build',
+                         install_prefix=sandbox + '/install',
+                         keep_build=args.keep_build or args.incremental,
+                         incremental=args.incremental,
+                         build_libcxx=args.build_libcxx,
+                         miniconda_cleanup=not args.no_miniconda_cleanup)
+
+    start = time.monotonic()
+    try:
+        results = hn.run_harness(xcc_gen, sandbox,
+                                 runs=2 if args.incremental else 1,
+                                 timeout=args.timeout,
+                                 project_path=sandbox + '/project' if args.dev else '',
+                                 dual_build_type=args.second_build if args.dev else '',
+                                 code_index=args.dev)
+    except hn.HarnessError as e:
+        print('harness failed: ' + str(e))
+        print('sandbox: ' + sandbox)
+        sys.exit(1)
+    total = time.monotonic() - start
+
+    ##################################################################
+    # print the runtime of the steps
+    ##################################################################
+    for run, timings in enumerate(results):
+        print('\nrun ' + str(run + 1) + ':')
+        for name, seconds in timings:
+            print('{0:>8.2f} s  {1}'.format(seconds, name))
+        print('{0:>8.2f} s  total'.format(sum(s for _, s in timings)))
+    print('\ngenerate and execute: {0:.2f} s'.format(total))
+
+    if not args.sandbox:
+        shutil.rmtree(sandbox)
+
+    if args.max_time and total > args.max_time:
+        print('the check took longer than ' + str(args.max_time) + ' s')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
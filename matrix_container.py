@@ -0,0 +1,88 @@
+"""Script to generate a matrix of Docker and Singularity
+   xeus-cling-cuda container recipes in one call
+
+   run `python matrix_container.py --help` to get generation options
+
+   the script requires hpccm (https://github.com/NVIDIA/hpc-container-maker)
+
+   the script is designed to be executed standalone
+"""
+
+import argparse
+import xcc.matrix as mx
+
+
+def main():
+    ##################################################################
+    # parse args
+    ##################################################################
+    parser = argparse.ArgumentParser(
+        description='Script to generate a matrix of recipes for xeus-cling-cuda. '
+        'The recipes and a manifest.json are written to the output folder.',
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-o', '--out', type=str, required=True,
+                        help='output folder of the recipes and the manifest')
+    parser.add_argument('--container', type=str, nargs='+', default=['singularity'],
+                        choices=['docker', 'singularity'],
+                        help='container formats (default: singularity)\n'
+                        'the dev container only supports singularity')
+    parser.add_argument('--kind', type=str, nargs='+', default=['rel', 'dev'],
+                        choices=['rel', 'dev'],
+                        help='release and/or development recipes (default: rel dev)')
+    parser.add_argument('--clang_version', type=int, nargs='+', default=[8, 9],
+                        choices=[8, 9],
+                        help='versions of the clang project compiler (default: 8 9)')
+    parser.add_argument('--libcxx', type=str, nargs='+', default=['off', 'on'],
+                        choices=['off', 'on'],
+                        help='build the whole stack with libstdc++ (off) and/or libc++ (on) (default: off on)')
+    parser.add_argument('-b', type=str, nargs='+', default=['RELEASE'],
+                        choices=['DEBUG', 'RELEASE',
+                                 'RELWITHDEBINFO', 'MINSIZEREL'],
+                        help='set the CMAKE_BUILD_TYPEs (default: RELEASE)')
+    parser.add_argument('--cpu_target', type=str, nargs='+', default=['generic'],
+                        help='target cpus of the recipes: generic for portable recipes, a x86-64\n'
+                        'microarchitecture level (x86-64-v2, x86-64-v3, x86-64-v4) or a -march value\n'
+                        '(default: generic)')
+    parser.add_argument('--project_path', type=str, default='/tmp/xcc_project',
+                        help='project path of the dev recipes (default: /tmp/xcc_project)')
+    parser.add_argument(
+        '-j', type=str, help='number of build threads for make (default: -j)')
+    parser.add_argument(
+        '-l', type=str, help='number of linker threads for the cling build (default: -j)')
+
+    args = parser.parse_args()
+
+    # parse number of build threads
+    # if no threads are set, it is set to None which means it is executed with -j
+    if args.j:
+        threads = int(args.j)
+        if threads < 1:
+            raise ValueError('-j have to be greater than 0')
+    else:
+        threads = None
+
+    if args.l:
+        linker_threads = int(args.l)
+        if linker_threads < 1:
+            raise ValueError('-l have to be greater than 0')
+    else:
+        linker_threads = None
+
+    manifest = mx.gen_recipe_matrix(out_dir=args.out,
+                                    containers=args.container,
+                                    clang_versions=args.clang_version,
+                                    build_libcxx=[l == 'on' for l in args.libcxx],
+                                    build_types=args.b,
+                                    kinds=args.kind,
+                                    project_path=args.project_path,
+                                    threads=threads,
+                                    linker_threads=linker_threads,
+                                    cpu_targets=['' if t == 'generic' else t
+                                                 for t in args.cpu_target])
+
+    for entry in manifest:
+        print(entry['sha256'][:12] + '  ' + entry['file'])
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ import json
 import sys
 import os
 import xcc.generator as gn
+import xcc.planner as pl
 
 
 def main():
@@ -46,6 +47,46 @@ def main():
                         help='keep source and build files after installation\n'
                         'only for singularity supported, because it can store builds in the host memory\n'
                         'for docker, it is not useful, because the multi-stage build')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the source and build folders of a previous build in --build_prefix.\n'
+                        'Existing checkouts are updated and only changed files are rebuilt. If the configure\n'
+                        'options of a project changed, its build folder is removed. Implies --keep_build.')
+    parser.add_argument('--full_build', action='store_true',
+                        help='Build the projects with tests, documentation, benchmarks and examples.\n'
+                        'By default, they are disabled to save build time and disk space.')
+    parser.add_argument('--conda_projects', type=str, nargs='*', default=[],
+                        choices=['libzmq', 'cppzmq', 'nlohmann_json', 'xtl', 'xeus',
+                                 'pugixml', 'cxxopts', 'xproperty', 'xwidgets'],
+                        help='Install the projects as pinned, prebuilt conda-forge packages instead of\n'
+                        'building them from source. Not compatible with --build_libcxx.')
+    parser.add_argument('--kernel_pool_size', type=int, default=0,
+                        help='Number of prestarted xeus-cling kernels per kernelspec. The jupyter server\n'
+                        'hands them out on request and starts new ones in the background (default: 0, disabled).\n'
+                        'Set XCC_KERNEL_POOL=0 at runtime to disable the pool.')
+    parser.add_argument('--kernel_cull_idle_timeout', type=int, default=0,
+                        help='Shut down kernels, which are idle for the given number of seconds (default: 0, disabled).')
+    parser.add_argument('--kernel_memory_limit', type=float, default=0,
+                        help='Memory limit of each kernel in GB (default: 0, disabled). Uses a cgroup via systemd-run\n'
+                        'if available, otherwise ulimit. Can be changed at runtime with XCC_KERNEL_MEMORY_LIMIT_KB.')
+    parser.add_argument('--kernel_max_count', type=int, default=0,
+                        help='Maximum number of running kernels per jupyter server (default: 0, no limit).')
+    parser.add_argument('--cling_modules', action='store_true',
+                        help='Prebuild a C++ module of the standard library for each C++ standard at build time.\n'
+                        'The kernels import the module at startup instead of parsing the headers.')
+    parser.add_argument('--cpu_target', type=str, default='',
+                        help='Target cpu of all C/C++ builds and the kernels: a x86-64 microarchitecture level\n'
+                        '(x86-64-v2, x86-64-v3, x86-64-v4) or a -march value (e.g. skylake-avx512).\n'
+                        'The image only runs on cpus, which support the target (default: generic x86-64).')
+    parser.add_argument('--kernel_allocator', type=str, default='glibc',
+                        choices=['glibc', 'jemalloc', 'mimalloc'],
+                        help='Memory allocator of the kernels. jemalloc and mimalloc are installed from conda-forge\n'
+                        'and preloaded in the kernels (default: glibc).')
+    parser.add_argument('--kernel_malloc_arena_max', type=int, default=0,
+                        help='Maximum number of malloc arenas of the kernels. Sets MALLOC_ARENA_MAX, which is\n'
+                        'also the fallback for glibc, and narenas for jemalloc (default: 0, allocator default).')
+    parser.add_argument('--kernel_malloc_decay_ms', type=int, default=-1,
+                        help='Time in ms, after which jemalloc and mimalloc return unused memory to the system\n'
+                        '(default: -1, allocator default).')
     parser.add_argument('--help_build_prefix', action='store_true',
                         help='get information about build process')
     parser.add_argument('--clang_version', type=int, default=8,
@@ -63,6 +104,55 @@ def main():
     parser.add_argument('--build_libcxx', action='store_true',
                         help='Set the flag to build the whole stack with libc++. '
                         'Also add the libc++ and libc++abi projects to the llvm build.')
+    parser.add_argument('--cuda_cache_path', type=str, default='',
+                        help='Set CUDA_CACHE_PATH in the CUDA jupyter kernels to store the PTX JIT cache persistent\n'
+                        'outside the read-only container. ${HOME} is expanded at kernel start.\n'
+                        'For example: \'${HOME}/.cache/xeus-cling-cuda/ComputeCache\' (default: not set)')
+    parser.add_argument('--cuda_cache_maxsize', type=int, default=0,
+                        help='Set CUDA_CACHE_MAXSIZE in bytes for the CUDA jupyter kernels.\n'
+                        'Requires --cuda_cache_path (default: driver default)')
+    parser.add_argument('--cuda_cache_warmup', action='store_true',
+                        help='Install the script xcc-warm-cuda-cache, which populates the CUDA cache\n'
+                        'with sample kernels. Run it once on the target system. Requires --cuda_cache_path')
+
+    parser.add_argument('--bytecode_optimize', type=int, nargs='*', default=[0],
+                        choices=[0, 1, 2],
+                        help='Optimization levels of the python bytecode, which is compiled ahead of time for the\n'
+                        'read-only miniconda installation and the cling jupyter kernel.\n'
+                        'Set the flag without value to disable the compilation (default: 0)')
+
+    parser.add_argument('--no_miniconda_cleanup', action='store_true',
+                        help='Keep the conda package cache, nodejs, tests and static libraries in the miniconda installation.')
+
+    parser.add_argument('--ninja_log_path', type=str, default='',
+                        help='Store the ninja log and the dependency graph of the cling build in the given folder\n'
+                        'of the container, e.g. for the build time analysis of .sregistry/ninja_stats.py.')
+
+    parser.add_argument('--no_rpath', action='store_true',
+                        help='Extend LD_LIBRARY_PATH with the CUDA libraries and do not set relative RPATHs.\n'
+                        'By default, the library folders are registered with ldconfig and the libraries\n'
+                        'of the kernels are checked with ldd after the build.')
+
+    parser.add_argument('--no_prefetch', action='store_true',
+                        help='Download the sources in the build step of each project. By default, all sources are\n'
+                        'downloaded concurrently in a single step before the first build starts.')
+
+    parser.add_argument('--linker', type=str, default='gold',
+                        choices=['gold', 'lld', 'default'],
+                        help='linker of all projects, lld is installed from the clang toolchain (default: gold)')
+    parser.add_argument('--tmpfs_size', type=float, default=0,
+                        help='Size of the tmpfs in GB, which can be used for builds (default: 0, no tmpfs).\n'
+                        'Projects, whose estimated size fits, are built in --tmpfs_path and removed after\n'
+                        'the installation. The other projects are built in --build_prefix.\n'
+                        'If the tmpfs has not enough free memory at build time, the project is built on disk.')
+    parser.add_argument('--tmpfs_path', type=str, default='/dev/shm/xcc_build',
+                        help='build folder in the tmpfs (default: /dev/shm/xcc_build)\n'
+                        'for docker, set the size of /dev/shm with docker build --shm-size')
+    parser.add_argument('--plan', action='store_true',
+                        help='Estimate peak memory, disk usage and build time of each project for the\n'
+                        'given settings, compare them with the resources of the host and exit.')
+    parser.add_argument('--plan_costs', type=str, default='',
+                        help='json file with costs of past builds, which refines the built-in cost table of --plan')
 
     args = parser.parse_args()
 
@@ -99,6 +189,8 @@ def main():
         print('        you should delete the source and build folders after building the container.')
         print('        If you you want to keep the build inside the container, you should choose an unbound')
         print('        path. For example /opt')
+        print('        With --incremental, the kept source and build folders of a previous build are reused')
+        print('        and only changed files are rebuilt.')
         sys.exit()
 
     # parse number of build threads
@@ -132,12 +224,35 @@ def main():
 
     xcc_gen = gn.XCC_gen(container=args.container,
                          build_prefix=build_prefix,
-                         keep_build=args.keep_build,
+                         keep_build=args.keep_build or args.incremental,
                          threads=threads,
                          linker_threads=linker_threads,
                          clang_version=args.clang_version,
                          gen_args=gen_args,
-                         build_libcxx=args.build_libcxx)
+                         build_libcxx=args.build_libcxx,
+                         cuda_cache_path=args.cuda_cache_path,
+                         cuda_cache_maxsize=args.cuda_cache_maxsize,
+                         linker=args.linker,
+                         tmpfs_size=args.tmpfs_size,
+                         tmpfs_path=args.tmpfs_path,
+                         kernel_cull_idle_timeout=args.kernel_cull_idle_timeout,
+                         kernel_memory_limit=args.kernel_memory_limit,
+                         kernel_max_count=args.kernel_max_count,
+                         cling_modules=args.cling_modules,
+                         cpu_target=args.cpu_target,
+                         kernel_allocator=args.kernel_allocator,
+                         kernel_malloc_arena_max=args.kernel_malloc_arena_max,
+                         kernel_malloc_decay_ms=args.kernel_malloc_decay_ms,
+                         incremental=args.incremental,
+                         slim_build=not args.full_build,
+                         binary_projects=args.conda_projects,
+                         kernel_pool_size=args.kernel_pool_size,
+                         cuda_cache_warmup=args.cuda_cache_warmup,
+                         bytecode_optimize=args.bytecode_optimize,
+                         miniconda_cleanup=not args.no_miniconda_cleanup,
+                         prefetch=not args.no_prefetch,
+                         rpath=not args.no_rpath,
+                         ninja_log_path=args.ninja_log_path)
 
     if args.cling_url:
         if args.cling_branch is not None and args.cling_hash is not None:
@@ -148,6 +263,13 @@ def main():
             xcc_gen.cling_branch = args.cling_branch
             xcc_gen.cling_hash = args.cling_hash
 
+    if args.plan:
+        print(pl.gen_plan_report(project_list=xcc_gen.project_list,
+                                 config=xcc_gen.config,
+                                 build_path=build_prefix,
+                                 cost_file=args.plan_costs))
+        sys.exit()
+
     stage = xcc_gen.gen_release_single_stage()
 
     ##################################################################
@@ -33,22 +33,35 @@ def gen_base_stage(config: xcc.config.XCC_Config) -> hpccm.Stage:
     stage = hpccm.Stage()
     stage += baseimage(image="nvidia/cuda:8.0-devel-ubuntu16.04", _as="stage")
 
-    stage += label(
-        metadata={
-            "XCC Version": str(config.version),
-            "Author": config.author,
-            "E-Mail": config.email,
-        }
-    )
+    metadata = {
+        "XCC Version": str(config.version),
+        "Author": config.author,
+        "E-Mail": config.email,
+    }
+    # portable images have no cpu target label
+    if config.cpu_target:
+        metadata["XCC CPU Target"] = config.cpu_target
+    stage += label(metadata=metadata)
 
     if config.gen_args:
         stage += environment(variables={"XCC_GEN_ARGS": '"' + config.gen_args + '"'})
 
-    # LD_LIBRARY_PATH is not taken over correctly when the docker container
-    # is converted to a singularity container.
-    stage += environment(
-        variables={"LD_LIBRARY_PATH": "$LD_LIBRARY_PATH:/usr/local/cuda/lib64"}
-    )
+    if config.rpath:
+        # the cache of the dynamic linker is part of the image, therefore it
+        # also works after the conversion to a singularity container and it
+        # does not leak in the processes of the user
+        stage += shell(
+            commands=[
+                "echo /usr/local/cuda/lib64 > /etc/ld.so.conf.d/xcc-cuda.conf",
+                "ldconfig",
+            ]
+        )
+    else:
+        # LD_LIBRARY_PATH is not taken over correctly when the docker container
+        # is converted to a singularity container.
+        stage += environment(
+            variables={"LD_LIBRARY_PATH": "$LD_LIBRARY_PATH:/usr/local/cuda/lib64"}
+        )
     stage += environment(variables={"CMAKE_PREFIX_PATH": config.install_prefix})
     stage += packages(
         ospackages=[
@@ -103,6 +116,32 @@ def gen_base_stage(config: xcc.config.XCC_Config) -> hpccm.Stage:
         ]
     )
 
+    # the module prebuild and the checks of the release build run the
+    # binaries, which are built for the target cpu, at container build time
+    # compare the instruction set macros of the target with those of the build
+    # host, to fail before hours of build time
+    if config.cpu_target:
+        clang = "clang-" + str(config.clang_version)
+        macros = (
+            " -dM -E -x c /dev/null | grep '^#define __[A-Z0-9_]* ' | cut -d' ' -f2 | sort > "
+        )
+        stage += shell(
+            commands=[
+                clang
+                + " "
+                + " ".join(config.get_cpu_target_flags())
+                + macros
+                + "/tmp/xcc_target_isa",
+                clang + " -march=native" + macros + "/tmp/xcc_host_isa",
+                'if [ -n "$(comm -23 /tmp/xcc_target_isa /tmp/xcc_host_isa)" ]; then '
+                + 'echo "The cpu of the build host does not support the cpu target '
+                + config.cpu_target
+                + ', missing: $(comm -23 /tmp/xcc_target_isa /tmp/xcc_host_isa | tr "\\n" " ")"; '
+                + "exit 1; fi",
+                "rm /tmp/xcc_target_isa /tmp/xcc_host_isa",
+            ]
+        )
+
     # install clang development tools
     clang_extra = [
         "clang-tidy-" + str(config.clang_version),
@@ -117,8 +156,21 @@ def gen_base_stage(config: xcc.config.XCC_Config) -> hpccm.Stage:
             "libc++abi1-" + str(config.clang_version),
             "libc++abi-" + str(config.clang_version) + "-dev",
         ]
+    # lld from the clang toolchain
+    if config.linker == "lld":
+        clang_extra.append("lld-" + str(config.clang_version))
     stage += packages(ospackages=clang_extra)
 
+    # -fuse-ld=lld searches for ld.lld
+    if config.linker == "lld":
+        stage += shell(
+            commands=[
+                "update-alternatives --install /usr/bin/ld.lld ld.lld $(which ld.lld-"
+                + str(config.clang_version)
+                + ") 30"
+            ]
+        )
+
     stage += cmake(eula=True, version="3.18.0")
 
     # the folder is necessary for jupyter lab
@@ -0,0 +1,183 @@
+"""Functions to build the clangd indexer and to create a merged compile
+database and a clangd index of the cling and xeus-cling sources of the dev
+container.
+"""
+
+from typing import List
+
+from hpccm.templates.CMakeBuild import CMakeBuild
+
+import xcc.config
+from xcc.helper import git_clone_step
+
+# the clangd packages do not contain clangd-indexer, therefore it is built from
+# the llvm release of the clangd package, that the index format matches
+clangd_indexer_tags = {8: "llvmorg-8.0.1", 9: "llvmorg-9.0.1"}
+
+
+def get_clangd_indexer_path(config: xcc.config.XCC_Config) -> str:
+    """Returns the path of the clangd indexer in the container.
+
+    :param config: Configuration object, which contains different information for the stage
+    :type config: xcc.config.XCC_Config
+    :returns: path of the executable
+    :rtype: str
+
+    """
+    return config.install_prefix + "/bin/clangd-indexer-" + str(config.clang_version)
+
+
+def build_clangd_indexer(config: xcc.config.XCC_Config) -> List[str]:
+    """Return instructions, which build the target clangd-indexer of the llvm release of the clangd package (see clangd_indexer_tags) and install it as get_clangd_indexer_path(). Only the indexer and its libraries are built.
+
+    :param config: Configuration object, which contains different information for the stage
+    :type config: xcc.config.XCC_Config
+    :returns: list of bash commands
+    :rtype: List[str]
+
+    """
+    source_path = config.build_prefix + "/llvm-project"
+    build_path = config.build_prefix + "/clangd-indexer_build"
+    indexer_path = get_clangd_indexer_path(config)
+
+    cm = [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Build clangd-indexer                                  //",
+        "#///////////////////////////////////////////////////////////",
+        git_clone_step(
+            config=config,
+            repository="https://github.com/llvm/llvm-project.git",
+            branch=clangd_indexer_tags[config.clang_version],
+            path=config.build_prefix,
+        ),
+    ]
+
+    cmake_opts = [
+        "-G Ninja",
+        "-DCMAKE_BUILD_TYPE=RELEASE",
+        '-DLLVM_ENABLE_PROJECTS="clang;clang-tools-extra"',
+        "-DLLVM_TARGETS_TO_BUILD=host",
+        "'-DCMAKE_JOB_POOLS:STRING=compile={0};link={1}'".format(
+            config.get_cmake_compiler_threads(), config.get_cmake_linker_threads()
+        ),
+        "'-DCMAKE_JOB_POOL_COMPILE:STRING=compile'",
+        "'-DCMAKE_JOB_POOL_LINK:STRING=link'",
+        "-DLLVM_INCLUDE_TESTS=OFF",
+        "-DLLVM_INCLUDE_EXAMPLES=OFF",
+        "-DLLVM_INCLUDE_DOCS=OFF",
+        "-DLLVM_INCLUDE_BENCHMARKS=OFF",
+    ]
+    # LLVM checks and sets -fuse-ld itself
+    if config.linker != "default":
+        cmake_opts.append("-DLLVM_USE_LINKER=" + config.linker)
+
+    cm_indexer = CMakeBuild(prefix=config.install_prefix)
+    cm += [
+        cm_indexer.configure_step(
+            build_directory=build_path,
+            directory=source_path + "/llvm",
+            opts=cmake_opts,
+        ),
+        cm_indexer.build_step(parallel=None, target="clangd-indexer"),
+        "mkdir -p " + config.install_prefix + "/bin",
+        "cp " + build_path + "/bin/clangd-indexer " + indexer_path,
+        "cd -",
+    ]
+
+    if not config.keep_build:
+        config.paths_to_delete.append(source_path)
+        config.paths_to_delete.append(build_path)
+
+    return cm
+
+
+def build_code_index(config: xcc.config.XCC_Config, indexer: str) -> List[str]:
+    """Return instructions, which merge the compile databases of all cling and xeus-cling builds (including the dual build) to <install_prefix>/compile_commands.json and build a static clangd index <install_prefix>/clangd.dex once. The index is only rebuilt, if the merged compile database has changed. If a file is compiled by several builds, the entry of the first build type is used. The script <install_prefix>/xcc-clangd starts clangd with the compile database and the index and can be set as clangd executable in the editor.
+
+    :param config: Configuration object, which contains different information for the stage
+    :type config: xcc.config.XCC_Config
+    :param indexer: path of the clangd indexer in the container (see build_clangd_indexer())
+    :type indexer: str
+    :returns: list of bash commands
+    :rtype: List[str]
+
+    """
+    clang_version = str(config.clang_version)
+    python_exe = config.get_miniconda_path() + "/bin/python"
+    database = config.install_prefix + "/compile_commands.json"
+    index = config.install_prefix + "/clangd.dex"
+    wrapper = config.install_prefix + "/xcc-clangd"
+
+    builds = [b.build_path for b in config.get_cling_build()]
+    builds += [b.build_path for b in config.get_xeus_cling_build()]
+
+    cm = [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Compile database and clangd index                     //",
+        "#///////////////////////////////////////////////////////////",
+        # the first entry of each file wins, therefore the primary build type
+        # is listed first
+        python_exe
+        + " -c \"import json, os, sys; db = []; seen = set(); "
+        + "[(db.append(e), seen.add(f)) for p in sys.argv[2:] if os.path.exists(p) "
+        + "for e in json.load(open(p)) for f in [os.path.join(e['directory'], e['file'])] if f not in seen]; "
+        + "json.dump(db, open(sys.argv[1], 'w'), indent=1); "
+        + "print('compile database: ' + str(len(db)) + ' files')\" "
+        + database
+        + ".new "
+        + " ".join(b + "/compile_commands.json" for b in builds),
+        "if cmp -s "
+        + database
+        + ".new "
+        + database
+        + "; then rm "
+        + database
+        + ".new; else mv "
+        + database
+        + ".new "
+        + database
+        + " && rm -f "
+        + index
+        + "; fi",
+    ]
+
+    # clangd searches the compile database in the parent folders of the sources
+    if config.build_prefix != config.install_prefix:
+        cm.append("ln -sf " + database + " " + config.build_prefix + "/compile_commands.json")
+
+    cm += [
+        "if [ ! -f " + index + " ]; then",
+        "    echo 'build clangd index, this takes a while'",
+        "    "
+        + indexer
+        + " --executor=all-TUs "
+        + database
+        + " > "
+        + index
+        + ".tmp && mv "
+        + index
+        + ".tmp "
+        + index,
+        "fi",
+        # the script checks at runtime if the index exists, e.g. if the
+        # indexer failed
+        "echo '#!/bin/sh' > " + wrapper,
+        "echo 'if [ -f "
+        + index
+        + " ]; then set -- --index-file="
+        + index
+        + ' "$@"; fi\' >> '
+        + wrapper,
+        "echo 'exec clangd-"
+        + clang_version
+        + " --compile-commands-dir="
+        + config.install_prefix
+        + ' "$@"\' >> '
+        + wrapper,
+        "chmod +x " + wrapper,
+        "echo 'clangd for editors: " + wrapper + "'",
+    ]
+
+    return cm
@@ -7,6 +7,11 @@ from hpccm.templates.git import git
 from hpccm.templates.CMakeBuild import CMakeBuild
 
 import xcc.config
+from xcc.helper import (
+    git_clone_step,
+    fingerprint_configure_step,
+    add_cpu_target_cmake_args,
+)
 
 
 def build_cling(
@@ -15,6 +20,7 @@ def build_cling(
     cling_branch=None,
     cling_hash=None,
     git_cling_opts=["--depth=1"],
+    opts: List[str] = [],
 ) -> List[str]:
     """Return Cling build instructions.
 
@@ -28,6 +34,8 @@ def build_cling(
     :type config: xcc.config.XCC_Config
     :param git_cling_opts: Setting options for Git Clone
     :type git_cling_opts: [str]
+    :param opts: additional CMake arguments (e.g. -DLLVM_INCLUDE_TESTS=OFF)
+    :type opts: [str]
     :returns: a list of build instructions and a list of the install folders
     :rtype: [str],[str]
 
@@ -51,46 +59,47 @@ def build_cling(
         "#/////////////////////////////",
     ]
 
-    git_llvm = git()
     cbc.append(
-        git_llvm.clone_step(
+        git_clone_step(
+            config=config,
             repository="http://root.cern.ch/git/llvm.git",
             branch="cling-patches",
             path=config.build_prefix,
             directory="llvm",
         )
     )
-    git_clang = git()
     cbc.append(
-        git_clang.clone_step(
+        git_clone_step(
+            config=config,
             repository="http://root.cern.ch/git/clang.git",
             branch="cling-patches",
             path=config.build_prefix + "/llvm/tools",
         )
     )
-    git_cling = git(opts=git_cling_opts)
     cbc.append(
-        git_cling.clone_step(
+        git_clone_step(
+            config=config,
             repository=cling_url,
             branch=cling_branch,
             commit=cling_hash,
             path=config.build_prefix + "/llvm/tools",
+            opts=git_cling_opts,
         )
     )
     # add libc++ and libcxxabi to the llvm project
     # Comaker detect the projects automatically and builds it.
     if config.build_libcxx:
-        git_libcxx = git()
         cbc.append(
-            git_libcxx.clone_step(
+            git_clone_step(
+                config=config,
                 repository="https://github.com/llvm-mirror/libcxx",
                 branch="release_50",
                 path=config.build_prefix + "/llvm/projects",
             )
         )
-        git_libcxxabi = git()
         cbc.append(
-            git_libcxx.clone_step(
+            git_clone_step(
+                config=config,
                 repository="https://github.com/llvm-mirror/libcxxabi",
                 branch="release_50",
                 path=config.build_prefix + "/llvm/projects",
@@ -109,7 +118,6 @@ def build_cling(
             "-G Ninja",
             "-DCMAKE_BUILD_TYPE=" + build.build_type,
             '-DLLVM_ABI_BREAKING_CHECKS="FORCE_OFF"',
-            "-DCMAKE_LINKER=/usr/bin/gold",
             "-DLLVM_ENABLE_RTTI=ON",
             "'-DCMAKE_JOB_POOLS:STRING=compile={0};link={1}'".format(
                 compiler_threads, linker_threads
@@ -119,22 +127,53 @@ def build_cling(
             '-DLLVM_TARGETS_TO_BUILD="host;NVPTX"',
             "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON",
         ]
+        cmake_opts += opts
+
+        # LLVM checks and sets -fuse-ld itself
+        if config.linker != "default":
+            cmake_opts.append("-DLLVM_USE_LINKER=" + config.linker)
 
         # build the project with libc++
         # the flag is not necessary to enable the build of libc++ and libc++abi
         if config.build_libcxx:
             cmake_opts.append("-DLLVM_ENABLE_LIBCXX=ON")
 
+        # the interpreter itself and the runtime libraries are built for the
+        # target cpu
+        # the tablegen tools are executed during the build, therefore they are
+        # built in a separate native build tree without the target flags
+        if config.cpu_target:
+            cmake_opts.append("-DLLVM_OPTIMIZED_TABLEGEN=ON")
+        cmake_opts = add_cpu_target_cmake_args(config, cmake_opts)
+
         cm_cling = CMakeBuild(prefix=build.install_path)
-        cbc.append(
-            cm_cling.configure_step(
+        cbc += fingerprint_configure_step(
+            config=config,
+            configure_step=cm_cling.configure_step(
                 build_directory=build.build_path,
                 directory=config.build_prefix + "/llvm",
                 opts=cmake_opts,
-            )
+            ),
+            build_directory=build.build_path,
         )
         cbc.append(cm_cling.build_step(parallel=None, target="install"))
 
+        # the build folder is removed after the build, therefore the ninja
+        # log and the dependency graph are copied for the build time analysis
+        if config.ninja_log_path:
+            log_name = config.ninja_log_path + "/cling-" + build.build_type
+            cbc.append("mkdir -p " + config.ninja_log_path)
+            cbc.append(
+                "cp " + build.build_path + "/.ninja_log " + log_name + ".ninja_log"
+            )
+            cbc.append(
+                "ninja -C "
+                + build.build_path
+                + " -t graph install | gzip > "
+                + log_name
+                + ".ninja_graph.gz"
+            )
+
         cbc.append("PATH_bak=$PATH")
         cbc.append("PATH=$PATH:" + build.install_path + "/bin")
         cbc.append("cd " + build.install_path + "/share/cling/Jupyter/kernel")
@@ -147,4 +186,111 @@ def build_cling(
             config.paths_to_delete.append(build.build_path)
         config.paths_to_delete.append(config.build_prefix + "/llvm")
 
+    if config.cling_modules:
+        cbc += build_cling_modules(config)
+
     return cbc
+
+
+# standard headers of the prebuilt module, the C++17 headers are only part of
+# the module, if the kernel uses C++17
+cling_module_headers = [
+    "algorithm",
+    "array",
+    "chrono",
+    "cmath",
+    "complex",
+    "cstdint",
+    "cstdio",
+    "cstdlib",
+    "cstring",
+    "functional",
+    "iomanip",
+    "iostream",
+    "iterator",
+    "limits",
+    "map",
+    "memory",
+    "numeric",
+    "random",
+    "set",
+    "sstream",
+    "string",
+    "tuple",
+    "type_traits",
+    "unordered_map",
+    "utility",
+    "vector",
+]
+cling_module_headers_cxx17 = ["optional", "string_view", "variant"]
+
+
+def build_cling_modules(
+    config: xcc.config.XCC_Config,
+    standards: List[int] = [11, 14, 17],
+    cuda_variants: List[bool] = [False, True],
+) -> List[str]:
+    """Return instructions, which prebuild the C++ module of the standard library for the kernels (see XCC_Config.get_cling_modules_flags()). The module depends on the language options and the target cpu, therefore it is built for each C++ standard and CUDA variant with the flags of the kernels. The module cache is read-only in the container, so all variants have to be built at image build time. The CUDA headers are included by the CUDA wrapper header of clang before the module is imported, therefore they are parsed at each startup.
+
+    :param config: Configuration object, which contains different information for the stage
+    :type config: xcc.config.XCC_Config
+    :param standards: C++ standards of the kernels
+    :type standards: List[int]
+    :param cuda_variants: build the module without and/or with CUDA
+    :type cuda_variants: List[bool]
+    :returns: list of bash commands
+    :rtype: List[str]
+
+    """
+    modules_path = config.get_cling_modules_path()
+    cling_exe = config.get_cling_build()[0].install_path + "/bin/cling"
+
+    modulemap = ["module xcc_std [system] {", '  header "xcc_std.h"', "  export *", "}"]
+
+    header = ["#include <" + h + ">" for h in cling_module_headers]
+    header += ["#if __cplusplus >= 201703L"]
+    header += ["#include <" + h + ">" for h in cling_module_headers_cxx17]
+    header += ["#endif"]
+
+    cm = [
+        "",
+        "#/////////////////////////////",
+        "#// Prebuild C++ modules    //",
+        "#/////////////////////////////",
+        "rm -rf " + modules_path,
+        "mkdir -p " + modules_path + "/cache",
+    ]
+    for name, lines in [("module.modulemap", modulemap), ("xcc_std.h", header)]:
+        redirect = " > "
+        for line in lines:
+            cm.append("echo '" + line + "'" + redirect + modules_path + "/" + name)
+            redirect = " >> "
+
+    # the first include of the umbrella header builds the module
+    # cling does not fail, if the module cannot be built, therefore each
+    # variant has to write a new module file in the cache
+    stamp = modules_path + "/build.stamp"
+    for cuda in cuda_variants:
+        for std in standards:
+            variant = "c++" + str(std) + (" cuda" if cuda else "")
+            cm += [
+                "touch " + stamp,
+                "echo .q | "
+                + " ".join(
+                    [cling_exe, "-std=c++" + str(std)]
+                    + (["-xcuda"] if cuda else [])
+                    + config.get_cpu_target_flags()
+                    + config.get_cling_modules_flags()
+                )
+                + " > /dev/null",
+                'if [ -z "$(find '
+                + modules_path
+                + "/cache -name 'xcc_std*.pcm' -newer "
+                + stamp
+                + ')" ]; then echo "no C++ module was built for '
+                + variant
+                + '"; exit 1; fi',
+            ]
+    cm += ["rm " + stamp, "chmod -R a+rX " + modules_path]
+
+    return cm
@@ -2,11 +2,56 @@
 
 """
 
-from typing import List, Union
+from typing import List, Dict, Union
 from copy import deepcopy
+import json
+import os
 
 supported_clang_version = [8, 9]
 
+# default uses the default linker of the compiler
+supported_linker = ["gold", "lld", "default"]
+
+# memory allocators of the kernels, glibc is the default allocator
+# the other allocators are installed as pinned conda-forge packages and
+# preloaded in the kernels
+supported_allocator = ["glibc", "jemalloc", "mimalloc"]
+allocator_packages = {"jemalloc": "jemalloc=5.2.1", "mimalloc": "mimalloc=2.1.2"}
+allocator_libraries = {"jemalloc": "libjemalloc.so.2", "mimalloc": "libmimalloc.so"}
+
+# x86-64 microarchitecture levels, which can be used as cpu_target
+# clang 8 and 9 do not know the levels as -march value, therefore the levels
+# are translated to the instruction set extensions of the level
+cpu_target_levels = {
+    "x86-64-v2": [
+        "-mcx16",
+        "-msahf",
+        "-mpopcnt",
+        "-msse3",
+        "-mssse3",
+        "-msse4.1",
+        "-msse4.2",
+    ]
+}
+cpu_target_levels["x86-64-v3"] = cpu_target_levels["x86-64-v2"] + [
+    "-mavx",
+    "-mavx2",
+    "-mbmi",
+    "-mbmi2",
+    "-mf16c",
+    "-mfma",
+    "-mlzcnt",
+    "-mmovbe",
+    "-mxsave",
+]
+cpu_target_levels["x86-64-v4"] = cpu_target_levels["x86-64-v3"] + [
+    "-mavx512f",
+    "-mavx512bw",
+    "-mavx512cd",
+    "-mavx512dq",
+    "-mavx512vl",
+]
+
 
 class XCC_Config:
     class build_object:
@@ -54,6 +99,29 @@ class XCC_Config:
         build_libcxx: bool = False,
         clang_version: int = 8,
         gen_args: str = "",
+        cuda_cache_path: str = "",
+        cuda_cache_maxsize: int = 0,
+        cuda_cache_warmup: bool = False,
+        bytecode_optimize: List[int] = [0],
+        miniconda_cleanup: bool = True,
+        linker: str = "gold",
+        tmpfs_size: float = 0,
+        tmpfs_path: str = "/dev/shm/xcc_build",
+        incremental: bool = False,
+        slim_build: bool = True,
+        binary_projects: List[str] = [],
+        kernel_pool_size: int = 0,
+        kernel_cull_idle_timeout: int = 0,
+        kernel_memory_limit: float = 0,
+        kernel_max_count: int = 0,
+        cling_modules: bool = False,
+        cpu_target: str = "",
+        kernel_allocator: str = "glibc",
+        kernel_malloc_arena_max: int = 0,
+        kernel_malloc_decay_ms: int = -1,
+        prefetch: bool = False,
+        rpath: bool = False,
+        ninja_log_path: str = "",
     ):
         """Setup the configuration object
 
@@ -79,6 +147,52 @@ class XCC_Config:
         :type clang_version: int
         :param gen_args: The string will be save in the environment variable XCC_GEN_ARGS should be used the save the arguments of the generator script if None, no environment variable is created.
         :type gen_args: str
+        :param cuda_cache_path: Set CUDA_CACHE_PATH in the kernelspecs, so that the PTX JIT cache of the CUDA driver is stored persistent and user writable outside the read-only container. ${VAR} is expanded at kernel start (e.g. ${HOME}/.cache/xeus-cling-cuda/ComputeCache). If empty, the variable is not set.
+        :type cuda_cache_path: str
+        :param cuda_cache_maxsize: Set CUDA_CACHE_MAXSIZE in bytes in the kernelspecs. Only used if cuda_cache_path is set. If 0, the driver default is used.
+        :type cuda_cache_maxsize: int
+        :param cuda_cache_warmup: Install the script xcc-warm-cuda-cache, which compiles and runs sample CUDA kernels with all C++ standards to populate the cache at first run. Requires cuda_cache_path.
+        :type cuda_cache_warmup: bool
+        :param bytecode_optimize: Optimization levels (0, 1, 2) of the python bytecode, which is compiled ahead of time for the miniconda installation and the cling jupyter kernel. If empty, no bytecode is compiled.
+        :type bytecode_optimize: List[int]
+        :param miniconda_cleanup: Remove the conda package cache, build-only packages, known test suites (see xcc.miniconda.cleanup_test_dirs) and static libraries with a shared counterpart from the miniconda installation after all installations.
+        :type miniconda_cleanup: bool
+        :param linker: Linker of all projects (see XCC_Config.supported_linker). lld is installed from the clang toolchain.
+        :type linker: str
+        :param tmpfs_size: Size of the tmpfs in GB, which can be used for builds. Projects, whose estimated size (see xcc.planner) fits in the tmpfs, are built in tmpfs_path and removed directly after the installation. The other projects are built in build_prefix. If 0, no tmpfs is used.
+        :type tmpfs_size: float
+        :param tmpfs_path: Build folder in the tmpfs.
+        :type tmpfs_path: str
+        :param incremental: Reuse the source and build folders of a previous build in build_prefix. Existing checkouts are updated to the pinned version and configured build folders are only rebuilt if the configure command has not changed. Requires keep_build.
+        :type incremental: bool
+        :param slim_build: Disable tests, documentation, benchmarks and examples of the projects, if the project supports it (see slim_opts in XCC_gen.project_list).
+        :type slim_build: bool
+        :param binary_projects: Names of the projects, which are installed as prebuilt conda-forge packages in the miniconda installation instead of building them from source (see conda in XCC_gen.project_list). Not supported together with build_libcxx, because the packages are built with libstdc++.
+        :type binary_projects: List[str]
+        :param kernel_pool_size: Number of prestarted xeus-cling kernels per kernelspec, which are handed out by the jupyter server on request (see xcc/data/xcc_kernel_pool.py). If 0, no kernels are prestarted.
+        :type kernel_pool_size: int
+        :param kernel_cull_idle_timeout: Shut down kernels, which are idle for the given number of seconds, also if a browser tab is connected. If 0, idle kernels are not culled.
+        :type kernel_cull_idle_timeout: int
+        :param kernel_memory_limit: Memory limit in GB of each kernel, applied by the kernel launcher (see xcc.jupyter.build_kernel_governance()). If 0, the memory is not limited.
+        :type kernel_memory_limit: float
+        :param kernel_max_count: Maximum number of running kernels per jupyter server. If 0, the number is not limited.
+        :type kernel_max_count: int
+        :param cling_modules: Build a C++ module of the standard library for each C++ standard and CUDA variant of the kernels at image build time. The kernels import the prebuilt module at startup instead of parsing the headers (see get_cling_modules_flags()).
+        :type cling_modules: bool
+        :param cpu_target: Target CPU of all C/C++ builds and the kernels. Either a x86-64 microarchitecture level (see XCC_Config.cpu_target_levels) or a -march value of clang (e.g. skylake-avx512). If empty, the code is generated for generic x86-64 and runs on every x86-64 CPU.
+        :type cpu_target: str
+        :param kernel_allocator: Memory allocator of the kernels (see XCC_Config.supported_allocator). jemalloc and mimalloc are installed in the miniconda installation and preloaded via LD_PRELOAD in the kernelspecs.
+        :type kernel_allocator: str
+        :param kernel_malloc_arena_max: Maximum number of malloc arenas of the kernels. Sets MALLOC_ARENA_MAX for glibc, also as fallback if the allocator cannot be preloaded, and narenas for jemalloc. If 0, the allocator default is used.
+        :type kernel_malloc_arena_max: int
+        :param kernel_malloc_decay_ms: Time in milliseconds, after which jemalloc and mimalloc return unused memory to the system. If -1, the allocator default is used.
+        :type kernel_malloc_decay_ms: int
+        :param prefetch: Download all sources of the project builds concurrently in a single step before the first build starts (see xcc.helper.prefetch_step()). The build steps only verify and use the prefetched copies.
+        :type prefetch: bool
+        :param rpath: Set relative RPATHs ($ORIGIN) for the projects and register the library folders with ldconfig instead of extending LD_LIBRARY_PATH. After the build, the shared libraries of the kernels are checked with ldd (see xcc.ldconfig.build_ld_config()).
+        :type rpath: bool
+        :param ninja_log_path: If not empty, the ninja log and the dependency graph of each Ninja build are stored in this folder after the build, e.g. for the build time analysis of .sregistry/ninja_stats.py. The files are named <project>-<build type>.ninja_log and <project>-<build type>.ninja_graph.gz.
+        :type ninja_log_path: str
 
         """
         self.author = "Simeon Ehrig"
@@ -118,29 +232,116 @@ class XCC_Config:
         self.build_libcxx: bool = build_libcxx
         self.gen_args: str = gen_args
 
+        if cuda_cache_maxsize < 0:
+            raise ValueError("cuda_cache_maxsize have to be greater or equal 0")
+        if cuda_cache_warmup and not cuda_cache_path:
+            raise ValueError("cuda_cache_warmup requires a cuda_cache_path")
+
+        self.cuda_cache_path: str = cuda_cache_path
+        self.cuda_cache_maxsize: int = cuda_cache_maxsize
+        self.cuda_cache_warmup: bool = cuda_cache_warmup
+
+        for level in bytecode_optimize:
+            if level not in [0, 1, 2]:
+                raise ValueError("bytecode optimization level have to be 0, 1 or 2")
+        self.bytecode_optimize: List[int] = list(bytecode_optimize)
+        self.miniconda_cleanup: bool = miniconda_cleanup
+
+        if linker not in supported_linker:
+            raise ValueError(
+                "Linker "
+                + linker
+                + " is not supported\n"
+                + "Supported linker: "
+                + ", ".join(supported_linker)
+            )
+        self.linker: str = linker
+
+        if tmpfs_size < 0:
+            raise ValueError("tmpfs_size have to be greater or equal 0")
+        if tmpfs_size and keep_build:
+            raise ValueError("tmpfs builds cannot be kept, do not use keep_build")
+        self.tmpfs_size: float = tmpfs_size
+        self.tmpfs_path: str = tmpfs_path
+
+        if incremental and not keep_build:
+            raise ValueError("incremental builds requires keep_build")
+        self.incremental: bool = incremental
+        self.slim_build: bool = slim_build
+
+        if binary_projects and build_libcxx:
+            raise ValueError(
+                "prebuilt conda packages are not compatible with build_libcxx"
+            )
+        self.binary_projects: List[str] = list(binary_projects)
+
+        if kernel_pool_size < 0:
+            raise ValueError("kernel_pool_size have to be greater or equal 0")
+        self.kernel_pool_size: int = kernel_pool_size
+
+        if kernel_cull_idle_timeout < 0:
+            raise ValueError("kernel_cull_idle_timeout have to be greater or equal 0")
+        if kernel_memory_limit < 0:
+            raise ValueError("kernel_memory_limit have to be greater or equal 0")
+        if kernel_max_count < 0:
+            raise ValueError("kernel_max_count have to be greater or equal 0")
+        self.kernel_cull_idle_timeout: int = kernel_cull_idle_timeout
+        self.kernel_memory_limit: float = kernel_memory_limit
+        self.kernel_max_count: int = kernel_max_count
+        self.cling_modules: bool = cling_modules
+
+        if cpu_target and (cpu_target.startswith("-") or " " in cpu_target):
+            raise ValueError("cpu_target have to be a -march value without -march=")
+        self.cpu_target: str = cpu_target
+
+        if kernel_allocator not in supported_allocator:
+            raise ValueError(
+                "Allocator "
+                + kernel_allocator
+                + " is not supported\n"
+                + "Supported allocator: "
+                + ", ".join(supported_allocator)
+            )
+        if kernel_malloc_arena_max < 0:
+            raise ValueError("kernel_malloc_arena_max have to be greater or equal 0")
+        if kernel_malloc_decay_ms < -1:
+            raise ValueError("kernel_malloc_decay_ms have to be greater or equal -1")
+        self.kernel_allocator: str = kernel_allocator
+        self.kernel_malloc_arena_max: int = kernel_malloc_arena_max
+        self.kernel_malloc_decay_ms: int = kernel_malloc_decay_ms
+
+        self.prefetch: bool = prefetch
+        # sources, which are downloaded by the prefetch step, collected by the
+        # step builders like the paths to delete (see xcc.helper.fetch_step())
+        self.prefetch_sources: List[Dict[str, str]] = []
+
+        self.rpath: bool = rpath
+        self.ninja_log_path: str = ninja_log_path
+
     def get_copy(self):
-        """Returns a deepcopy.
+        """Returns a deepcopy. The settings are not validated again, because they were validated when the original object was created and can be changed afterwards on purpose (e.g. the runscript config of the dev container).
 
         :returns: Config object
         :rtype: XCC_Config
 
         """
-        c = XCC_Config(
-            container=self.container,
-            build_prefix=self.build_prefix,
-            install_prefix=self.install_prefix,
-            build_type=self.build_type,
-            second_build_type=self.second_build_type,
-            keep_build=self.keep_build,
-            compiler_threads=self.compiler_threads,
-            linker_threads=self.linker_threads,
-            build_libcxx=self.build_libcxx,
-            gen_args=self.gen_args,
-        )
-        c.paths_to_delete = deepcopy(self.paths_to_delete)
+        c = XCC_Config.__new__(XCC_Config)
+        c.__dict__ = deepcopy(self.__dict__)
 
         return c
 
+    def get_fingerprint(self) -> str:
+        """Returns a string, which identifies all settings of the configuration. The paths to delete and the prefetch sources are not part of the fingerprint, because they are a result of the build steps.
+
+        :returns: json string of the settings
+        :rtype: str
+
+        """
+        settings = vars(self).copy()
+        del settings["paths_to_delete"]
+        del settings["prefetch_sources"]
+        return json.dumps(settings, sort_keys=True)
+
     def get_cmake_compiler_threads(self) -> str:
         """Return a number or $(nproc), of compiler_threads is 0
 
@@ -168,6 +369,65 @@ class XCC_Config:
             else str(self.linker_threads)
         )
 
+    def get_linker_flag(self) -> str:
+        """Returns the compiler flag to select the linker.
+
+        :returns: -fuse-ld=<linker> or an empty string for the default linker
+        :rtype: str
+
+        """
+        if self.linker == "default":
+            return ""
+        return "-fuse-ld=" + self.linker
+
+    def get_cmake_linker_args(self) -> List[str]:
+        """Returns the CMake arguments to select the linker for executables, shared libraries and modules.
+
+        :returns: list of CMake arguments, empty for the default linker
+        :rtype: List[str]
+
+        """
+        if self.linker == "default":
+            return []
+        return [
+            '-DCMAKE_{0}_LINKER_FLAGS="{1}"'.format(target, self.get_linker_flag())
+            for target in ["EXE", "SHARED", "MODULE"]
+        ]
+
+    def get_cmake_rpath_args(self, prefix: str, lib_paths: List[str] = []) -> List[str]:
+        """Returns the cmake argument, which sets the relative install RPATH of a project. The paths are relative to $ORIGIN, therefore they are valid for the bin and the lib folder of the prefix.
+
+        :param prefix: install prefix of the project
+        :type prefix: str
+        :param lib_paths: additional library folders of the dependencies outside of <prefix>/lib
+        :type lib_paths: List[str]
+        :returns: list with the cmake argument, empty if config.rpath is false
+        :rtype: List[str]
+
+        """
+        if not self.rpath:
+            return []
+
+        rpath: List[str] = []
+        for path in [prefix + "/lib"] + lib_paths:
+            entry = "$ORIGIN/../" + os.path.relpath(path, prefix)
+            if entry not in rpath:
+                rpath.append(entry)
+        return ["'-DCMAKE_INSTALL_RPATH=" + ";".join(rpath) + "'"]
+
+    def get_cpu_target_flags(self) -> List[str]:
+        """Returns the compiler flags, which generate code for the cpu_target.
+
+        :returns: list of compiler flags, empty for generic x86-64
+        :rtype: List[str]
+
+        """
+        if not self.cpu_target:
+            return []
+        if self.cpu_target in cpu_target_levels:
+            return ["-march=x86-64"] + cpu_target_levels[self.cpu_target]
+        return ["-march=" + self.cpu_target]
+
     def get_cling_build(self) -> List[build_object]:
         """Create a list of build configurations for cling.
 
@@ -255,6 +515,97 @@ class XCC_Config:
 
         return xeus_cling_builds
 
+    def get_cuda_cache_env(self) -> Dict[str, str]:
+        """Create the environment variables for the CUDA compute cache of the kernels.
+
+        :returns: CUDA_CACHE_PATH and CUDA_CACHE_MAXSIZE, empty if no cache path is set
+        :rtype: Dict[str, str]
+
+        """
+        env: Dict[str, str] = {}
+        if self.cuda_cache_path:
+            env["CUDA_CACHE_PATH"] = self.cuda_cache_path
+            if self.cuda_cache_maxsize:
+                env["CUDA_CACHE_MAXSIZE"] = str(self.cuda_cache_maxsize)
+        return env
+
+    def get_kernel_allocator_env(self) -> Dict[str, str]:
+        """Create the environment variables, which preload and configure the memory allocator of the kernels.
+
+        :returns: LD_PRELOAD and the settings of the allocator, empty for the default glibc settings
+        :rtype: Dict[str, str]
+
+        """
+        env: Dict[str, str] = {}
+        arena_max = self.kernel_malloc_arena_max
+        decay_ms = self.kernel_malloc_decay_ms
+
+        # glibc uses the variable also, if the allocator cannot be preloaded
+        if arena_max:
+            env["MALLOC_ARENA_MAX"] = str(arena_max)
+
+        if self.kernel_allocator != "glibc":
+            env["LD_PRELOAD"] = (
+                self.get_miniconda_path()
+                + "/lib/"
+                + allocator_libraries[self.kernel_allocator]
+            )
+
+        if self.kernel_allocator == "jemalloc":
+            # the background thread returns memory also of idle kernels
+            conf = ["background_thread:true"]
+            if arena_max:
+                conf.append("narenas:" + str(arena_max))
+            if decay_ms >= 0:
+                conf.append("dirty_decay_ms:" + str(decay_ms))
+                conf.append("muzzy_decay_ms:" + str(decay_ms))
+            env["MALLOC_CONF"] = ",".join(conf)
+        elif self.kernel_allocator == "mimalloc":
+            # MIMALLOC_PURGE_DELAY requires mimalloc 2.1 or newer
+            if decay_ms >= 0:
+                env["MIMALLOC_PURGE_DELAY"] = str(decay_ms)
+
+        return env
+
+    def get_cling_modules_path(self) -> str:
+        """Returns the folder of the module map, the umbrella header and the prebuilt module cache of the cling kernels.
+
+        :returns: path of the folder
+        :rtype: str
+
+        """
+        return self.get_cling_build()[0].install_path + "/share/xcc-modules"
+
+    def get_cling_modules_flags(self) -> List[str]:
+        """Returns the interpreter flags, which load the prebuilt C++ module of the standard library. The umbrella header is included at startup, which is translated into a module import. The container is read-only at runtime, therefore the pruning of the module cache is disabled.
+
+        :returns: list of flags, empty if cling_modules is disabled
+        :rtype: List[str]
+
+        """
+        if not self.cling_modules:
+            return []
+        modules_path = self.get_cling_modules_path()
+        return [
+            "-fmodules",
+            "-fmodules-cache-path=" + modules_path + "/cache",
+            "-fmodule-map-file=" + modules_path + "/module.modulemap",
+            "-fmodules-prune-interval=0",
+            "-include",
+            modules_path + "/xcc_std.h",
+        ]
+
+    def get_cmake_prefix_path(self) -> List[str]:
+        """Returns the additional prefix paths, which are required to find the projects installed as prebuilt conda packages.
+
+        :returns: list of prefix paths, empty if all projects are built from source
+        :rtype: List[str]
+
+        """
+        if self.binary_projects:
+            return [self.get_miniconda_path()]
+        return []
+
     def get_miniconda_path(self) -> str:
         """Create the miniconda install path
 
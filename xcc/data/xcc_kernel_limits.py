@@ -0,0 +1,48 @@
+"""Kernel manager of the jupyter server, which limits the number of running
+kernels. The module is installed in the container and is not used by the
+recipe generator.
+
+Enable it in the jupyter server configuration:
+
+  c.ServerApp.kernel_manager_class = "xcc_kernel_limits.LimitedKernelManager"
+  c.LimitedKernelManager.max_kernels = 4
+
+The prestarted kernels of the kernel pool (xcc_kernel_pool.py) are started
+by the pool and not by the kernel manager. They count against max_kernels,
+but they are not culled by cull_idle_timeout, because the kernel manager
+does not know them until they are handed out.
+"""
+
+from jupyter_server.services.kernels.kernelmanager import AsyncMappingKernelManager
+from tornado import web
+from traitlets import Integer
+
+try:
+    from xcc_kernel_pool import count_pooled_kernels
+except ImportError:
+    # the kernel pool is not installed
+    def count_pooled_kernels() -> int:
+        return 0
+
+
+class LimitedKernelManager(AsyncMappingKernelManager):
+    """Refuses to start new kernels, if max_kernels kernels are running, including the prestarted kernels of the kernel pool. Restarts of running kernels are not limited."""
+
+    max_kernels = Integer(
+        0, config=True, help="maximum number of running kernels, 0 for no limit"
+    )
+
+    async def start_kernel(self, *args, **kwargs):
+        kernel_id = kwargs.get("kernel_id")
+        if (
+            self.max_kernels
+            and (kernel_id is None or kernel_id not in self)
+            and len(self.list_kernel_ids()) + count_pooled_kernels()
+            >= self.max_kernels
+        ):
+            raise web.HTTPError(
+                503,
+                "The maximum number of {0} running kernels is reached. "
+                "Please shut down unused kernels.".format(self.max_kernels),
+            )
+        return await super().start_kernel(*args, **kwargs)
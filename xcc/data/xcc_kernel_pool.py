@@ -0,0 +1,383 @@
+"""Pool of prestarted jupyter kernels. The module is installed in the release
+container and is not used by the recipe generator.
+
+The pool starts a configurable number of kernels per kernelspec in advance
+and hands them out on request. A taken kernel is replaced in the background.
+The pool itself only needs the python standard library, therefore it can be
+tested with any stub kernel executable, e.g.
+
+  python xcc_kernel_pool.py --size 2 -- python -c "import time; time.sleep(1000)" {connection_file}
+
+The PooledProvisioner connects the pool with jupyter_client (>= 7). It is
+registered as kernel provisioner xcc-pool-provisioner and enabled in the
+metadata of the kernelspec:
+
+  "metadata": {"kernel_provisioner": {"provisioner_name": "xcc-pool-provisioner",
+                                      "config": {"pool_size": 2}}}
+
+Prestarted kernels are started in the working directory of the jupyter
+server and not in the folder of the notebook.
+"""
+
+from typing import Dict, List, Union
+import argparse
+import atexit
+import json
+import os
+import secrets
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+provisioner_name = "xcc-pool-provisioner"
+
+# set XCC_KERNEL_POOL=0 to disable the prestarted kernels
+pool_enabled = os.environ.get("XCC_KERNEL_POOL", "1") != "0"
+
+
+class PooledKernel:
+    """A prestarted kernel process with its connection information."""
+
+    def __init__(
+        self,
+        process: subprocess.Popen,
+        connection_file: str,
+        connection_info: Dict[str, Union[str, int]],
+    ):
+        """
+        :param process: kernel process
+        :type process: subprocess.Popen
+        :param connection_file: path of the connection file of the kernel
+        :type connection_file: str
+        :param connection_info: content of the connection file
+        :type connection_info: Dict[str, Union[str, int]]
+
+        """
+        self.process = process
+        self.connection_file = connection_file
+        self.connection_info = connection_info
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        """Kill the kernel process and remove the connection file."""
+        if self.is_alive():
+            self.process.kill()
+            self.process.wait()
+        try:
+            os.remove(self.connection_file)
+        except OSError:
+            pass
+
+
+class KernelPool:
+    """Keeps size prestarted kernels of a kernelspec."""
+
+    def __init__(
+        self,
+        argv: List[str],
+        env: Dict[str, str] = {},
+        size: int = 1,
+        resource_dir: str = "",
+        runtime_dir: str = "",
+    ):
+        """
+        :param argv: command of the kernelspec, {connection_file} and {resource_dir} are replaced
+        :type argv: List[str]
+        :param env: additional environment variables of the kernel
+        :type env: Dict[str, str]
+        :param size: number of prestarted kernels
+        :type size: int
+        :param resource_dir: folder of the kernelspec
+        :type resource_dir: str
+        :param runtime_dir: folder of the connection files (default: temporary folder)
+        :type runtime_dir: str
+
+        """
+        if size < 0:
+            raise ValueError("size have to be greater or equal 0")
+
+        self.argv = list(argv)
+        self.env = dict(env)
+        self.size = size
+        self.resource_dir = resource_dir
+        self.runtime_dir = runtime_dir if runtime_dir else tempfile.gettempdir()
+
+        self._kernels: List[PooledKernel] = []
+        self._lock = threading.Lock()
+        # only one thread starts kernels at the same time
+        self._fill_lock = threading.Lock()
+        self._closed = False
+
+    def fill(self):
+        """Start kernels until the pool is full. Dead kernels are removed. Kernels, which crash at startup, are not restarted until the next call, to avoid a restart loop."""
+        with self._fill_lock:
+            with self._lock:
+                if self._closed:
+                    return
+                for kernel in [k for k in self._kernels if not k.is_alive()]:
+                    kernel.kill()
+                    self._kernels.remove(kernel)
+                missing = self.size - len(self._kernels)
+            for _ in range(missing):
+                kernel = self._start_kernel()
+                with self._lock:
+                    if self._closed:
+                        kernel.kill()
+                        return
+                    self._kernels.append(kernel)
+
+    def fill_async(self):
+        """Fill the pool in a background thread."""
+        threading.Thread(target=self.fill, daemon=True).start()
+
+    def get(self) -> Union[PooledKernel, None]:
+        """Take a running kernel from the pool and refill the pool in the background.
+
+        :returns: kernel or None, if the pool is empty
+        :rtype: PooledKernel
+
+        """
+        kernel = None
+        with self._lock:
+            while self._kernels:
+                candidate = self._kernels.pop(0)
+                if candidate.is_alive():
+                    kernel = candidate
+                    break
+                candidate.kill()
+        self.fill_async()
+        return kernel
+
+    def close(self):
+        """Kill all prestarted kernels."""
+        with self._lock:
+            self._closed = True
+        # wait for a running fill
+        with self._fill_lock:
+            with self._lock:
+                kernels, self._kernels = self._kernels, []
+        for kernel in kernels:
+            kernel.kill()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._kernels)
+
+    def _start_kernel(self) -> PooledKernel:
+        connection_info = gen_connection_info()
+        fd, connection_file = tempfile.mkstemp(
+            prefix="kernel-xcc-pool-", suffix=".json", dir=self.runtime_dir
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(connection_info, f)
+
+        cmd = [
+            arg.replace("{connection_file}", connection_file).replace(
+                "{resource_dir}", self.resource_dir
+            )
+            for arg in self.argv
+        ]
+        env = dict(os.environ)
+        env.update({k: os.path.expandvars(v) for k, v in self.env.items()})
+        # own process group, that signals of the server do not reach the
+        # prestarted kernels
+        process = subprocess.Popen(
+            cmd, env=env, stdin=subprocess.DEVNULL, start_new_session=True
+        )
+        return PooledKernel(process, connection_file, connection_info)
+
+
+def gen_connection_info(ip: str = "127.0.0.1") -> Dict[str, Union[str, int]]:
+    """Returns the content of a connection file with free tcp ports.
+
+    :param ip: ip of the kernel
+    :type ip: str
+    :returns: connection information
+    :rtype: Dict[str, Union[str, int]]
+
+    """
+    sockets = []
+    ports = []
+    # keep all sockets open until all ports are found, to get different ports
+    for _ in range(5):
+        s = socket.socket()
+        s.bind((ip, 0))
+        sockets.append(s)
+        ports.append(s.getsockname()[1])
+    for s in sockets:
+        s.close()
+
+    return {
+        "shell_port": ports[0],
+        "iopub_port": ports[1],
+        "stdin_port": ports[2],
+        "control_port": ports[3],
+        "hb_port": ports[4],
+        "ip": ip,
+        "key": secrets.token_hex(16),
+        "transport": "tcp",
+        "signature_scheme": "hmac-sha256",
+        "kernel_name": "",
+    }
+
+
+# one pool per kernelspec, shared by all provisioners of the server process
+_pools: Dict[str, KernelPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(
+    argv: List[str], env: Dict[str, str], size: int, resource_dir: str = ""
+) -> KernelPool:
+    """Returns the pool of a kernelspec. The pool is created and filled at the first call.
+
+    :param argv: command of the kernelspec
+    :type argv: List[str]
+    :param env: additional environment variables of the kernelspec
+    :type env: Dict[str, str]
+    :param size: number of prestarted kernels
+    :type size: int
+    :param resource_dir: folder of the kernelspec
+    :type resource_dir: str
+    :returns: pool
+    :rtype: KernelPool
+
+    """
+    key = json.dumps([argv, env, resource_dir], sort_keys=True)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = KernelPool(argv, env, size, resource_dir)
+            _pools[key].fill_async()
+        return _pools[key]
+
+
+def prewarm():
+    """Create the pools of all installed kernelspecs, which use the xcc-pool-provisioner. Called from the jupyter server configuration, that the kernels are ready before the first notebook is opened."""
+    if not pool_enabled:
+        return
+
+    from jupyter_client.kernelspec import KernelSpecManager
+
+    ksm = KernelSpecManager()
+    for name in ksm.find_kernel_specs():
+        spec = ksm.get_kernel_spec(name)
+        provisioner = spec.metadata.get("kernel_provisioner", {})
+        if provisioner.get("provisioner_name") != provisioner_name:
+            continue
+        size = int(provisioner.get("config", {}).get("pool_size", 1))
+        if size > 0:
+            get_pool(spec.argv, spec.env, size, spec.resource_dir)
+
+
+def count_pooled_kernels() -> int:
+    """Returns the number of prestarted kernels of all pools of the server process. The kernels are not known by the kernel manager of the jupyter server.
+
+    :returns: number of prestarted kernels
+    :rtype: int
+
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    return sum(len(pool) for pool in pools)
+
+
+@atexit.register
+def _close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+
+
+try:
+    from jupyter_client.provisioning import LocalProvisioner
+    from traitlets import Integer
+except ImportError:
+    # the pool can be used and tested without jupyter_client
+    LocalProvisioner = None
+
+if LocalProvisioner is not None:
+
+    class PooledProvisioner(LocalProvisioner):  # type: ignore
+        """Kernel provisioner, which hands out prestarted kernels of the pool. If the pool is empty, the kernel is started like by the LocalProvisioner."""
+
+        pool_size = Integer(1, config=True, help="number of prestarted kernels")
+
+        _pooled_kernel = None
+
+        async def launch_kernel(self, cmd: List[str], **kwargs):
+            if not pool_enabled or self.pool_size < 1:
+                return await super().launch_kernel(cmd, **kwargs)
+
+            pool = get_pool(
+                self.kernel_spec.argv,
+                self.kernel_spec.env,
+                self.pool_size,
+                self.kernel_spec.resource_dir,
+            )
+            kernel = pool.get()
+            if kernel is None:
+                return await super().launch_kernel(cmd, **kwargs)
+
+            self._pooled_kernel = kernel
+            self.process = kernel.process
+            self.pid = kernel.process.pid
+            try:
+                self.pgid = os.getpgid(self.pid)
+            except OSError:
+                pass
+            self.ip = kernel.connection_info["ip"]
+            self.connection_info = dict(kernel.connection_info)
+            # the KernelManager stores the key as bytes
+            self.connection_info["key"] = str(kernel.connection_info["key"]).encode()
+            return self.connection_info
+
+        async def cleanup(self, restart: bool = False) -> None:
+            if self._pooled_kernel is not None:
+                try:
+                    os.remove(self._pooled_kernel.connection_file)
+                except OSError:
+                    pass
+                self._pooled_kernel = None
+            await super().cleanup(restart=restart)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Start a kernel pool with an arbitrary kernel command and "
+        "measure the time to get a kernel."
+    )
+    parser.add_argument("--size", type=int, default=2, help="pool size")
+    parser.add_argument(
+        "--requests", type=int, default=4, help="number of kernel requests"
+    )
+    parser.add_argument(
+        "argv",
+        nargs="+",
+        help="kernel command, {connection_file} is replaced by the connection file",
+    )
+    args = parser.parse_args()
+
+    pool = KernelPool(args.argv, size=args.size)
+    pool.fill()
+    for i in range(args.requests):
+        start = time.time()
+        kernel = pool.get()
+        elapsed = time.time() - start
+        if kernel is None:
+            print("request {0}: pool empty".format(i))
+        else:
+            print(
+                "request {0}: pid {1} after {2:.4f} s".format(
+                    i, kernel.process.pid, elapsed
+                )
+            )
+            kernel.kill()
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Compare the memory usage of an interpreter with the default glibc allocator
+and with the allocator settings of a kernelspec. The script is installed in
+the container as xcc-malloc-bench and is not used by the recipe generator.
+
+The interpreter gets a workload, which defines and runs many small functions
+with standard containers, via stdin. The resident set size (RSS) is sampled
+from /proc during the run. The script only needs the python standard library,
+therefore it can be tested with any stub command, e.g.
+
+  python xcc_malloc_bench.py --iterations 100 -- python -c "import sys; d = [l * 100 for l in sys.stdin]"
+"""
+
+from typing import Dict, List, Tuple
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# variables of the kernelspecs, which configure the allocator
+allocator_variables = [
+    "LD_PRELOAD",
+    "MALLOC_ARENA_MAX",
+    "MALLOC_CONF",
+    "MIMALLOC_PURGE_DELAY",
+]
+
+
+def gen_workload(iterations: int) -> str:
+    """Returns C++ code, which allocates and frees a lot of small objects in the interpreter.
+
+    :param iterations: number of generated functions
+    :type iterations: int
+    :returns: interpreter input
+    :rtype: str
+
+    """
+    lines = ["#include <map>", "#include <string>", "#include <vector>"]
+    for i in range(iterations):
+        lines += [
+            "int xcc_bench_{0}() {{".format(i),
+            "  std::map<int, std::string> m;",
+            "  std::vector<std::string> v;",
+            "  for (int j = 0; j < 1000; ++j) { m[j] = std::to_string(j); v.push_back(m[j]); }",
+            "  return m.size() + v.size();",
+            "}",
+            "xcc_bench_{0}();".format(i),
+        ]
+    lines.append(".q")
+    return "\n".join(lines) + "\n"
+
+
+def read_rss_kb(pid: int) -> int:
+    """Returns the resident set size of a process in KB, 0 if the process does not exist anymore.
+
+    :param pid: process id
+    :type pid: int
+    :returns: RSS in KB
+    :rtype: int
+
+    """
+    try:
+        with open("/proc/{0}/status".format(pid)) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def run(
+    argv: List[str], env: Dict[str, str], workload: str, interval: float = 0.05
+) -> Tuple[int, int, float]:
+    """Run the interpreter with the workload and sample the RSS.
+
+    :param argv: interpreter command
+    :type argv: List[str]
+    :param env: complete environment of the interpreter
+    :type env: Dict[str, str]
+    :param workload: input of the interpreter
+    :type workload: str
+    :param interval: sampling interval in seconds
+    :type interval: float
+    :returns: peak RSS in KB, last sampled RSS in KB and runtime in seconds
+    :rtype: Tuple[int, int, float]
+
+    """
+    start = time.time()
+    process = subprocess.Popen(
+        argv, env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL
+    )
+
+    # write the input in a thread, that the RSS can be sampled at the same time
+    def feed():
+        try:
+            process.stdin.write(workload.encode())  # type: ignore
+            process.stdin.close()  # type: ignore
+        except BrokenPipeError:
+            pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    last_rss = 0
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        rss = read_rss_kb(process.pid)
+        if rss:
+            last_rss = rss
+        time.sleep(interval)
+    elapsed = time.time() - start
+    feeder.join()
+
+    # the process is already reaped by wait4
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(
+            "{0} exited with {1}".format(" ".join(argv), process.returncode)
+        )
+
+    # ru_maxrss is in KB on linux
+    return max(last_rss, rusage.ru_maxrss), last_rss, elapsed
+
+
+def load_kernel_env(kernel: str) -> Dict[str, str]:
+    """Returns the allocator variables of an installed kernelspec.
+
+    :param kernel: name of the kernelspec or path of a kernel.json
+    :type kernel: str
+    :returns: allocator variables
+    :rtype: Dict[str, str]
+
+    """
+    if os.path.isfile(kernel):
+        path = kernel
+    else:
+        path = os.path.join(
+            sys.prefix, "share", "jupyter", "kernels", kernel, "kernel.json"
+        )
+    with open(path) as kernel_file:
+        env = json.load(kernel_file).get("env", {})
+    return {
+        k: os.path.expandvars(v) for k, v in env.items() if k in allocator_variables
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the RSS of an interpreter with the glibc allocator and "
+        "with the allocator settings of a kernelspec."
+    )
+    parser.add_argument(
+        "--kernel",
+        type=str,
+        default="xeus-cling-cpp17-cuda",
+        help="name of an installed kernelspec or path of a kernel.json, whose allocator "
+        "settings are used (default: xeus-cling-cpp17-cuda)",
+    )
+    parser.add_argument(
+        "--env",
+        type=str,
+        nargs="*",
+        default=[],
+        help="additional or overwritten allocator settings, e.g. MALLOC_ARENA_MAX=2",
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=200, help="number of generated functions"
+    )
+    parser.add_argument(
+        "argv",
+        nargs="*",
+        default=["cling", "-std=c++17"],
+        help="interpreter command, which reads the workload from stdin (default: cling -std=c++17)",
+    )
+    args = parser.parse_args()
+
+    kernel_env: Dict[str, str] = {}
+    if args.kernel:
+        try:
+            kernel_env = load_kernel_env(args.kernel)
+        except OSError:
+            print("kernelspec {0} not found, use only --env".format(args.kernel))
+    for variable in args.env:
+        key, _, value = variable.partition("=")
+        kernel_env[key] = value
+
+    glibc_env = {k: v for k, v in os.environ.items() if k not in allocator_variables}
+    tuned_env = dict(glibc_env)
+    tuned_env.update(kernel_env)
+
+    workload = gen_workload(args.iterations)
+    print("allocator settings: " + (json.dumps(kernel_env) if kernel_env else "none"))
+    print(
+        "{0:<10} {1:>14} {2:>14} {3:>10}".format(
+            "", "peak RSS [MB]", "end RSS [MB]", "time [s]"
+        )
+    )
+    for name, env in [("glibc", glibc_env), ("kernel", tuned_env)]:
+        peak, last, elapsed = run(args.argv, env, workload)
+        print(
+            "{0:<10} {1:>14.1f} {2:>14.1f} {3:>10.2f}".format(
+                name, peak / 1024, last / 1024, elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ integration into other projects. Use the
 
 * gen_devel_stage()
 * gen_release_single_stage()
+* gen_release_build_stage()
 
 """
 
@@ -18,12 +19,39 @@ from hpccm.templates.rm import rm
 
 from xcc.cling import build_cling
 from xcc.xeuscling import build_xeus_cling
-from xcc.helper import build_git_and_cmake, add_libcxx_cmake_arg
+from xcc.helper import (
+    build_git_and_cmake,
+    add_libcxx_cmake_arg,
+    pure_step,
+    prefetch_step,
+)
 from xcc.openssl import build_openssl
-from xcc.miniconda import build_miniconda
-from xcc.jupyter import build_dev_jupyter_kernel, build_rel_jupyter_kernel
+from xcc.miniconda import (
+    build_miniconda,
+    build_conda_packages,
+    build_miniconda_cleanup,
+    build_python_bytecode,
+)
+from xcc.jupyter import (
+    build_dev_jupyter_kernel,
+    build_rel_jupyter_kernel,
+    build_jupyterlab_assets,
+)
 from xcc.basestage import gen_base_stage
+from xcc.clangd import build_clangd_indexer, build_code_index, get_clangd_indexer_path
+from xcc.ldconfig import build_ld_config
 import xcc.config
+import xcc.planner
+
+
+# storage of the sources and build trees of the dev container runscript
+# * host: project_path on the host system
+# * overlay: singularity overlay image, which is mounted at overlay_project_path
+# * scratch: node-local scratch folder, the projects are installed in project_path
+supported_project_storage = ["host", "overlay", "scratch"]
+
+# project path inside the container, if the overlay storage is used
+overlay_project_path = "/opt/xcc_project"
 
 
 class XCC_gen:
@@ -39,6 +67,29 @@ class XCC_gen:
         clang_version=8,
         gen_args=None,
         build_libcxx=None,
+        cuda_cache_path="",
+        cuda_cache_maxsize=0,
+        cuda_cache_warmup=False,
+        bytecode_optimize=[0],
+        miniconda_cleanup=True,
+        linker="gold",
+        tmpfs_size=0,
+        tmpfs_path="/dev/shm/xcc_build",
+        incremental=False,
+        slim_build=True,
+        binary_projects=[],
+        kernel_pool_size=0,
+        kernel_cull_idle_timeout=0,
+        kernel_memory_limit=0,
+        kernel_max_count=0,
+        cling_modules=False,
+        cpu_target="",
+        kernel_allocator="glibc",
+        kernel_malloc_arena_max=0,
+        kernel_malloc_decay_ms=-1,
+        prefetch=True,
+        rpath=True,
+        ninja_log_path="",
     ):
         """Set up the basic configuration of all projects in the container. There are only a few exceptions in the dev-stage, see gen_devel_stage().
 
@@ -62,6 +113,52 @@ class XCC_gen:
         :type gen_args: str
         :param build_libcxx: Build the whole stack with libc++. Also add the libc++ and libc++abi projects to the llvm build.
         :type build_libcxx: bool
+        :param cuda_cache_path: Set CUDA_CACHE_PATH in the CUDA kernelspecs (e.g. ${HOME}/.cache/xeus-cling-cuda/ComputeCache). If empty, the variable is not set.
+        :type cuda_cache_path: str
+        :param cuda_cache_maxsize: Set CUDA_CACHE_MAXSIZE in bytes in the CUDA kernelspecs (0 for driver default).
+        :type cuda_cache_maxsize: int
+        :param cuda_cache_warmup: Install the script xcc-warm-cuda-cache to populate the CUDA cache at first run.
+        :type cuda_cache_warmup: bool
+        :param bytecode_optimize: Optimization levels of the python bytecode, which is compiled ahead of time (empty list to disable).
+        :type bytecode_optimize: List[int]
+        :param miniconda_cleanup: Reduce the size of the miniconda installation after all installations.
+        :type miniconda_cleanup: bool
+        :param linker: linker of all projects: 'gold', 'lld' or 'default'
+        :type linker: str
+        :param tmpfs_size: size of the tmpfs in GB for builds, projects which does not fit are built in build_prefix (0 to disable)
+        :type tmpfs_size: float
+        :param tmpfs_path: build folder in the tmpfs
+        :type tmpfs_path: str
+        :param incremental: reuse the source and build folders of a previous build (requires keep_build)
+        :type incremental: bool
+        :param slim_build: build the projects without tests, documentation, benchmarks and examples
+        :type slim_build: bool
+        :param binary_projects: names of the projects, which are installed as prebuilt conda-forge packages instead of building from source
+        :type binary_projects: List[str]
+        :param kernel_pool_size: number of prestarted xeus-cling kernels per kernelspec in the release container (0 to disable)
+        :type kernel_pool_size: int
+        :param kernel_cull_idle_timeout: shut down kernels, which are idle for the given seconds (0 to disable)
+        :type kernel_cull_idle_timeout: int
+        :param kernel_memory_limit: memory limit of each kernel in GB (0 to disable)
+        :type kernel_memory_limit: float
+        :param kernel_max_count: maximum number of running kernels per jupyter server (0 to disable)
+        :type kernel_max_count: int
+        :param cling_modules: prebuild a C++ module of the standard library, which is imported by the kernels at startup
+        :type cling_modules: bool
+        :param cpu_target: x86-64 microarchitecture level (e.g. x86-64-v3) or -march value of all C/C++ builds and kernels (empty for generic x86-64)
+        :type cpu_target: str
+        :param kernel_allocator: memory allocator of the kernels: 'glibc', 'jemalloc' or 'mimalloc'
+        :type kernel_allocator: str
+        :param kernel_malloc_arena_max: maximum number of malloc arenas of the kernels (0 for allocator default)
+        :type kernel_malloc_arena_max: int
+        :param kernel_malloc_decay_ms: time until unused memory is returned to the system by jemalloc and mimalloc (-1 for allocator default)
+        :type kernel_malloc_decay_ms: int
+        :param prefetch: download all sources concurrently in a single step before the first project build
+        :type prefetch: bool
+        :param rpath: set relative RPATHs and register the library folders with ldconfig instead of extending LD_LIBRARY_PATH
+        :type rpath: bool
+        :param ninja_log_path: folder, in which the ninja logs and dependency graphs of the Ninja builds are stored (if empty, the logs are not stored)
+        :type ninja_log_path: str
 
         """
         self.config = xcc.config.XCC_Config(
@@ -75,6 +172,29 @@ class XCC_gen:
             build_libcxx=bool(build_libcxx),
             clang_version=clang_version,
             gen_args=gen_args,
+            cuda_cache_path=cuda_cache_path,
+            cuda_cache_maxsize=cuda_cache_maxsize,
+            cuda_cache_warmup=cuda_cache_warmup,
+            bytecode_optimize=bytecode_optimize,
+            miniconda_cleanup=miniconda_cleanup,
+            linker=linker,
+            tmpfs_size=tmpfs_size,
+            tmpfs_path=tmpfs_path,
+            incremental=incremental,
+            slim_build=slim_build,
+            binary_projects=binary_projects,
+            kernel_pool_size=kernel_pool_size,
+            kernel_cull_idle_timeout=kernel_cull_idle_timeout,
+            kernel_memory_limit=kernel_memory_limit,
+            kernel_max_count=kernel_max_count,
+            cling_modules=cling_modules,
+            cpu_target=cpu_target,
+            kernel_allocator=kernel_allocator,
+            kernel_malloc_arena_max=kernel_malloc_arena_max,
+            kernel_malloc_decay_ms=kernel_malloc_decay_ms,
+            prefetch=prefetch,
+            rpath=rpath,
+            ninja_log_path=ninja_log_path,
         )
 
         # the list contains all projects with properties that are built and
@@ -82,6 +202,13 @@ class XCC_gen:
         # the list contains dictionaries with at least two entries: name and tag
         # * name is a unique identifier
         # * tag describes which build function must be used
+        # optional, the entry can have a slim profile:
+        # * slim_opts are additional build arguments, which disable tests,
+        #   docs, benchmarks and examples if config.slim_build is true
+        # optional, the entry can have a prebuilt binary:
+        # * conda is the pinned conda-forge package of the project
+        # * provider is 'conda', if the project is in config.binary_projects,
+        #   otherwise 'source'
         # the order of the list is important for the build steps
         self.project_list = []  # type: ignore
 
@@ -93,12 +220,32 @@ class XCC_gen:
         # needs pip
         self.project_list.append({"name": "miniconda3", "tag": "miniconda"})
 
-        self.project_list.append({"name": "cling", "tag": "cling"})
+        # requires nodejs from the miniconda installation
+        self.project_list.append({"name": "jupyterlab", "tag": "jupyterlab"})
+
+        self.project_list.append(
+            {
+                "name": "cling",
+                "tag": "cling",
+                "slim_opts": [
+                    "-DLLVM_INCLUDE_TESTS=OFF",
+                    "-DLLVM_INCLUDE_EXAMPLES=OFF",
+                    "-DLLVM_INCLUDE_DOCS=OFF",
+                    "-DLLVM_INCLUDE_BENCHMARKS=OFF",
+                    "-DCLANG_INCLUDE_TESTS=OFF",
+                    "-DCLANG_INCLUDE_DOCS=OFF",
+                ],
+            }
+        )
 
         #######################################################################
         # xeus dependencies
         #######################################################################
-        self.project_list.append({"name": "openssl", "tag": "openssl"})
+        # the slim build also installs only the software without the
+        # documentation (make install_sw)
+        self.project_list.append(
+            {"name": "openssl", "tag": "openssl", "slim_opts": ["no-tests"]}
+        )
 
         self.add_git_cmake_entry(
             name="libzmq",
@@ -110,24 +257,33 @@ class XCC_gen:
                 "-DENABLE_CPACK=OFF",
                 "-DCMAKE_BUILD_TYPE=" + build_type,
             ],
+            slim_opts=["-DBUILD_TESTS=OFF", "-DWITH_DOCS=OFF"],
+            conda="zeromq=4.2.5",
         )
         self.add_git_cmake_entry(
             name="cppzmq",
             url="https://github.com/zeromq/cppzmq.git",
             branch="v4.3.0",
             opts=["-DCMAKE_BUILD_TYPE=" + build_type],
+            slim_opts=["-DCPPZMQ_BUILD_TESTS=OFF"],
+            conda="cppzmq=4.3.0",
+            conda_depends=["libzmq"],
         )
         self.add_git_cmake_entry(
             name="nlohmann_json",
             url="https://github.com/nlohmann/json.git",
             branch="v3.7.0",
             opts=["-DCMAKE_BUILD_TYPE=" + build_type],
+            slim_opts=["-DJSON_BuildTests=OFF"],
+            conda="nlohmann_json=3.7.0",
         )
         self.add_git_cmake_entry(
             name="xtl",
             url="https://github.com/QuantStack/xtl.git",
             branch="0.6.9",
             opts=["-DCMAKE_BUILD_TYPE=" + build_type],
+            slim_opts=["-DBUILD_TESTS=OFF", "-DDOWNLOAD_GTEST=OFF"],
+            conda="xtl=0.6.9",
         )
         self.add_git_cmake_entry(
             name="xeus",
@@ -138,6 +294,9 @@ class XCC_gen:
                 "-DDISABLE_ARCH_NATIVE=ON",
                 "-DCMAKE_BUILD_TYPE=" + build_type,
             ],
+            slim_opts=["-DBUILD_TESTS=OFF"],
+            conda="xeus=0.23.3",
+            conda_depends=["libzmq", "cppzmq", "nlohmann_json", "xtl"],
         )
 
         #######################################################################
@@ -151,12 +310,16 @@ class XCC_gen:
                 "-DCMAKE_BUILD_TYPE=" + build_type,
                 "-DCMAKE_POSITION_INDEPENDENT_CODE=ON",
             ],
+            slim_opts=["-DBUILD_TESTS=OFF"],
+            conda="pugixml=1.8.1",
         )
         self.add_git_cmake_entry(
             name="cxxopts",
             url="https://github.com/jarro2783/cxxopts.git",
             branch="v2.2.0",
             opts=["-DCMAKE_BUILD_TYPE=" + build_type],
+            slim_opts=["-DCXXOPTS_BUILD_EXAMPLES=OFF", "-DCXXOPTS_BUILD_TESTS=OFF"],
+            conda="cxxopts=2.2.0",
         )
         self.project_list.append(
             {
@@ -164,6 +327,7 @@ class XCC_gen:
                 "tag": "xeus-cling",
                 "url": "https://github.com/QuantStack/xeus-cling.git",
                 "branch": "0.8.0",
+                "slim_opts": ["-DBUILD_TESTS=OFF"],
             }
         )
 
@@ -174,6 +338,9 @@ class XCC_gen:
             url="https://github.com/QuantStack/xproperty.git",
             branch="0.8.1",
             opts=["-DCMAKE_BUILD_TYPE=" + build_type],
+            slim_opts=["-DBUILD_TESTS=OFF"],
+            conda="xproperty=0.8.1",
+            conda_depends=["xtl"],
         )
 
         self.add_git_cmake_entry(
@@ -181,10 +348,30 @@ class XCC_gen:
             url="https://github.com/QuantStack/xwidgets.git",
             branch="0.19.0",
             opts=["-DCMAKE_BUILD_TYPE=" + build_type],
+            slim_opts=["-DBUILD_TESTS=OFF"],
+            conda="xwidgets=0.19.0",
+            conda_depends=["nlohmann_json", "xtl", "xeus", "xproperty"],
         )
 
+        # have to be after all conda and pip installations
+        self.project_list.append(
+            {"name": "miniconda_cleanup", "tag": "miniconda_cleanup"}
+        )
+
+        # have to be after all python installations
+        self.project_list.append({"name": "python_bytecode", "tag": "python_bytecode"})
+
+        self.__set_provider()
+
     def add_git_cmake_entry(
-        self, name: str, url: str, branch: str, opts: List[str] = []
+        self,
+        name: str,
+        url: str,
+        branch: str,
+        opts: List[str] = [],
+        slim_opts: List[str] = [],
+        conda: str = "",
+        conda_depends: List[str] = [],
     ):
         """add git-and-cmake entry to self.project_list.
 
@@ -192,7 +379,10 @@ class XCC_gen:
           {'name' : name,
           'url' : url,
           'branch' : branch,
-          'opts' : opts}
+          'opts' : opts,
+          'slim_opts' : slim_opts,
+          'conda' : conda,
+          'conda_depends' : conda_depends}
 
         :param name: name of the project
         :type name: str
@@ -202,6 +392,12 @@ class XCC_gen:
         :type branch: str
         :param opts: a list of CMAKE arguments (e.g. -DCMAKE_BUILD_TYPE=RELEASE)
         :type opts: [str]
+        :param slim_opts: a list of CMAKE arguments, which are only used for slim builds (e.g. -DBUILD_TESTS=OFF)
+        :type slim_opts: [str]
+        :param conda: pinned conda-forge package, which can be installed instead of the source build (e.g. xtl=0.6.9)
+        :type conda: str
+        :param conda_depends: names of the projects, which the conda package installs as dependencies
+        :type conda_depends: [str]
         """
         if self.config.build_libcxx:
             opts = add_libcxx_cmake_arg(opts)
@@ -213,59 +409,244 @@ class XCC_gen:
                 "url": url,
                 "branch": branch,
                 "opts": opts,
+                "slim_opts": slim_opts,
+                "conda": conda,
+                "conda_depends": conda_depends,
             }
         )
 
+    def __set_provider(self):
+        """Set the provider of all project_list entries, which have a prebuilt conda package.
+
+        """
+        for name in self.config.binary_projects:
+            entries = [p for p in self.project_list if p["name"] == name]
+            if not entries or not entries[0].get("conda"):
+                raise ValueError(
+                    "there is no prebuilt conda package for the project: " + name
+                )
+            # the conda package installs its dependencies in the miniconda
+            # installation, a second version from source would be found via
+            # CMAKE_PREFIX_PATH
+            missing = [
+                d
+                for d in entries[0].get("conda_depends", [])
+                if d not in self.config.binary_projects
+            ]
+            if missing:
+                raise ValueError(
+                    "the conda package of "
+                    + name
+                    + " installs "
+                    + ", ".join(missing)
+                    + " as dependencies, add them to the prebuilt conda packages"
+                )
+
+        for p in self.project_list:
+            if p.get("conda"):
+                if p["name"] in self.config.binary_projects:
+                    p["provider"] = "conda"
+                else:
+                    p["provider"] = "source"
+
     def gen_devel_stage(
-        self, project_path: str, dual_build_type: str = ""
+        self,
+        project_path: str,
+        dual_build_type: str = "",
+        project_storage: str = "host",
+        scratch_path: str = "/tmp/$USER/xcc_build",
+        code_index: bool = False,
     ) -> hpccm.Stage:
         """Get a recipe for the development stack. The build process is divided into two parts. The first is building the container. The container contains all software parts that should not be changed during development. The second part contains a runscript that downloads and build the software parts that can be modified, e.g. cling.
 
-        :param project_path: Path on the host system on which the modifiable software projects live
+        :param project_path: Path on the host system on which the modifiable software projects live. Not used for the overlay storage.
         :type project_path: str
         :param dual_build_type: If you want to build cling and xeus-cling a second time with different CMake build type. Set the CMake build type, for example RELEASE
         :type dual_build_type: str
+        :param project_storage: Storage of the sources and build trees (see supported_project_storage). Network file systems are slow for the millions of small files of the LLVM build. 'overlay' stores everything in a singularity overlay image (see gen_overlay_script()). 'scratch' builds in scratch_path and installs in project_path.
+        :type project_storage: str
+        :param scratch_path: node-local build folder of the scratch storage, evaluated by the shell at runtime
+        :type scratch_path: str
+        :param code_index: The runscript merges the compile databases of all cling and xeus-cling builds and builds a clangd index in the project path (see xcc.clangd.build_code_index()). The clangd indexer is built in the container (see xcc.clangd.build_clangd_indexer()).
+        :type code_index: bool
         :returns: hpccm Stage
         :rtype: hpccm.Stage
 
         """
-        stage0 = gen_base_stage(self.config)
+        if project_storage not in supported_project_storage:
+            raise ValueError(
+                "project_storage have to be: " + ", ".join(supported_project_storage)
+            )
+
+        # the miniconda installation of the dev container is created by the
+        # runscript, but the dependencies are required to build the container
+        if self.config.binary_projects:
+            raise ValueError(
+                "prebuilt conda packages are only supported by the release container"
+            )
+
+        if project_storage == "overlay":
+            project_path = overlay_project_path
+
+        # each recipe works on its own copy of the config, therefore a
+        # generator object can create several recipes
+        config = self.config.get_copy()
+        config.paths_to_delete = []
+
+        stage0 = gen_base_stage(config)
+        if code_index:
+            stage0 += packages(ospackages=["clangd-" + str(config.clang_version)])
         # set the path to the changeable project as environment variable
         stage0 += environment(variables={"XCC_PROJECT_PATH": project_path})
 
+        # the mount point of the project path in the overlay image
+        if project_storage == "overlay":
+            stage0 += shell(
+                commands=["mkdir -p " + project_path, "chmod 777 " + project_path]
+            )
+
+        self.__gen_devel_builds(
+            stage=stage0,
+            config=config,
+            project_path=project_path,
+            dual_build_type=dual_build_type,
+            project_storage=project_storage,
+            scratch_path=scratch_path,
+            code_index=code_index,
+        )
+        return stage0
+
+    def gen_devel_build_stage(
+        self, project_path: str, dual_build_type: str = "", code_index: bool = False
+    ) -> hpccm.Stage:
+        """Get only the project builds, the cleanup and the runscript of the dev recipe, without the base image, system packages and compiler of the base stage. The stage is not a complete recipe. It is used by xcc.harness to execute the build steps and the runscript in a sandbox.
+
+        :param project_path: Path on the host system on which the modifiable software projects live.
+        :type project_path: str
+        :param dual_build_type: If you want to build cling and xeus-cling a second time with different CMake build type. Set the CMake build type, for example RELEASE
+        :type dual_build_type: str
+        :param code_index: Build the clangd indexer and the code index (see gen_devel_stage()).
+        :type code_index: bool
+        :returns: hpccm Stage
+        :rtype: hpccm.Stage
+
+        """
+        if self.config.binary_projects:
+            raise ValueError(
+                "prebuilt conda packages are only supported by the release container"
+            )
+
+        config = self.config.get_copy()
+        config.paths_to_delete = []
+
+        hpccm.config.set_container_format(config.container)
+        stage0 = hpccm.Stage()
+
+        self.__gen_devel_builds(
+            stage=stage0,
+            config=config,
+            project_path=project_path,
+            dual_build_type=dual_build_type,
+            code_index=code_index,
+        )
+
+        return stage0
+
+    def __gen_devel_builds(
+        self,
+        stage: hpccm.Stage,
+        config: xcc.config.XCC_Config,
+        project_path: str,
+        dual_build_type: str = "",
+        project_storage: str = "host",
+        scratch_path: str = "/tmp/$USER/xcc_build",
+        code_index: bool = False,
+    ):
+        """Add the project builds, the cleanup and the runscript of the dev recipe to the stage (see gen_devel_stage()).
+
+        :param stage: hpccm stage in which the instructions are added
+        :type stage: hpccm.Stage
+        :param config: Configuration object of the recipe, collects the paths to delete
+        :type config: xcc.config.XCC_Config
+        :param project_path: Path on which the modifiable software projects live.
+        :type project_path: str
+        :param dual_build_type: CMake build type of the second cling and xeus-cling build, empty for a single build
+        :type dual_build_type: str
+        :param project_storage: Storage of the sources and build trees (see supported_project_storage)
+        :type project_storage: str
+        :param scratch_path: node-local build folder of the scratch storage, evaluated by the shell at runtime
+        :type scratch_path: str
+        :param code_index: The container contains the clangd indexer and the runscript merges the compile databases and builds a clangd index.
+        :type code_index: bool
+
+        """
         # the following projects are being built outside the container
         self.__gen_project_builds(
-            stage=stage0,
-            exclude_list=["cling", "xeus-cling", "miniconda", "jupyter_kernel"],
+            stage=stage,
+            config=config,
+            exclude_list=[
+                "cling",
+                "xeus-cling",
+                "miniconda",
+                "jupyterlab",
+                "jupyter_kernel",
+                "miniconda_cleanup",
+                "python_bytecode",
+            ],
+            code_index=code_index,
         )
 
-        if not self.config.keep_build:
+        if not config.keep_build:
             r = rm()
-            stage0 += shell(
-                commands=[r.cleanup_step(items=self.config.paths_to_delete)]
-            )
+            stage += shell(commands=[r.cleanup_step(items=config.paths_to_delete)])
 
-        stage0 += raw(docker="EXPOSE 8888")
+        stage += raw(docker="EXPOSE 8888")
 
-        runscript_config = self.config.get_copy()
+        runscript_config = config.get_copy()
         runscript_config.build_prefix = project_path
         runscript_config.install_prefix = project_path
         runscript_config.second_build_type = dual_build_type
         runscript_config.keep_build = True
+        # the tmpfs is only used for the builds of the container image, the
+        # runscript keeps its builds in the project path
+        runscript_config.tmpfs_size = 0
+        # the kernel pool is only installed in the release container
+        runscript_config.kernel_pool_size = 0
+        # the runscript downloads the sources at runtime
+        runscript_config.prefetch = False
 
         cm_runscript: List[str] = []
+
+        if project_storage == "overlay":
+            # the container is read-only, if the overlay image is not mounted
+            cm_runscript += [
+                "if ! touch " + project_path + "/.xcc_overlay 2> /dev/null; then",
+                "    echo 'error: " + project_path + " is not writable'",
+                "    echo 'run the container with: singularity run --overlay <image>.img <recipe>.sif'",
+                "    exit 1",
+                "fi",
+            ]
+        elif project_storage == "scratch":
+            # sources and build trees on the node-local storage
+            # installations in the project path
+            runscript_config.build_prefix = scratch_path
+            cm_runscript += [
+                "mkdir -p " + scratch_path,
+                "echo 'sources and build trees: " + scratch_path + "'",
+            ]
         # set clang as compiler
         cm_runscript += [
-            "export CC=clang-" + str(self.config.clang_version),
-            "export CXX=clang++-" + str(self.config.clang_version),
+            "export CC=clang-" + str(config.clang_version),
+            "export CXX=clang++-" + str(config.clang_version),
         ]
 
         ##################################################################
         # miniconda
         ##################################################################
-        cm, env = build_miniconda(config=runscript_config)
-        stage0 += environment(variables=env)
+        (cm, env), _ = pure_step(build_miniconda, runscript_config)
+        stage += environment(variables=env)
         cm_runscript += cm
+        cm_runscript += pure_step(build_jupyterlab_assets, runscript_config)[0]
 
         ##################################################################
         # cling
@@ -273,14 +654,16 @@ class XCC_gen:
         # the default behavior is PREFIX=/usr/local/ -> install to /usr/local/bin ...
         # for development it is better to install to project_path/install
         # if the second build is activated, two different installation folders will be created automatically
-        cm = build_cling(
+        # no slim profile for cling and xeus-cling, because the tests are
+        # required for the development
+        cm_runscript += pure_step(
+            build_cling,
+            runscript_config,
             cling_url=self.cling_url,
             cling_branch=self.cling_branch,
             cling_hash=self.cling_hash,
-            config=runscript_config,
             git_cling_opts=[""],
-        )
-        cm_runscript += cm
+        )[0]
 
         ##################################################################
         # xeus-cling
@@ -289,14 +672,66 @@ class XCC_gen:
             if p["name"] == "xeus-cling":
                 xc = p
 
-        cm_runscript += build_xeus_cling(
-            url=xc["url"], branch=xc["branch"], config=runscript_config,
-        )
+        cm_runscript += pure_step(
+            build_xeus_cling, runscript_config, url=xc["url"], branch=xc["branch"],
+        )[0]
 
-        cm_runscript += build_dev_jupyter_kernel(config=runscript_config)
+        cm_runscript += pure_step(build_dev_jupyter_kernel, runscript_config)[0]
 
-        stage0 += runscript(commands=cm_runscript)
-        return stage0
+        if code_index:
+            cm_runscript += pure_step(
+                build_code_index,
+                runscript_config,
+                indexer=get_clangd_indexer_path(config),
+            )[0]
+
+        stage += runscript(commands=cm_runscript)
+
+    def gen_overlay_script(
+        self, overlay_image: str, overlay_size: int, container_image: str
+    ) -> str:
+        """Returns a shell script for the host system, which creates the overlay image of the dev container and runs the runscript with the overlay image. Is required if gen_devel_stage() uses the overlay storage.
+
+        :param overlay_image: path of the overlay image
+        :type overlay_image: str
+        :param overlay_size: size of the overlay image in MB
+        :type overlay_size: int
+        :param container_image: path of the dev container image (.sif)
+        :type container_image: str
+        :returns: shell script
+        :rtype: str
+
+        """
+        lines = [
+            "#!/bin/bash",
+            "# create the ext3 overlay image for the sources and build trees of the",
+            "# xeus-cling-cuda dev container, if it does not exist",
+            "if [ ! -f " + overlay_image + " ]; then",
+            "    if singularity overlay create --help > /dev/null 2>&1; then",
+            "        singularity overlay create --size "
+            + str(overlay_size)
+            + " "
+            + overlay_image,
+            "    else",
+            "        # singularity < 3.8",
+            "        mkdir -p overlay_tmp/upper overlay_tmp/work",
+            "        dd if=/dev/zero of="
+            + overlay_image
+            + " bs=1M count=0 seek="
+            + str(overlay_size),
+            "        mkfs.ext3 -F -d overlay_tmp " + overlay_image,
+            "        rm -rf overlay_tmp",
+            "    fi",
+            "fi",
+            "# download and build cling and xeus-cling in the overlay image",
+            "singularity run --overlay " + overlay_image + " " + container_image,
+            "# use the container with: singularity exec --nv --overlay "
+            + overlay_image
+            + ":ro "
+            + container_image
+            + " jupyter-lab",
+        ]
+        return "\n".join(lines) + "\n"
 
     def gen_release_single_stage(self) -> hpccm.Stage:
         """Get a release recipe for the stack. The stack contains a single stage. Requires a little more memory on singularity and much on docker, but it is less error prone.
@@ -305,76 +740,328 @@ class XCC_gen:
         :rtype: hpccm.Stage
 
         """
-        stage0 = gen_base_stage(self.config)
+        # each recipe works on its own copy of the config, therefore a
+        # generator object can create several recipes
+        config = self.config.get_copy()
+        config.paths_to_delete = []
 
-        self.__gen_project_builds(stage=stage0)
+        stage0 = gen_base_stage(config)
 
-        if not self.config.keep_build:
-            r = rm()
-            stage0 += shell(
-                commands=[r.cleanup_step(items=self.config.paths_to_delete)]
-            )
+        self.__gen_release_builds(stage=stage0, config=config)
 
         stage0 += raw(docker="EXPOSE 8888")
 
         return stage0
 
-    def __gen_project_builds(self, stage: hpccm.Stage, exclude_list=[]):
-        """Add build instructions to the stage of the various projects contained in self.project_list
+    def gen_release_build_stage(self) -> hpccm.Stage:
+        """Get only the project builds and the cleanup of the release recipe, without the base image, system packages and compiler of the base stage. The stage is not a complete recipe. It is used by xcc.harness to execute the build steps in a sandbox.
+
+        :returns: hpccm Stage
+        :rtype: hpccm.Stage
+
+        """
+        config = self.config.get_copy()
+        config.paths_to_delete = []
+
+        hpccm.config.set_container_format(config.container)
+        stage0 = hpccm.Stage()
+
+        self.__gen_release_builds(stage=stage0, config=config)
+
+        return stage0
+
+    def __gen_release_builds(self, stage: hpccm.Stage, config: xcc.config.XCC_Config):
+        """Add the project builds and the cleanup of the release recipe to the stage.
+
+        :param stage: hpccm stage in which the instructions are added
+        :type stage: hpccm.Stage
+        :param config: Configuration object of the recipe, collects the paths to delete
+        :type config: xcc.config.XCC_Config
+
+        """
+        self.__gen_project_builds(stage=stage, config=config)
+
+        if config.rpath:
+            stage += shell(commands=self.__step(build_ld_config, config))
+
+        if not config.keep_build:
+            r = rm()
+            stage += shell(commands=[r.cleanup_step(items=config.paths_to_delete)])
+
+    def __step(self, builder, config: xcc.config.XCC_Config, **kwargs):
+        """Call the step builder via pure_step() and append the paths to delete to the config of the recipe.
+
+        :param builder: step builder, e.g. build_cling
+        :type builder: Callable
+        :param config: Configuration object of the recipe
+        :type config: xcc.config.XCC_Config
+        :returns: result of the builder
+
+        """
+        result, paths_to_delete = pure_step(
+            builder, config, prefetch_sources=config.prefetch_sources, **kwargs
+        )
+        config.paths_to_delete += paths_to_delete
+        return result
+
+    def __get_slim_opts(self, project: Dict, config: xcc.config.XCC_Config) -> List[str]:
+        """Returns the slim build arguments of a project_list entry, if config.slim_build is true.
+
+        :param project: entry of self.project_list
+        :type project: Dict
+        :param config: Configuration object of the recipe
+        :type config: xcc.config.XCC_Config
+        :returns: list of build arguments
+        :rtype: List[str]
+
+        """
+        if not config.slim_build:
+            return []
+        return project.get("slim_opts", [])
+
+    def __get_disk_estimate(self, config: xcc.config.XCC_Config, name: str) -> float:
+        """Returns the estimated size of the sources and build folders of a project (see xcc.planner).
+
+        :param config: Configuration object of the recipe
+        :type config: xcc.config.XCC_Config
+        :param name: name of the project
+        :type name: str
+        :returns: size in GB
+        :rtype: float
+
+        """
+        cost_table = xcc.planner.load_cost_table()
+        disk_gb = 0.0
+        build_types = [config.build_type]
+        # only cling and xeus-cling support a dual build
+        if config.second_build_type and name in ["cling", "xeus-cling"]:
+            build_types.append(config.second_build_type)
+        for build_type in build_types:
+            disk_gb += xcc.planner.get_project_costs(cost_table, name, build_type)[
+                "disk_gb"
+            ]
+
+        return disk_gb
+
+    def __project_step(
+        self, builder, config: xcc.config.XCC_Config, project_name: str, **kwargs
+    ):
+        """Call the step builder of a project with sources and build folders. If the project fits in the tmpfs, it is built in config.tmpfs_path and the folders are removed directly after the installation. If there is not enough free memory in the tmpfs at build time, config.tmpfs_path is linked to a folder in config.build_prefix.
+
+        :param builder: step builder, e.g. build_cling
+        :type builder: Callable
+        :param config: Configuration object of the recipe
+        :type config: xcc.config.XCC_Config
+        :param project_name: name of the project
+        :type project_name: str
+        :returns: result of the builder
+
+        """
+        disk_gb = self.__get_disk_estimate(config, project_name)
+        if not config.tmpfs_size or disk_gb > config.tmpfs_size:
+            return self.__step(builder, config, **kwargs)
+
+        step_config = config.get_copy()
+        step_config.build_prefix = config.tmpfs_path
+        sources: List[Dict[str, str]] = []
+        result, paths_to_delete = pure_step(
+            builder, step_config, prefetch_sources=sources, **kwargs
+        )
+
+        spill_path = config.build_prefix + "/xcc_tmpfs_spill"
+        if spill_path not in config.paths_to_delete:
+            config.paths_to_delete.append(spill_path)
+
+        # the tmpfs is cleared before the build, therefore the sources are
+        # prefetched to the disk and moved into the tmpfs afterwards
+        staging_path = config.build_prefix + "/xcc_tmpfs_prefetch"
+        move_sources = []
+        for source in sources:
+            if not any(
+                source["path"].startswith(s["path"] + "/") for s in sources
+            ):
+                move_sources.append(
+                    "mkdir -p $(dirname "
+                    + source["path"]
+                    + ") && mv "
+                    + source["path"].replace(config.tmpfs_path, staging_path, 1)
+                    + " "
+                    + source["path"]
+                )
+            config.prefetch_sources.append(
+                {
+                    k: v.replace(config.tmpfs_path, staging_path)
+                    for k, v in source.items()
+                }
+            )
+        if sources and staging_path not in config.paths_to_delete:
+            config.paths_to_delete.append(staging_path)
+
+        required_kb = int(disk_gb * 1024 * 1024)
+        pre = [
+            "",
+            "#// tmpfs build of " + project_name,
+            "rm -rf " + config.tmpfs_path,
+            "mkdir -p $(dirname " + config.tmpfs_path + ")",
+            "if [ $(df -Pk $(dirname "
+            + config.tmpfs_path
+            + ") | awk 'NR==2 {print $4}') -ge "
+            + str(required_kb)
+            + " ]; then",
+            "    mkdir -p " + config.tmpfs_path,
+            "else",
+            "    echo 'not enough memory in the tmpfs, build " + project_name + " on disk'",
+            "    mkdir -p " + spill_path,
+            "    ln -s " + spill_path + " " + config.tmpfs_path,
+            "fi",
+        ] + move_sources
+        post = [
+            "rm -rf " + " ".join(paths_to_delete),
+            "rm -rf " + config.tmpfs_path,
+        ]
+
+        if isinstance(result, tuple):
+            return (pre + result[0] + post,) + result[1:]
+        return pre + result + post
+
+    def __gen_project_builds(
+        self,
+        stage: hpccm.Stage,
+        config: xcc.config.XCC_Config,
+        exclude_list=[],
+        code_index: bool = False,
+    ):
+        """Add build instructions to the stage of the various projects contained in self.project_list. If config.prefetch is true, a prefetch step, which downloads the sources of all projects concurrently, is added before the first build.
 
         :param stage: hpccm stage in which the instructions are added
         :type stage: hpccm.Stage
+        :param config: Configuration object of the recipe, collects the paths to delete
+        :type config: xcc.config.XCC_Config
         :param exclude_list: List of names, which will skipped. Can be used when a project is added otherwise.
         :type exclude_list: [str]
+        :param code_index: build the clangd indexer of the dev container (see xcc.clangd.build_clangd_indexer())
+        :type code_index: bool
 
         """
+        conda_packages = [
+            p["conda"]
+            for p in self.project_list
+            if p.get("provider") == "conda" and p["name"] not in exclude_list
+        ]
+
+        # the builds are collected first, because the step builders register
+        # the sources of the prefetch step
+        layers: List[Union[shell, environment]] = []
+
         for p in self.project_list:
-            if p["tag"] == "cling":
+            if p.get("provider") == "conda":
+                # install all prebuilt packages in a single conda transaction
+                # at the position of the first one
+                if conda_packages and p["name"] not in exclude_list:
+                    layers.append(
+                        shell(
+                            commands=self.__step(
+                                build_conda_packages, config, packages=conda_packages
+                            )
+                        )
+                    )
+                    conda_packages = []
+            elif p["tag"] == "cling":
                 if "cling" not in exclude_list:
-                    stage += shell(
-                        commands=build_cling(
-                            cling_url=self.cling_url,
-                            cling_branch=self.cling_branch,
-                            cling_hash=self.cling_hash,
-                            config=self.config,
+                    layers.append(
+                        shell(
+                            commands=self.__project_step(
+                                build_cling,
+                                config,
+                                "cling",
+                                cling_url=self.cling_url,
+                                cling_branch=self.cling_branch,
+                                cling_hash=self.cling_hash,
+                                opts=self.__get_slim_opts(p, config),
+                            )
                         )
                     )
             elif p["tag"] == "xeus-cling":
                 if "xeus-cling" not in exclude_list:
-                    stage += shell(
-                        commands=build_xeus_cling(
-                            url=p["url"], branch=p["branch"], config=self.config,
+                    layers.append(
+                        shell(
+                            commands=self.__project_step(
+                                build_xeus_cling,
+                                config,
+                                "xeus-cling",
+                                url=p["url"],
+                                branch=p["branch"],
+                                opts=self.__get_slim_opts(p, config),
+                            )
                         )
                     )
             elif p["tag"] == "git_cmake":
                 if p["name"] not in exclude_list:
-                    stage += shell(
-                        commands=build_git_and_cmake(
-                            name=p["name"],
-                            url=p["url"],
-                            branch=p["branch"],
-                            config=self.config,
-                            opts=p["opts"],
+                    layers.append(
+                        shell(
+                            commands=self.__project_step(
+                                build_git_and_cmake,
+                                config,
+                                p["name"],
+                                name=p["name"],
+                                url=p["url"],
+                                branch=p["branch"],
+                                opts=p["opts"] + self.__get_slim_opts(p, config),
+                            )
                         )
                     )
             elif p["tag"] == "openssl":
                 if "openssl" not in exclude_list:
-                    shc, env = build_openssl(name="openssl-1.1.1c", config=self.config,)
-                    stage += shell(commands=shc)
-                    stage += environment(variables=env)
+                    shc, env = self.__project_step(
+                        build_openssl,
+                        config,
+                        "openssl",
+                        name="openssl-1.1.1c",
+                        opts=self.__get_slim_opts(p, config),
+                    )
+                    layers.append(shell(commands=shc))
+                    layers.append(environment(variables=env))
             elif p["tag"] == "miniconda":
                 if "miniconda" not in exclude_list:
-                    shc, env = build_miniconda(config=self.config,)
-                    stage += shell(commands=shc)
-                    stage += environment(variables=env)
+                    shc, env = self.__step(build_miniconda, config)
+                    layers.append(shell(commands=shc))
+                    layers.append(environment(variables=env))
+            elif p["tag"] == "jupyterlab":
+                if "jupyterlab" not in exclude_list:
+                    layers.append(
+                        shell(commands=self.__step(build_jupyterlab_assets, config))
+                    )
             elif p["tag"] == "jupyter_kernel":
                 if "jupyter_kernel" not in exclude_list:
-                    stage += shell(
-                        commands=build_rel_jupyter_kernel(config=self.config,)
+                    layers.append(
+                        shell(commands=self.__step(build_rel_jupyter_kernel, config))
+                    )
+            elif p["tag"] == "miniconda_cleanup":
+                if "miniconda_cleanup" not in exclude_list and config.miniconda_cleanup:
+                    layers.append(
+                        shell(commands=self.__step(build_miniconda_cleanup, config))
+                    )
+            elif p["tag"] == "python_bytecode":
+                if "python_bytecode" not in exclude_list and config.bytecode_optimize:
+                    layers.append(
+                        shell(commands=self.__step(build_python_bytecode, config))
                     )
             else:
                 raise ValueError("unknown tag: " + p["tag"])
 
+        if code_index:
+            layers.append(
+                shell(
+                    commands=self.__project_step(
+                        build_clangd_indexer, config, "clangd-indexer"
+                    )
+                )
+            )
+
+        if config.prefetch_sources:
+            stage += shell(commands=prefetch_step(config, config.prefetch_sources))
+        stage += layers
+
     def __str__(self):
         s = ""
         for p in self.project_list:
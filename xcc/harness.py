@@ -0,0 +1,719 @@
+"""Test harness, which executes the build steps of the release recipe in a
+sandbox against tiny fake projects. The git repositories are replaced by
+local bare repositories and the tarballs and installers are served by a local
+http server. The fake projects only install marker files, therefore a whole
+generate-and-execute check takes a few seconds.
+
+Only the project builds are executed (see
+xcc.generator.XCC_gen.gen_release_build_stage()). With a project path, the
+project builds and the runscript of the dev recipe are executed instead (see
+xcc.generator.XCC_gen.gen_devel_build_stage()). The base image, the system
+packages and the compiler are not checked. The host needs sh, git, cmake,
+make, tar and wget. If ninja is not installed, the Ninja builds are executed
+with Makefiles.
+
+"""
+
+from typing import Callable, Dict, List, Set, Tuple
+import functools
+import http.server
+import json
+import os
+import re
+import shlex
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+
+import xcc.clangd
+import xcc.generator
+import xcc.ldconfig
+
+# prefix of the lines in the output of the step script, which mark the start
+# and the end of a step
+step_marker = "@@xcc-harness"
+
+
+class HarnessError(Exception):
+    """The recipe could not be prepared or executed in the sandbox or the result is wrong."""
+
+
+def parse_recipe(recipe: str) -> List[Tuple[str, str]]:
+    """Split a singularity recipe in its sections.
+
+    :param recipe: singularity recipe
+    :type recipe: str
+    :returns: list of section names (e.g. post or environment) and the content of the section
+    :rtype: List[Tuple[str, str]]
+
+    """
+    sections = []  # type: List[Tuple[str, List[str]]]
+    for line in recipe.split("\n"):
+        if line.startswith("%"):
+            sections.append((line[1:].split()[0], []))
+        elif sections:
+            # hpccm indents the content of the sections with 4 spaces
+            sections[-1][1].append(line[4:] if line.startswith("    ") else line)
+    return [(name, "\n".join(lines).strip() + "\n") for name, lines in sections]
+
+
+def get_step_name(body: str) -> str:
+    """Returns the name of a step, which is the text of the first banner comment or the first command.
+
+    :param body: commands of the step
+    :type body: str
+    :returns: name of the step
+    :rtype: str
+
+    """
+    commands = []
+    for line in body.split("\n"):
+        line = line.strip()
+        if line.startswith("#//") and line.strip("#/ "):
+            return line.strip("#/ ")
+        if line and not line.startswith("#") and line not in ("cd /", "cd -"):
+            commands.append(line)
+    if not commands:
+        return "empty step"
+    return commands[0] if len(commands[0]) <= 60 else commands[0][:57] + "..."
+
+
+def find_sources(recipe: str) -> Tuple[Dict[str, Set[str]], Set[str]]:
+    """Find the git repositories and the downloaded files of a recipe.
+
+    :param recipe: recipe
+    :type recipe: str
+    :returns: git urls with the required branches and tags, urls of the other downloads
+    :rtype: Tuple[Dict[str, Set[str]], Set[str]]
+
+    """
+    repositories = {}  # type: Dict[str, Set[str]]
+    for args in re.findall(r"git clone\s([^;&|]*)", recipe):
+        tokens = args.split()
+        urls = [t for t in tokens if "://" in t]
+        if not urls:
+            continue
+        branches = repositories.setdefault(urls[0], set())
+        if "--branch" in tokens:
+            branches.add(tokens[tokens.index("--branch") + 1])
+    downloads = set(re.findall(r"(?:https?|ftp)://[^\s'\";]+", recipe)) - set(repositories)
+    return repositories, downloads
+
+
+def get_project_name(url: str) -> str:
+    """Returns the project name of a git url, e.g. cling for https://github.com/root-project/cling.git
+
+    :param url: git url
+    :type url: str
+    :returns: project name
+    :rtype: str
+
+    """
+    return os.path.splitext(os.path.basename(url.rstrip("/")))[0]
+
+
+def write_file(path: str, content: str, executable: bool = False):
+    """Write a text file and create the parent folders.
+
+    :param path: path of the file
+    :type path: str
+    :param content: content of the file
+    :type content: str
+    :param executable: set the executable bits
+    :type executable: bool
+
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    if executable:
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def gen_fake_project(name: str, path: str):
+    """Create the sources of a fake cmake project, which installs the marker file share/xcc-harness/<name>.
+    The install rules are in xcc-harness.cmake, that the llvm project can include them from tools/ and projects/.
+    The cling project also installs a bin/cling script and the sources of the jupyter kernel.
+    The llvm-project project contains the cmake project in the folder llvm and builds the target
+    clangd-indexer, which is a script, that writes a fake index.
+
+    :param name: project name
+    :type name: str
+    :param path: source folder
+    :type path: str
+
+    """
+    # the cmake project of the llvm monorepo is in the folder llvm
+    if name == "llvm-project":
+        path = os.path.join(path, "llvm")
+
+    rules = [
+        "install(FILES ${CMAKE_CURRENT_LIST_DIR}/"
+        + name
+        + " DESTINATION share/xcc-harness)",
+    ]
+    write_file(os.path.join(path, name), "fake project " + name + "\n")
+
+    if name == "cling":
+        write_file(
+            os.path.join(path, "cling"),
+            '#!/bin/sh\necho "fake cling $*"\n',
+            executable=True,
+        )
+        write_file(
+            os.path.join(path, "Jupyter", "kernel", "setup.py"),
+            "from setuptools import setup\n\nsetup(name='clingkernel')\n",
+        )
+        write_file(
+            os.path.join(path, "Jupyter", "kernel", "clingkernel.py"),
+            "def main():\n    pass\n",
+        )
+        rules += [
+            "install(PROGRAMS ${CMAKE_CURRENT_LIST_DIR}/cling DESTINATION bin)",
+            "install(DIRECTORY ${CMAKE_CURRENT_LIST_DIR}/Jupyter DESTINATION share/cling)",
+        ]
+
+    if name == "llvm":
+        # include the projects, which are cloned in the llvm source tree
+        rules += [
+            "foreach(sub tools/clang tools/cling projects/libcxx projects/libcxxabi)",
+            "  if(EXISTS ${CMAKE_CURRENT_LIST_DIR}/${sub}/xcc-harness.cmake)",
+            "    include(${CMAKE_CURRENT_LIST_DIR}/${sub}/xcc-harness.cmake)",
+            "  endif()",
+            "endforeach()",
+        ]
+
+    if name == "llvm-project":
+        write_file(
+            os.path.join(path, "clangd-indexer"),
+            '#!/bin/sh\necho "fake clangd index $*"\n',
+            executable=True,
+        )
+        rules += [
+            "add_custom_target(clangd-indexer",
+            "  COMMAND ${CMAKE_COMMAND} -E make_directory ${CMAKE_BINARY_DIR}/bin",
+            "  COMMAND ${CMAKE_COMMAND} -E copy ${CMAKE_CURRENT_LIST_DIR}/clangd-indexer ${CMAKE_BINARY_DIR}/bin/)",
+        ]
+
+    write_file(os.path.join(path, "xcc-harness.cmake"), "\n".join(rules) + "\n")
+    write_file(
+        os.path.join(path, "CMakeLists.txt"),
+        "cmake_minimum_required(VERSION 3.10)\n"
+        "project(" + name + " NONE)\n"
+        "include(${CMAKE_CURRENT_SOURCE_DIR}/xcc-harness.cmake)\n",
+    )
+
+
+def gen_fake_repository(name: str, branches: Set[str], work_path: str, bare_path: str) -> str:
+    """Create a bare git repository with a fake project. All branches point to the same commit.
+
+    :param name: project name
+    :type name: str
+    :param branches: branches and tags, which are cloned by the recipe
+    :type branches: Set[str]
+    :param work_path: folder of the working tree
+    :type work_path: str
+    :param bare_path: folder of the bare repository
+    :type bare_path: str
+    :returns: commit hash
+    :rtype: str
+
+    """
+    gen_fake_project(name, work_path)
+
+    def run_git(*args: str, cwd: str = work_path) -> str:
+        return subprocess.run(
+            ["git"] + list(args),
+            cwd=cwd,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=dict(
+                os.environ,
+                GIT_AUTHOR_NAME="xcc-harness",
+                GIT_AUTHOR_EMAIL="xcc-harness@localhost",
+                GIT_COMMITTER_NAME="xcc-harness",
+                GIT_COMMITTER_EMAIL="xcc-harness@localhost",
+            ),
+        ).stdout.decode()
+
+    run_git("init", "-q")
+    run_git("checkout", "-q", "-b", "master")
+    run_git("add", "-A")
+    run_git("commit", "-q", "-m", "fake project " + name)
+    for branch in sorted(branches):
+        run_git("branch", branch)
+    run_git("clone", "-q", "--bare", work_path, bare_path, cwd=os.path.dirname(work_path))
+    return run_git("rev-parse", "HEAD").strip()
+
+
+def gen_fake_download(url: str, www_path: str, python: str = sys.executable):
+    """Create a stand-in for a downloaded file in the folder of the http server.
+
+    * openssl-<version>.tar.gz: source tarball with a config script, which writes a Makefile with build_sw and install_sw targets
+    * Miniconda3-*.sh: installer, which creates a python venv with stubs of conda, pip, jupyter, jlpm and the used python modules
+
+    :param url: url of the file
+    :type url: str
+    :param www_path: folder of the http server
+    :type www_path: str
+    :param python: python interpreter of the fake miniconda installation
+    :type python: str
+
+    """
+    file_name = os.path.basename(url)
+    if re.match(r"openssl-.*\.tar\.gz$", file_name):
+        gen_fake_openssl(file_name[: -len(".tar.gz")], os.path.join(www_path, file_name))
+    elif re.match(r"Miniconda3-.*\.sh$", file_name):
+        write_file(
+            os.path.join(www_path, file_name), gen_fake_miniconda_installer(python), executable=True
+        )
+    else:
+        raise HarnessError("no stand-in for the download " + url)
+
+
+def gen_fake_openssl(directory: str, tarball: str):
+    """Create a fake openssl source tarball.
+
+    :param directory: top level folder in the tarball, e.g. openssl-1.1.1c
+    :type directory: str
+    :param tarball: path of the tarball
+    :type tarball: str
+
+    """
+    config = "\n".join(
+        [
+            "#!/bin/sh",
+            "prefix=/usr/local",
+            "for arg in \"$@\"; do",
+            "  case \"$arg\" in --prefix=*) prefix=\"${arg#--prefix=}\";; esac",
+            "done",
+            "printf 'build_sw:\\n\\ttouch libssl.so libcrypto.so\\n"
+            "install_sw:\\n\\tmkdir -p %s/lib %s/share/xcc-harness\\n"
+            "\\tcp libssl.so libcrypto.so %s/lib/\\n"
+            "\\techo fake project openssl > %s/share/xcc-harness/openssl\\n' "
+            "\"$prefix\" \"$prefix\" \"$prefix\" \"$prefix\" > Makefile",
+            "",
+        ]
+    )
+    source = tarball + ".src"
+    write_file(os.path.join(source, directory, "config"), config, executable=True)
+    with tarfile.open(tarball, "w:gz") as tar:
+        tar.add(os.path.join(source, directory), arcname=directory)
+    shutil.rmtree(source)
+
+
+# python modules of the fake miniconda installation, which are used by the recipe
+fake_python_modules = {
+    "jupyter_client/__init__.py": "",
+    "jupyter_client/kernelspec.py": "\n".join(
+        [
+            "import os, shutil, sys",
+            "",
+            "",
+            "class KernelSpecManager:",
+            "    def install_kernel_spec(self, source_dir, kernel_name=None, user=False, prefix=None):",
+            "        name = kernel_name or os.path.basename(source_dir.rstrip('/'))",
+            "        dest = os.path.join(prefix or sys.prefix, 'share', 'jupyter', 'kernels', name)",
+            "        if os.path.exists(dest):",
+            "            shutil.rmtree(dest)",
+            "        shutil.copytree(source_dir, dest)",
+            "        return dest",
+            "",
+        ]
+    ),
+    "jupyterlab/__init__.py": "",
+    "jupyterlab/commands.py": "def build_check(*args, **kwargs):\n    return []\n",
+}
+
+
+def gen_fake_miniconda_installer(python: str) -> str:
+    """Returns a fake miniconda installer. It supports the arguments -b and -p <prefix> and creates a python venv
+    with the fake python modules and stubs of conda, pip, jupyter and jlpm. The stubs log their calls in
+    <prefix>/xcc-harness-calls.log.
+
+    :param python: python interpreter of the venv
+    :type python: str
+    :returns: content of the installer
+    :rtype: str
+
+    """
+    stub = '#!/bin/sh\\necho "$(basename $0) $*" >> {0}/xcc-harness-calls.log\\n'
+    return "\n".join(
+        [
+            "#!" + python,
+            "import argparse, glob, os, venv",
+            "parser = argparse.ArgumentParser()",
+            "parser.add_argument('-b', action='store_true')",
+            "parser.add_argument('-p', required=True)",
+            "prefix = os.path.abspath(parser.parse_args().p)",
+            "venv.create(prefix, symlinks=True, with_pip=False)",
+            "site = glob.glob(os.path.join(prefix, 'lib', 'python3*', 'site-packages'))[0]",
+            "modules = " + repr(fake_python_modules),
+            "for name, content in modules.items():",
+            "    os.makedirs(os.path.dirname(os.path.join(site, name)), exist_ok=True)",
+            "    with open(os.path.join(site, name), 'w') as f:",
+            "        f.write(content)",
+            "for tool in ['conda', 'pip', 'jupyter', 'jlpm']:",
+            "    with open(os.path.join(prefix, 'bin', tool), 'w') as f:",
+            "        f.write('" + stub + "'.format(prefix))",
+            "    os.chmod(os.path.join(prefix, 'bin', tool), 0o755)",
+            "",
+        ]
+    )
+
+
+class FileServer:
+    """http server in a background thread, which serves the files of a folder on a free local port."""
+
+    def __init__(self, path: str):
+        handler = functools.partial(_QuietHandler, directory=path)
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = "http://127.0.0.1:" + str(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def gen_step_script(sections: List[Tuple[str, str]], env: Dict[str, str]) -> Tuple[str, List[str]]:
+    """Create a shell script, which executes the %post sections in subshells like separate RUN
+    instructions and exports the variables of the %environment sections for all following steps.
+    The %runscript section is executed as last step. The start and the end of each step is
+    printed with the step_marker.
+
+    :param sections: sections of the recipe (see parse_recipe())
+    :type sections: List[Tuple[str, str]]
+    :param env: additional environment variables
+    :type env: Dict[str, str]
+    :returns: script and names of the steps
+    :rtype: Tuple[str, List[str]]
+
+    """
+    script = ["set -e"]
+    for key, value in env.items():
+        script.append("export " + key + "=" + shlex.quote(value))
+    names = []  # type: List[str]
+    # the runscript is executed after the container is built
+    sections = [x for x in sections if x[0] != "runscript"] + [
+        x for x in sections if x[0] == "runscript"
+    ]
+    for name, body in sections:
+        if name == "environment":
+            script.append(body)
+        elif name in ("post", "runscript"):
+            script += [
+                "echo '" + step_marker + " start " + str(len(names)) + "'",
+                "(",
+                body,
+                ")",
+                "echo '" + step_marker + " end " + str(len(names)) + "'",
+            ]
+            names.append(
+                "runscript: " + get_step_name(body) if name == "runscript" else get_step_name(body)
+            )
+    return "\n".join(script) + "\n", names
+
+
+def run_steps(
+    script: str, names: List[str], log_path: str, timeout: float, log: Callable[[str], None]
+) -> List[Tuple[str, float]]:
+    """Execute the step script with sh and measure the runtime of each step.
+
+    :param script: script of gen_step_script()
+    :type script: str
+    :param names: names of the steps
+    :type names: List[str]
+    :param log_path: file, which gets the output of the steps
+    :type log_path: str
+    :param timeout: maximum runtime in seconds
+    :type timeout: float
+    :param log: function, which prints the progress
+    :type log: Callable[[str], None]
+    :returns: name and runtime in seconds of each finished step
+    :rtype: List[Tuple[str, float]]
+
+    """
+    timings = []  # type: List[Tuple[str, float]]
+    current = -1
+    start = time.monotonic()
+    process = subprocess.Popen(
+        ["sh", "-e"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        cwd="/",
+        start_new_session=True,
+    )
+    # the script is small, therefore it can be written before the output is read
+    process.stdin.write(script.encode())  # type: ignore
+    process.stdin.close()  # type: ignore
+
+    timer = threading.Timer(timeout, lambda: os.killpg(process.pid, signal.SIGKILL))
+    timer.start()
+    with open(log_path, "w") as log_file:
+        for raw_line in process.stdout:  # type: ignore
+            line = raw_line.decode(errors="replace")
+            if line.startswith(step_marker):
+                _, event, index = line.split()
+                if event == "start":
+                    current = int(index)
+                    start = time.monotonic()
+                    log("[" + str(current + 1) + "/" + str(len(names)) + "] " + names[current])
+                else:
+                    timings.append((names[current], time.monotonic() - start))
+                    current = -1
+            else:
+                log_file.write(line)
+    process.wait()
+    timer.cancel()
+
+    if process.returncode != 0:
+        step = names[current] if current >= 0 else "environment"
+        if process.returncode == -signal.SIGKILL:
+            raise HarnessError("timeout of " + str(timeout) + " s in step: " + step)
+        with open(log_path) as log_file:
+            tail = "".join(log_file.readlines()[-20:])
+        raise HarnessError("step failed: " + step + "\n" + tail)
+    return timings
+
+
+def check_layout(
+    xcc_gen: xcc.generator.XCC_gen,
+    projects: List[str],
+    recipe: str,
+    ld_config: str = "",
+    project_path: str = "",
+    dual_build_type: str = "",
+    code_index: bool = False,
+) -> List[str]:
+    """Check the install layout and the cleanup after the build steps. In the dev mode, cling is
+    installed in each install path of the project path and xeus-cling in the miniconda
+    installation of the project path.
+
+    :param xcc_gen: generator of the recipe
+    :type xcc_gen: xcc.generator.XCC_gen
+    :param projects: names of the fake git projects
+    :type projects: List[str]
+    :param recipe: executed recipe
+    :type recipe: str
+    :param ld_config: configuration file of the dynamic linker in the sandbox, empty if the recipe does not register the libraries
+    :type ld_config: str
+    :param project_path: project path of the dev runscript, empty for the release recipe
+    :type project_path: str
+    :param dual_build_type: second build type of the dev runscript, empty for a single build
+    :type dual_build_type: str
+    :param code_index: the dev recipe builds the clangd indexer and the runscript the clangd index
+    :type code_index: bool
+    :returns: list of errors
+    :rtype: List[str]
+
+    """
+    errors = []
+    config = xcc_gen.config
+    install_config = config
+    if project_path:
+        # the runscript installs cling, xeus-cling and miniconda in the project path
+        install_config = config.get_copy()
+        install_config.install_prefix = project_path
+        install_config.second_build_type = dual_build_type
+    miniconda_path = install_config.get_miniconda_path()
+
+    installed = set()
+    for prefix in set([config.install_prefix, install_config.install_prefix]):
+        for root, _, files in os.walk(prefix):
+            if os.path.basename(root) == "xcc-harness":
+                installed.update(files)
+    for name in projects + (["openssl"] if "openssl" in recipe else []):
+        # only the clangd indexer of the llvm release is installed
+        if name == "llvm-project":
+            continue
+        if name not in installed:
+            errors.append("project is not installed: " + name)
+
+    expected_files = [miniconda_path + "/bin/python"]
+    for build in install_config.get_cling_build():
+        expected_files += [
+            build.install_path + "/bin/cling",
+            build.install_path + "/share/cling/Jupyter/kernel/setup.py",
+        ]
+    if code_index:
+        expected_files += [
+            xcc.clangd.get_clangd_indexer_path(config),
+            install_config.install_prefix + "/compile_commands.json",
+            install_config.install_prefix + "/clangd.dex",
+            install_config.install_prefix + "/xcc-clangd",
+        ]
+    if "xeus-cling" in projects:
+        expected_files.append(miniconda_path + "/share/xcc-harness/xeus-cling")
+    for kernel in sorted(set(re.findall(r"/kernels/([^/\s]+)/kernel\.json", recipe))):
+        expected_files.append(miniconda_path + "/share/jupyter/kernels/" + kernel + "/kernel.json")
+    for path in expected_files:
+        if not os.path.exists(path):
+            errors.append("missing file: " + path)
+        elif path.endswith(".json"):
+            try:
+                with open(path) as f:
+                    json.load(f)
+            except ValueError:
+                errors.append("invalid json: " + path)
+
+    if ld_config:
+        if not os.path.exists(ld_config):
+            errors.append("missing file: " + ld_config)
+        else:
+            with open(ld_config) as f:
+                if config.install_prefix + "/lib" not in f.read().split():
+                    errors.append(config.install_prefix + "/lib is not registered in " + ld_config)
+
+    if not config.keep_build and os.path.isdir(config.build_prefix):
+        for entry in sorted(os.listdir(config.build_prefix)):
+            errors.append("not removed after the build: " + config.build_prefix + "/" + entry)
+
+    return errors
+
+
+def run_harness(
+    xcc_gen: xcc.generator.XCC_gen,
+    sandbox: str,
+    runs: int = 1,
+    timeout: float = 120.0,
+    log: Callable[[str], None] = print,
+    project_path: str = "",
+    dual_build_type: str = "",
+    code_index: bool = False,
+) -> List[List[Tuple[str, float]]]:
+    """Execute the build steps of the release recipe in the sandbox against fake projects and check the result.
+    If a project path is set, the build steps and the runscript of the dev recipe are executed instead.
+    The build_prefix, the install_prefix and the project path have to be inside the sandbox.
+
+    :param xcc_gen: generator of the recipe, the cling commit is replaced by the commit of the fake cling repository
+    :type xcc_gen: xcc.generator.XCC_gen
+    :param sandbox: empty or not existing folder
+    :type sandbox: str
+    :param runs: number of executions of the steps, e.g. 2 to check an incremental rebuild
+    :type runs: int
+    :param timeout: maximum runtime of each execution in seconds
+    :type timeout: float
+    :param log: function, which prints the progress
+    :type log: Callable[[str], None]
+    :param project_path: project path of the dev runscript, empty to execute the release recipe
+    :type project_path: str
+    :param dual_build_type: second CMake build type of cling and xeus-cling in the dev runscript, empty for a single build
+    :type dual_build_type: str
+    :param code_index: build the clangd indexer and the clangd index of the dev recipe
+    :type code_index: bool
+    :returns: name and runtime in seconds of each step for each run
+    :rtype: List[List[Tuple[str, float]]]
+
+    """
+    sandbox = os.path.abspath(sandbox)
+    if os.path.exists(sandbox) and os.listdir(sandbox):
+        raise HarnessError("sandbox is not empty: " + sandbox)
+    config = xcc_gen.config
+    for prefix in [config.build_prefix, config.install_prefix] + (
+        [project_path] if project_path else []
+    ):
+        if not os.path.abspath(prefix).startswith(sandbox + "/"):
+            raise HarnessError(prefix + " is not inside the sandbox " + sandbox)
+    if xcc_gen.config.container != "singularity":
+        raise HarnessError("the harness only supports singularity recipes")
+    for tool in ["sh", "git", "cmake", "make", "tar", "wget"]:
+        if not shutil.which(tool):
+            raise HarnessError("could not find " + tool)
+
+    origin_path = os.path.join(sandbox, "origin")
+    www_path = os.path.join(sandbox, "www")
+    os.makedirs(www_path)
+
+    def gen_stage():
+        if project_path:
+            return xcc_gen.gen_devel_build_stage(project_path, dual_build_type, code_index)
+        return xcc_gen.gen_release_build_stage()
+
+    repositories, downloads = find_sources(str(gen_stage()))
+    url_map = {}
+    for url, branches in repositories.items():
+        name = get_project_name(url)
+        bare_path = os.path.join(origin_path, name + ".git")
+        commit = gen_fake_repository(
+            name, branches, os.path.join(sandbox, "src", name), bare_path
+        )
+        url_map[url] = "file://" + bare_path
+        # the fake repository does not contain the pinned commit
+        if url == xcc_gen.cling_url and xcc_gen.cling_hash:
+            xcc_gen.cling_hash = commit
+    for url in downloads:
+        gen_fake_download(url, www_path)
+
+    recipe = str(gen_stage())
+    if not shutil.which("ninja"):
+        recipe = recipe.replace("-G Ninja", '-G "Unix Makefiles"')
+
+    # the library folders are registered in a linker cache of the sandbox
+    ld_config = ""
+    if config.rpath and not project_path:
+        ld_config = sandbox + xcc.ldconfig.ld_config_path
+        os.makedirs(os.path.dirname(ld_config))
+        recipe = recipe.replace(" " + xcc.ldconfig.ld_config_path, " " + ld_config)
+        recipe = recipe.replace(
+            "\n    ldconfig\n",
+            "\n    ldconfig -C " + sandbox + "/ld.so.cache -f " + ld_config + "\n",
+        )
+
+    env = {
+        "HOME": os.path.join(sandbox, "home"),
+        "PATH": config.install_prefix + "/bin:" + os.environ.get("PATH", "/usr/bin:/bin"),
+        "CMAKE_PREFIX_PATH": config.install_prefix,
+    }
+    os.makedirs(env["HOME"])
+
+    results = []
+    with FileServer(www_path) as server:
+        for url in downloads:
+            url_map[url] = server.url + "/" + os.path.basename(url)
+        # longest urls first, that no url is replaced inside another one
+        for url in sorted(url_map, key=len, reverse=True):
+            recipe = recipe.replace(url, url_map[url])
+        script, names = gen_step_script(parse_recipe(recipe), env)
+        write_file(os.path.join(sandbox, "steps.sh"), script)
+
+        for run in range(runs):
+            log("run " + str(run + 1) + " of " + str(runs))
+            results.append(
+                run_steps(
+                    script,
+                    names,
+                    os.path.join(sandbox, "steps-" + str(run + 1) + ".log"),
+                    timeout,
+                    log,
+                )
+            )
+
+    errors = check_layout(
+        xcc_gen,
+        sorted(get_project_name(url) for url in repositories),
+        recipe,
+        ld_config,
+        project_path,
+        dual_build_type,
+        code_index,
+    )
+    if errors:
+        raise HarnessError("\n".join(errors))
+    return results
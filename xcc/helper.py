@@ -1,7 +1,11 @@
 """Different helper functions for generating container recipe
 """
 
-from typing import List, Union
+from typing import Any, Callable, Dict, List, Tuple, Union
+from collections import OrderedDict
+from copy import deepcopy
+import hashlib
+import os
 
 from hpccm.templates.git import git
 from hpccm.templates.CMakeBuild import CMakeBuild
@@ -40,19 +44,40 @@ def build_git_and_cmake(
         "#///////////////////////////////////////////////////////////",
     ]
 
-    git_conf = git()
     cm.append(
-        git_conf.clone_step(
-            repository=url, branch=branch, path=config.build_prefix, directory=name
+        git_clone_step(
+            config=config,
+            repository=url,
+            branch=branch,
+            path=config.build_prefix,
+            directory=name,
         )
     )
+    # find dependencies, which are installed as prebuilt conda packages
+    if config.get_cmake_prefix_path():
+        opts = opts + [
+            '-DCMAKE_PREFIX_PATH="' + ";".join(config.get_cmake_prefix_path()) + '"'
+        ]
+
     cmake_conf = CMakeBuild(prefix=config.install_prefix)
     cm_build_dir = config.build_prefix + "/" + name + "_build"
     cm_source_dir = config.build_prefix + "/" + name
-    cm.append(
-        cmake_conf.configure_step(
-            build_directory=cm_build_dir, directory=cm_source_dir, opts=opts
-        )
+    cm += fingerprint_configure_step(
+        config=config,
+        configure_step=cmake_conf.configure_step(
+            build_directory=cm_build_dir,
+            directory=cm_source_dir,
+            opts=add_cpu_target_cmake_args(
+                config,
+                opts
+                + config.get_cmake_linker_args()
+                + config.get_cmake_rpath_args(
+                    config.install_prefix,
+                    [p + "/lib" for p in config.get_cmake_prefix_path()],
+                ),
+            ),
+        ),
+        build_directory=cm_build_dir,
     )
     cm.append(cmake_conf.build_step(parallel=config.get_cmake_compiler_threads(), target="install"))
     if not config.keep_build:
@@ -60,6 +85,288 @@ def build_git_and_cmake(
         config.paths_to_delete.append(cm_source_dir)
     return cm
 
+
+def git_clone_step(
+    config: xcc.config.XCC_Config,
+    repository: str,
+    path: str,
+    directory: str = "",
+    branch: Union[str, None] = None,
+    commit: Union[str, None] = None,
+    opts: List[str] = ["--depth=1"],
+) -> str:
+    """Returns a git clone command. If config.incremental is true and the repository was already cloned by a previous build, the existing checkout is updated to the pinned branch, tag or commit instead. If config.prefetch is true, the clone is moved to the prefetch step (see fetch_step()).
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param repository: git clone url
+        :type repository: str
+        :param path: folder, in which the repository is cloned
+        :type path: str
+        :param directory: name of the repository folder (default: name of the repository)
+        :type directory: str
+        :param branch: branch or tag
+        :type branch: str
+        :param commit: commit hash
+        :type commit: str
+        :param opts: options of git clone
+        :type opts: List[str]
+        :returns: bash command
+        :rtype: str
+
+        """
+    clone = git(opts=opts).clone_step(
+        repository=repository,
+        branch=branch,
+        commit=commit,
+        path=path,
+        directory=directory,
+    )
+
+    if not directory:
+        directory = os.path.splitext(os.path.basename(repository))[0]
+    repo_path = path + "/" + directory
+    verify = "git -C " + repo_path + " rev-parse -q --verify HEAD > /dev/null"
+
+    if not config.incremental:
+        return fetch_step(config, repo_path, clone, verify)
+
+    if commit:
+        # a shallow clone may not contain the commit
+        update = (
+            "(git fetch --unshallow origin || git fetch origin) && git checkout -f "
+            + commit
+        )
+    else:
+        update = (
+            "git fetch --depth=1 origin "
+            + str(branch)
+            + " && git checkout -f FETCH_HEAD"
+        )
+
+    return fetch_step(
+        config,
+        repo_path,
+        "if [ -d "
+        + repo_path
+        + "/.git ]; then cd "
+        + repo_path
+        + " && "
+        + update
+        + " && cd -; else "
+        + clone
+        + "; fi",
+        verify,
+    )
+
+
+def fetch_step(
+    config: xcc.config.XCC_Config, path: str, command: str, verify: str
+) -> str:
+    """Returns the download command of a source. If config.prefetch is true, the download is registered in config.prefetch_sources and executed by the prefetch step (see prefetch_step()) instead. Then only the verification of the prefetched copy is returned.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param path: path of the downloaded file or folder
+        :type path: str
+        :param command: download command
+        :type command: str
+        :param verify: command, which fails if the download is incomplete or damaged
+        :type verify: str
+        :returns: bash command
+        :rtype: str
+
+        """
+    if not config.prefetch:
+        return command
+
+    config.prefetch_sources.append(
+        {"path": path, "command": command, "verify": verify}
+    )
+    return verify
+
+
+def prefetch_step(
+    config: xcc.config.XCC_Config, sources: List[Dict[str, str]]
+) -> List[str]:
+    """Returns the instructions, which download all sources concurrently and verify them. A source inside the folder of another source (e.g. clang in llvm/tools) is downloaded after the other one. If a download fails, the logs of all failed downloads are printed and the step fails, before the first build started.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param sources: sources of the recipe (see fetch_step())
+        :type sources: List[Dict[str, str]]
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    log_path = config.build_prefix + "/xcc_prefetch_logs"
+
+    def get_parent(source: Dict[str, str]) -> int:
+        # index of the innermost source, whose folder contains the source
+        parents = [
+            (len(p["path"]), i)
+            for i, p in enumerate(sources)
+            if source["path"].startswith(p["path"] + "/")
+        ]
+        return max(parents)[1] if parents else -1
+
+    parents = [get_parent(source) for source in sources]
+
+    def gen_jobs(parent: int) -> str:
+        jobs = [gen_job(i) for i, p in enumerate(parents) if p == parent]
+        # one line per top level download
+        separator = " & " if parent >= 0 else " & \\\n    "
+        return "{ " + separator.join(jobs + ["wait; }"])
+
+    def gen_job(index: int) -> str:
+        source = sources[index]
+        log = log_path + "/" + str(index)
+        job = "(" + source["command"] + " && " + source["verify"] + ") > " + log + ".log 2>&1"
+        if index in parents:
+            job += " && " + gen_jobs(index)
+        return "{ " + job + " || echo " + source["path"] + " > " + log + ".failed; }"
+
+    return [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Prefetch Sources                                      //",
+        "#///////////////////////////////////////////////////////////",
+        "rm -rf " + log_path,
+        "mkdir -p " + log_path,
+        gen_jobs(-1),
+        "if ls "
+        + log_path
+        + "/*.failed > /dev/null 2>&1; then for f in "
+        + log_path
+        + '/*.failed; do echo "download failed: $(cat $f)"; cat ${f%.failed}.log; done; exit 1; fi',
+        "rm -rf " + log_path,
+    ]
+
+
+def fingerprint_configure_step(
+    config: xcc.config.XCC_Config,
+    configure_step: str,
+    build_directory: str,
+    clean_step: str = "",
+) -> List[str]:
+    """If config.incremental is true, wrap the configure step with a fingerprint check. The fingerprint is the hash of the configure command. If the build folder of a previous build has another fingerprint, it is removed before configuring, to avoid mixing different configurations. Otherwise, the existing build folder is reused and only changed files are built.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param configure_step: configure command, e.g. of CMakeBuild.configure_step()
+        :type configure_step: str
+        :param build_directory: build folder
+        :type build_directory: str
+        :param clean_step: command to clean an outdated build (default: remove the build folder), e.g. make clean for in-source builds
+        :type clean_step: str
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    if not config.incremental:
+        return [configure_step]
+
+    fingerprint = hashlib.sha256(configure_step.encode("utf-8")).hexdigest()
+    fingerprint_file = build_directory + "/.xcc_fingerprint"
+    if not clean_step:
+        clean_step = "rm -rf " + build_directory
+    return [
+        'if [ "$(cat '
+        + fingerprint_file
+        + " 2> /dev/null)\" != \""
+        + fingerprint
+        + '" ]; then '
+        + clean_step
+        + "; fi",
+        configure_step,
+        "echo " + fingerprint + " > " + fingerprint_file,
+    ]
+
+
+# memoized results of pure_step()
+# key: builder name + arguments
+# value: list of the config settings, which were read by the builder, the
+# result of the builder, paths to delete and prefetch sources
+_step_cache: "OrderedDict[str, List[Tuple[Dict[str, Any], Any, List[str], List[Dict[str, str]]]]]" = OrderedDict()
+# maximum number of memoized results, the oldest results are removed first
+step_cache_size = 256
+
+
+class _ReadRecorder(xcc.config.XCC_Config):
+    """Copy of a configuration, which records the names of the settings read by a step builder."""
+
+    def __getattribute__(self, name: str):
+        if not name.startswith("_") and name in object.__getattribute__(
+            self, "__dict__"
+        ):
+            object.__getattribute__(self, "_read").add(name)
+        return object.__getattribute__(self, name)
+
+
+def clear_step_cache():
+    """Remove all memoized results of pure_step()."""
+    _step_cache.clear()
+
+
+def pure_step(
+    builder: Callable,
+    config: xcc.config.XCC_Config,
+    prefetch_sources: Union[List[Dict[str, str]], None] = None,
+    **kwargs
+) -> Tuple[Any, List[str]]:
+    """Call a step builder like build_cling() without side effects. The builder gets a copy of the config, therefore the paths to delete are returned instead of being appended to config.paths_to_delete. The results are memoized with the config settings, which the builder has read, so that shared steps of different recipes (e.g. a recipe matrix with different thread numbers) are only computed once. At most step_cache_size results are kept.
+
+        :param builder: function, which gets the config object as argument config and returns the build instructions
+        :type builder: Callable
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param prefetch_sources: if set, the prefetch sources of the step are appended (see fetch_step())
+        :type prefetch_sources: List[Dict[str, str]]
+        :param kwargs: additional arguments of the builder
+        :returns: result of the builder and list of paths to delete
+        :rtype: Any, List[str]
+
+        """
+    key = builder.__module__ + "." + builder.__name__ + repr(sorted(kwargs.items()))
+
+    entry = None
+    for cached in _step_cache.get(key, []):
+        if all(getattr(config, name) == value for name, value in cached[0].items()):
+            entry = cached
+            break
+
+    if entry is None:
+        step_config = config.get_copy()
+        step_config.paths_to_delete = []
+        step_config.prefetch_sources = []
+        step_config.__class__ = _ReadRecorder
+        step_config._read = set()
+        result = builder(config=step_config, **kwargs)
+        settings = {
+            name: deepcopy(getattr(config, name))
+            for name in step_config._read
+            if name not in ("paths_to_delete", "prefetch_sources")
+        }
+        entry = (
+            settings,
+            result,
+            step_config.paths_to_delete,
+            step_config.prefetch_sources,
+        )
+        _step_cache.setdefault(key, []).append(entry)
+        _step_cache.move_to_end(key)
+        if sum(len(entries) for entries in _step_cache.values()) > step_cache_size:
+            oldest = next(iter(_step_cache))
+            _step_cache[oldest].pop(0)
+            if not _step_cache[oldest]:
+                del _step_cache[oldest]
+
+    _, result, paths_to_delete, sources = entry
+    if prefetch_sources is not None:
+        prefetch_sources += deepcopy(sources)
+    return deepcopy(result), list(paths_to_delete)
+
+
 def add_libcxx_cmake_arg(inputList: List[str]) -> List[str]:
     """If the class attribute build_libcxx is true, add -DCMAKE_CXX_FLAGS="-stdlib=libc++" to cmake flags in inputlist.
 
@@ -76,3 +383,31 @@ def add_libcxx_cmake_arg(inputList: List[str]) -> List[str]:
 
     inputList.append('-DCMAKE_CXX_FLAGS="-stdlib=libc++"')
     return inputList
+
+
+def add_cpu_target_cmake_args(
+    config: xcc.config.XCC_Config, inputList: List[str]
+) -> List[str]:
+    """Add the compiler flags of config.cpu_target to -DCMAKE_C_FLAGS and -DCMAKE_CXX_FLAGS in inputlist.
+
+    :param config: Configuration object, which contains different information for the stage
+    :type config: xcc.config.XCC_Config
+    :param inputlist: List of cmake flags
+    :type inputlist: List[str]
+    :returns: inputlist plus the cpu target flags, unchanged if no cpu target is set
+    :rtype: List[str]
+
+    """
+    flags = " ".join(config.get_cpu_target_flags())
+    if not flags:
+        return inputList
+
+    for variable in ["CMAKE_C_FLAGS", "CMAKE_CXX_FLAGS"]:
+        prefix = "-D" + variable + '="'
+        for i, elem in enumerate(inputList):
+            if elem.startswith(prefix):
+                inputList[i] = elem[:-1] + " " + flags + '"'
+                break
+        else:
+            inputList.append(prefix + flags + '"')
+    return inputList
@@ -1,242 +1,340 @@
 """Functions to create build instructions for jupyter notebook and kernels.
 """
 
-from typing import Dict, List, Union
+from typing import Dict, List, Tuple, Union
+import base64
 import json
+import os
 
 import xcc.config
 
+# C++ standards of the default kernelspec matrix
+default_kernel_standards = [11, 14, 17]
+
+# backends of the default kernelspec matrix with the cuda variants of each backend
+# e.g. {"cling" : [False, True]} creates a kernel with and without cuda support
+default_kernel_backends = {"xeus-cling": [True], "cling": [False, True]}
+
+# modules, which are installed in the container
+data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+kernel_pool_module = os.path.join(data_path, "xcc_kernel_pool.py")
+kernel_limits_module = os.path.join(data_path, "xcc_kernel_limits.py")
+malloc_bench_script = os.path.join(data_path, "xcc_malloc_bench.py")
+
+
+def gen_kernelspec_matrix(
+    config: xcc.config.XCC_Config,
+    standards: List[int] = default_kernel_standards,
+    backends: Dict[str, List[bool]] = default_kernel_backends,
+    flags: Dict[str, List[str]] = {"": []},
+) -> List[Tuple[str, str]]:
+    """Generate the kernelspecs for all combinations of backend x cuda x extra flags x C++ standard.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param standards: C++ standards as number (options: 11, 14, 17)
+        :type standards: List[int]
+        :param backends: dictionary of backend ('xeus-cling' or 'cling') and a list of cuda variants
+        :type backends: Dict[str, List[bool]]
+        :param flags: dictionary of kernel name suffix and additional interpreter flags (e.g. {"-O2" : ["-O2"]}), the empty suffix is the kernel without extra flags
+        :type flags: Dict[str, List[str]]
+        :returns: list of kernel names and json strings
+        :rtype: List[Tuple[str, str]]
+
+        """
+    kernels: List[Tuple[str, str]] = []
+
+    for backend, cuda_variants in backends.items():
+        for cuda in cuda_variants:
+            env = config.get_kernel_allocator_env()
+            if cuda:
+                env.update(config.get_cuda_cache_env())
+            launcher = (
+                [get_kernel_launcher_path(config), "1" if cuda else "0"]
+                if config.kernel_memory_limit
+                else []
+            )
+            for suffix, extra_flags in flags.items():
+                extra_flags = (
+                    config.get_cpu_target_flags()
+                    + config.get_cling_modules_flags()
+                    + extra_flags
+                )
+                for std in standards:
+                    name = (
+                        backend + "-cpp" + str(std) + ("-cuda" if cuda else "") + suffix
+                    )
+                    if backend == "xeus-cling":
+                        kernel_json = gen_xeus_cling_jupyter_kernel(
+                            config.get_miniconda_path(),
+                            std,
+                            env,
+                            cuda=cuda,
+                            flags=extra_flags,
+                            suffix=suffix,
+                            pool_size=config.kernel_pool_size,
+                            launcher=launcher,
+                        )
+                    elif backend == "cling":
+                        kernel_json = gen_cling_jupyter_kernel(
+                            std,
+                            cuda,
+                            env,
+                            flags=extra_flags,
+                            suffix=suffix,
+                            launcher=launcher,
+                        )
+                    else:
+                        raise ValueError("unknown kernel backend: " + backend)
+                    kernels.append((name, kernel_json))
+
+    return kernels
+
+
+def write_kernelspec_matrix(
+    kernels: List[Tuple[str, str]], kernel_prefix: str
+) -> List[str]:
+    """Returns instructions, which write the kernelspecs of a matrix in a single pass. Each kernel gets its own folder kernel_prefix/<name>/kernel.json.
+
+        :param kernels: list of kernel names and json strings (see gen_kernelspec_matrix())
+        :type kernels: List[Tuple[str, str]]
+        :param kernel_prefix: folder, which contains all kernel folders
+        :type kernel_prefix: str
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    cm = [
+        "",
+        "#/////////////////////////////",
+        "#// Jupyter Kernels         //",
+        "#/////////////////////////////",
+        "mkdir -p "
+        + " ".join([kernel_prefix + "/" + name for name, _ in kernels]),
+    ]
+    for name, kernel_json in kernels:
+        cm.append(
+            "echo '" + kernel_json + "' > " + kernel_prefix + "/" + name + "/kernel.json"
+        )
+    return cm
+
+
+def build_jupyterlab_assets(config: xcc.config.XCC_Config) -> List[str]:
+    """Returns instructions to install the jupyterlab extensions and create a minimized production build of the jupyterlab assets. The container is read-only, therefore a pending build cannot be done at launch time. The instructions check that no rebuild is pending and remove the node and yarn caches afterwards.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    conda_bin = config.get_miniconda_path() + "/bin/"
+    return [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Build JupyterLab Assets                               //",
+        "#///////////////////////////////////////////////////////////",
+        conda_bin
+        + "jupyter labextension install --no-build @jupyter-widgets/jupyterlab-manager",
+        conda_bin + "jupyter lab build --dev-build=False --minimize=True",
+        # fails, if the build is not complete
+        conda_bin
+        + 'python -c "import sys; from jupyterlab.commands import build_check; '
+        + "messages = build_check(); "
+        + "[print('jupyterlab build pending: ' + m) for m in messages]; "
+        + 'sys.exit(1 if messages else 0)"',
+        conda_bin + "jupyter lab clean",
+        conda_bin + "jlpm cache clean",
+        "rm -rf $HOME/.npm $HOME/.cache/yarn",
+    ]
+
 
 def build_rel_jupyter_kernel(
-    config: xcc.config.XCC_Config, user_install=False,
+    config: xcc.config.XCC_Config,
+    user_install=False,
+    kernels: List[Tuple[str, str]] = [],
 ) -> List[str]:
-    """Returns jupyter kernel and instructions to install it
+    """Returns jupyter kernel and instructions to install it. All kernels are registered with a single interpreter call.
 
         :param config: Configuration object, which contains different information for the stage
         :type config: xcc.config.XCC_Config
-        :param user_install: if true, add flag --user to jupyter-kernelspec install
+        :param user_install: if true, install the kernels in the user folder like jupyter-kernelspec install --user
         :type user_install: bool
+        :param kernels: list of kernel names and json strings, if empty, use gen_kernelspec_matrix() with default arguments
+        :type kernels: List[Tuple[str, str]]
         :returns: list of bash commands
         :rtype: List[str]
 
         """
-    user_install_arg = ""
-    if user_install:
-        user_install_arg = "--user "
+    if not kernels:
+        kernels = gen_kernelspec_matrix(config)
 
-    kernel_register: List[str] = []
-    # xeus-cling cuda kernel
-    for std in [11, 14, 17]:
-        kernel_register += [
-            "",
-            "#/////////////////////////////",
-            "{:<28}".format("#// Jupyter Kernel: Xeus " + str(std) + " cuda") + "//",
-            "#/////////////////////////////",
-        ]
-        kernel_path = config.build_prefix + "/xeus-cling-cpp" + str(std) + "-cuda"
-        kernel_register.append("mkdir -p " + kernel_path)
-        kernel_register.append(
-            "echo '"
-            + gen_xeus_cling_jupyter_kernel(config.get_miniconda_path(), std)
-            + "' > "
-            + kernel_path
-            + "/kernel.json"
-        )
-        kernel_register.append(
-            "jupyter-kernelspec install " + user_install_arg + kernel_path
-        )
-        if not config.keep_build:
-            config.paths_to_delete.append(kernel_path)
+    kernel_prefix = config.build_prefix + "/kernels"
 
-    # cling-cpp kernel
-    for std in [11, 14, 17]:
-        kernel_register += [
-            "",
-            "#/////////////////////////////",
-            "{:<28}".format("#// Jupyter Kernel: Cling " + str(std)) + "//",
-            "#/////////////////////////////",
-        ]
-        kernel_path = config.build_prefix + "/cling-cpp" + str(std)
-        kernel_register.append("mkdir -p " + kernel_path)
-        kernel_register.append(
-            "echo '"
-            + gen_cling_jupyter_kernel(std, False)
-            + "' > "
-            + kernel_path
-            + "/kernel.json"
-        )
-        kernel_register.append(
-            "jupyter-kernelspec install " + user_install_arg + kernel_path
-        )
-        if not config.keep_build:
-            config.paths_to_delete.append(kernel_path)
+    kernel_register = write_kernelspec_matrix(kernels, kernel_prefix)
+    # same behavior like jupyter-kernelspec install, but only one python
+    # interpreter startup for all kernels
+    kernel_register.append(
+        config.get_miniconda_path()
+        + '/bin/python -c "import sys; '
+        + "from jupyter_client.kernelspec import KernelSpecManager; "
+        + "ksm = KernelSpecManager(); "
+        + "[ksm.install_kernel_spec(d, user="
+        + str(bool(user_install))
+        + ') for d in sys.argv[1:]]" '
+        + " ".join([kernel_prefix + "/" + name for name, _ in kernels])
+    )
+    if not config.keep_build:
+        config.paths_to_delete.append(kernel_prefix)
 
-    # cling-cuda kernel
-    for std in [11, 14, 17]:
-        kernel_register += [
-            "",
-            "#/////////////////////////////",
-            "{:<28}".format("#// Jupyter Kernel: Cling " + str(std) + " cuda") + "//",
-            "#/////////////////////////////",
-        ]
-        kernel_path = config.build_prefix + "/cling-cpp" + str(std) + "-cuda"
-        kernel_register.append("mkdir -p " + kernel_path)
-        kernel_register.append(
-            "echo '"
-            + gen_cling_jupyter_kernel(std, True)
-            + "' > "
-            + kernel_path
-            + "/kernel.json"
-        )
-        kernel_register.append(
-            "jupyter-kernelspec install " + user_install_arg + kernel_path
-        )
-        if not config.keep_build:
-            config.paths_to_delete.append(kernel_path)
+    if config.cuda_cache_warmup:
+        kernel_register += build_cuda_cache_warmup(config)
+
+    if config.kernel_pool_size:
+        kernel_register += build_kernel_pool(config)
+
+    kernel_register += build_kernel_governance(config)
+    kernel_register += build_kernel_allocator(config)
+    kernel_register += build_jupyter_server_config(config)
 
     return kernel_register
 
 
-def build_dev_jupyter_kernel(config: xcc.config.XCC_Config) -> List[str]:
+def build_dev_jupyter_kernel(
+    config: xcc.config.XCC_Config, kernels: List[Tuple[str, str]] = []
+) -> List[str]:
     """Returns jupyter kernel and instructions to install it in the miniconda3 folder. For release builds, please use build_rel_jupyter_kernel().
 
         :param config: Configuration object, which contains different information for the stage
         :type config: xcc.config.XCC_Config
+        :param kernels: list of kernel names and json strings, if empty, use gen_kernelspec_matrix() with default arguments
+        :type kernels: List[Tuple[str, str]]
         :returns: list of bash commands
         :rtype: List[str]
 
         """
+    if not kernels:
+        kernels = gen_kernelspec_matrix(config)
+
     kernel_prefix = config.build_prefix + "/kernels"
 
-    kernel_register = []
+    kernel_register = write_kernelspec_matrix(kernels, kernel_prefix)
     kernel_register.append(
         "mkdir -p " + config.get_miniconda_path() + "/share/jupyter/kernels/"
     )
+    kernel_register.append(
+        "cp -r "
+        + " ".join([kernel_prefix + "/" + name for name, _ in kernels])
+        + " "
+        + config.get_miniconda_path()
+        + "/share/jupyter/kernels/"
+    )
+    if not config.keep_build:
+        config.paths_to_delete.append(kernel_prefix)
 
-    # xeus-cling cuda kernel
-    for std in [11, 14, 17]:
-        kernel_register += [
-            "",
-            "#/////////////////////////////",
-            "{:<28}".format("#// Jupyter Kernel: Xeus " + str(std) + " cuda") + "//",
-            "#/////////////////////////////",
-        ]
-        kernel_path = kernel_prefix + "/xeus-cling-cpp" + str(std) + "-cuda"
-        kernel_register.append("mkdir -p " + kernel_path)
-        kernel_register.append(
-            "echo '"
-            + gen_xeus_cling_jupyter_kernel(config.get_miniconda_path(), std)
-            + "' > "
-            + kernel_path
-            + "/kernel.json"
-        )
-        kernel_register.append(
-            "cp -r "
-            + kernel_path
-            + " "
-            + config.get_miniconda_path()
-            + "/share/jupyter/kernels/"
-        )
-        if not config.keep_build:
-            config.paths_to_delete.append(kernel_path)
+    if config.cuda_cache_warmup:
+        kernel_register += build_cuda_cache_warmup(config)
 
-    # cling-cpp kernel
-    for std in [11, 14, 17]:
-        kernel_register += [
-            "",
-            "#/////////////////////////////",
-            "{:<28}".format("#// Jupyter Kernel: Cling " + str(std)) + "//",
-            "#/////////////////////////////",
-        ]
-        kernel_path = kernel_prefix + "/cling-cpp" + str(std)
-        kernel_register.append("mkdir -p " + kernel_path)
-        kernel_register.append(
-            "echo '"
-            + gen_cling_jupyter_kernel(std, False)
-            + "' > "
-            + kernel_path
-            + "/kernel.json"
-        )
-        kernel_register.append(
-            "cp -r "
-            + kernel_path
-            + " "
-            + config.get_miniconda_path()
-            + "/share/jupyter/kernels/"
-        )
-        if not config.keep_build:
-            config.paths_to_delete.append(kernel_path)
-
-    # cling-cuda kernel
-    for std in [11, 14, 17]:
-        kernel_register += [
-            "",
-            "#/////////////////////////////",
-            "{:<28}".format("#// Jupyter Kernel: Cling " + str(std) + " cuda") + "//",
-            "#/////////////////////////////",
-        ]
-        kernel_path = kernel_prefix + "/cling-cpp" + str(std) + "-cuda"
-        kernel_register.append("mkdir -p " + kernel_path)
-        kernel_register.append(
-            "echo '"
-            + gen_cling_jupyter_kernel(std, True)
-            + "' > "
-            + kernel_path
-            + "/kernel.json"
-        )
-        kernel_register.append(
-            "cp -r "
-            + kernel_path
-            + " "
-            + config.get_miniconda_path()
-            + "/share/jupyter/kernels/"
-        )
-        if not config.keep_build:
-            config.paths_to_delete.append(kernel_path)
+    kernel_register += build_kernel_governance(config)
+    kernel_register += build_kernel_allocator(config)
+    kernel_register += build_jupyter_server_config(config)
 
     return kernel_register
 
 
-def gen_xeus_cling_jupyter_kernel(miniconda_path: str, cxx_std: int) -> str:
+def gen_xeus_cling_jupyter_kernel(
+    miniconda_path: str,
+    cxx_std: int,
+    env: Dict[str, str] = {},
+    cuda: bool = True,
+    flags: List[str] = [],
+    suffix: str = "",
+    pool_size: int = 0,
+    launcher: List[str] = [],
+) -> str:
     """Generate jupyter kernel description files with cuda support for different C++ standards. The kernels uses xeus-cling.
 
         :param miniconda_prefix: path to the miniconda installation
         :type miniconda_prefix: str
         :param cxx_std: C++ Standard as number (options: 11, 14, 17)
         :type cxx_std: int
+        :param env: additional environment variables of the kernel (e.g. CUDA_CACHE_PATH)
+        :type env: Dict[str, str]
+        :param cuda: if true, create kernel description file with cuda support
+        :type cuda: bool
+        :param flags: additional arguments for xcpp
+        :type flags: List[str]
+        :param suffix: suffix of the display name
+        :type suffix: str
+        :param pool_size: number of prestarted kernels (see build_kernel_pool()), 0 to disable
+        :type pool_size: int
+        :param launcher: command, which starts the kernel (see build_kernel_governance())
+        :type launcher: List[str]
         :returns: json string
         :rtype: str
 
         """
-    return json.dumps(
-        {
-            "display_name": "Xeus-C++" + str(cxx_std) + "-CUDA",
-            "argv": [
-                miniconda_path + "/bin/xcpp",
-                "-f",
-                "{connection_file}",
-                "-std=c++" + str(cxx_std),
-                "-xcuda",
-            ],
-            "language": "C++" + str(cxx_std),
+    kernel_json = {
+        "display_name": "Xeus-C++"
+        + str(cxx_std)
+        + ("-CUDA" if cuda else "")
+        + suffix,
+        "argv": launcher
+        + [
+            miniconda_path + "/bin/xcpp",
+            "-f",
+            "{connection_file}",
+            "-std=c++" + str(cxx_std),
+        ]
+        + (["-xcuda"] if cuda else [])
+        + flags,
+        "language": "C++" + str(cxx_std),
+    }
+
+    if env:
+        kernel_json["env"] = dict(env)  # type: ignore
+
+    if pool_size:
+        kernel_json["metadata"] = {  # type: ignore
+            "kernel_provisioner": {
+                "provisioner_name": "xcc-pool-provisioner",
+                "config": {"pool_size": pool_size},
+            }
         }
-    )
+
+    return json.dumps(kernel_json)
 
 
-def gen_cling_jupyter_kernel(cxx_std: int, cuda: bool) -> str:
+def gen_cling_jupyter_kernel(
+    cxx_std: int,
+    cuda: bool,
+    env: Dict[str, str] = {},
+    flags: List[str] = [],
+    suffix: str = "",
+    launcher: List[str] = [],
+) -> str:
     """Generate jupyter kernel description files with cuda support for different C++ standards. The kernels uses the jupyter kernel of the cling project.
 
         :param cxx_std: C++ Standard as number (options: 11, 14, 17)
         :type cxx_std: int
         :param cuda: if true, create kernel description file with cuda support
         :type cuda: bool
+        :param env: additional environment variables of the kernel (e.g. CUDA_CACHE_PATH)
+        :type env: Dict[str, str]
+        :param flags: additional arguments for cling, passed via CLING_OPTS
+        :type flags: List[str]
+        :param suffix: suffix of the display name
+        :type suffix: str
+        :param launcher: command, which starts the kernel (see build_kernel_governance())
+        :type launcher: List[str]
         :returns: json string
         :rtype: str
 
         """
     kernel_json = {
-        "display_name": "Cling-C++" + str(cxx_std) + ("-CUDA" if cuda else ""),
-        "argv": [
+        "display_name": "Cling-C++" + str(cxx_std) + ("-CUDA" if cuda else "") + suffix,
+        "argv": launcher
+        + [
             "jupyter-cling-kernel",
             "-f",
             "{connection_file}",
@@ -245,7 +343,329 @@ def gen_cling_jupyter_kernel(cxx_std: int, cuda: bool) -> str:
         "language": "C++",
     }
 
-    if cuda:
-        kernel_json["env"] = {"CLING_OPTS": "-xcuda"}  # type: ignore
+    cling_opts = (["-xcuda"] if cuda else []) + flags
+    kernel_env: Dict[str, str] = {}
+    if cling_opts:
+        kernel_env["CLING_OPTS"] = " ".join(cling_opts)
+    kernel_env.update(env)
+    if kernel_env:
+        kernel_json["env"] = kernel_env  # type: ignore
 
     return json.dumps(kernel_json)
+
+
+def build_cuda_cache_warmup(config: xcc.config.XCC_Config) -> List[str]:
+    """Returns instructions to install the script xcc-warm-cuda-cache in the miniconda bin folder. The script compiles and runs a sample CUDA kernel with cling for each C++ standard and stores the JIT compiled code in CUDA_CACHE_PATH. The cache depends on the GPU and driver of the host system, therefore it cannot be populated at container build time and the script should be run once on the target system.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    script_path = config.get_miniconda_path() + "/bin/xcc-warm-cuda-cache"
+    sample_path = config.get_miniconda_path() + "/share/xeus-cling-cuda/warmup.cu"
+    cling_exe = config.get_cling_build()[0].install_path + "/bin/cling"
+
+    sample = [
+        "#include <cuda_runtime.h>",
+        "__global__ void xcc_warmup(int *p) { p[threadIdx.x] = threadIdx.x; }",
+        "int *xcc_warmup_ptr;",
+        "cudaMalloc(&xcc_warmup_ptr, 32 * sizeof(int));",
+        "xcc_warmup<<<1, 32>>>(xcc_warmup_ptr);",
+        "cudaDeviceSynchronize();",
+        "cudaFree(xcc_warmup_ptr);",
+        ".q",
+    ]
+
+    script = [
+        "#!/bin/bash",
+        "# populate the persistent CUDA compute cache of the jupyter kernels",
+    ]
+    for key, value in config.get_cuda_cache_env().items():
+        script.append('export {0}="{1}"'.format(key, value))
+    script += [
+        'mkdir -p "$CUDA_CACHE_PATH"',
+        "for std in 11 14 17; do",
+        "    echo \"warm up CUDA cache for C++$std\"",
+        "    "
+        + cling_exe
+        + " -xcuda -std=c++$std < "
+        + sample_path
+        + " > /dev/null || exit 1",
+        "done",
+    ]
+
+    cm = [
+        "",
+        "#/////////////////////////////",
+        "#// CUDA cache warmup script//",
+        "#/////////////////////////////",
+        "mkdir -p " + config.get_miniconda_path() + "/share/xeus-cling-cuda",
+    ]
+    redirect = " > "
+    for line in sample:
+        cm.append("echo '" + line + "'" + redirect + sample_path)
+        redirect = " >> "
+    redirect = " > "
+    for line in script:
+        cm.append("echo '" + line + "'" + redirect + script_path)
+        redirect = " >> "
+    cm.append("chmod 755 " + script_path)
+
+    return cm
+
+
+def gen_install_module_step(config: xcc.config.XCC_Config, module_path: str) -> str:
+    """Returns an instruction, which installs a python module of xcc/data in the site-packages folder of the miniconda installation. The module is embedded base64 encoded, which avoids quoting problems with the shell and the container formats.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param module_path: path of the module
+        :type module_path: str
+        :returns: bash command
+        :rtype: str
+
+        """
+    with open(module_path, "rb") as module_file:
+        module = base64.b64encode(module_file.read()).decode("ascii")
+
+    return (
+        "echo "
+        + module
+        + " | base64 -d > "
+        + get_site_packages_path(config)
+        + "/"
+        + os.path.basename(module_path)
+    )
+
+
+def get_site_packages_path(config: xcc.config.XCC_Config) -> str:
+    """Returns a bash expression, which is evaluated to the site-packages folder of the miniconda installation.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: bash expression
+        :rtype: str
+
+        """
+    return (
+        "$("
+        + config.get_miniconda_path()
+        + "/bin/python -c 'import site; print(site.getsitepackages()[0])')"
+    )
+
+
+def build_kernel_pool(config: xcc.config.XCC_Config) -> List[str]:
+    """Returns instructions to install the kernel pool (xcc/data/xcc_kernel_pool.py) in the miniconda installation. The module is registered as kernel provisioner xcc-pool-provisioner. The jupyter server configuration (see gen_jupyter_server_config()) starts the pools of all kernelspecs, which use the provisioner, when the server starts.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    dist_info = get_site_packages_path(config) + "/xcc_kernel_pool-1.0.dist-info"
+
+    return [
+        "",
+        "#/////////////////////////////",
+        "#// Jupyter kernel pool     //",
+        "#/////////////////////////////",
+        gen_install_module_step(config, kernel_pool_module),
+        # entry point of the kernel provisioner
+        "mkdir -p " + dist_info,
+        "printf 'Metadata-Version: 2.1\\nName: xcc-kernel-pool\\nVersion: 1.0\\n' > "
+        + dist_info
+        + "/METADATA",
+        "printf '[jupyter_client.kernel_provisioners]\\nxcc-pool-provisioner = xcc_kernel_pool:PooledProvisioner\\n' > "
+        + dist_info
+        + "/entry_points.txt",
+    ]
+
+
+def get_kernel_launcher_path(config: xcc.config.XCC_Config) -> str:
+    """Returns the path of the kernel launcher script (see build_kernel_governance()).
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: path
+        :rtype: str
+
+        """
+    return config.get_miniconda_path() + "/bin/xcc-kernel-launcher"
+
+
+def build_kernel_governance(config: xcc.config.XCC_Config) -> List[str]:
+    """Returns instructions to install the parts of the kernel resource limits, which are not part of the jupyter server configuration (see gen_jupyter_server_config()).
+
+    * the kernel launcher xcc-kernel-launcher, which starts each kernel with a memory limit; it uses a cgroup via systemd-run if possible, otherwise an address space limit (ulimit -v) or for CUDA kernels a data segment limit (ulimit -d), because the CUDA driver reserves a large virtual address space
+    * the kernel manager xcc_kernel_limits.LimitedKernelManager, which limits the number of running kernels
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    cm: List[str] = []
+
+    if config.kernel_memory_limit:
+        launcher_path = get_kernel_launcher_path(config)
+        limit_kb = int(config.kernel_memory_limit * 1024 * 1024)
+        script = [
+            "#!/bin/bash",
+            "# usage: xcc-kernel-launcher <cuda: 0 or 1> <kernel command>",
+            "# the limit in KB can be changed with XCC_KERNEL_MEMORY_LIMIT_KB, 0 disables the limit",
+            "limit_kb=${XCC_KERNEL_MEMORY_LIMIT_KB:-" + str(limit_kb) + "}",
+            "cuda=$1",
+            "shift",
+            'if [ "$limit_kb" -gt 0 ]; then',
+            "    if command -v systemd-run > /dev/null && systemd-run --user --scope --quiet -p MemoryMax=${limit_kb}K true 2> /dev/null; then",
+            '        exec systemd-run --user --scope --quiet -p MemoryMax=${limit_kb}K -p MemorySwapMax=0 -- "$@"',
+            "    fi",
+            '    if [ "$cuda" = "1" ]; then',
+            "        ulimit -d $limit_kb",
+            "    else",
+            "        ulimit -v $limit_kb",
+            "    fi",
+            "fi",
+            'exec "$@"',
+        ]
+        cm += [
+            "",
+            "#/////////////////////////////",
+            "#// Jupyter kernel launcher //",
+            "#/////////////////////////////",
+        ]
+        redirect = " > "
+        for line in script:
+            cm.append("echo '" + line + "'" + redirect + launcher_path)
+            redirect = " >> "
+        cm.append("chmod 755 " + launcher_path)
+
+    if config.kernel_max_count:
+        cm += [
+            "",
+            "#/////////////////////////////",
+            "#// Jupyter kernel limits   //",
+            "#/////////////////////////////",
+            gen_install_module_step(config, kernel_limits_module),
+        ]
+
+    return cm
+
+
+def build_kernel_allocator(config: xcc.config.XCC_Config) -> List[str]:
+    """Returns instructions to install the memory allocator of the kernels as pinned conda-forge package. The allocator is preloaded and configured by the environment of the kernelspecs (see xcc.config.XCC_Config.get_kernel_allocator_env()). If any allocator setting is used, the script xcc-malloc-bench (xcc/data/xcc_malloc_bench.py) is installed, which compares the memory usage of cling with the glibc allocator and with the settings of a kernelspec.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands, empty if the kernels use the default glibc settings
+        :rtype: List[str]
+
+        """
+    if not config.get_kernel_allocator_env():
+        return []
+
+    bench_path = config.get_miniconda_path() + "/bin/xcc-malloc-bench"
+    with open(malloc_bench_script, "rb") as script_file:
+        script = base64.b64encode(script_file.read()).decode("ascii")
+
+    cm = [
+        "",
+        "#/////////////////////////////",
+        "#// Kernel memory allocator //",
+        "#/////////////////////////////",
+    ]
+    if config.kernel_allocator in xcc.config.allocator_packages:
+        cm.append(
+            config.get_miniconda_path()
+            + "/bin/conda install -y --freeze-installed -c conda-forge "
+            + xcc.config.allocator_packages[config.kernel_allocator]
+        )
+        # fail at build time and not at each kernel start
+        cm.append("test -f " + config.get_kernel_allocator_env()["LD_PRELOAD"])
+    cm += [
+        "echo '#!" + config.get_miniconda_path() + "/bin/python' > " + bench_path,
+        "echo " + script + " | base64 -d >> " + bench_path,
+        "chmod 755 " + bench_path,
+    ]
+
+    return cm
+
+
+def gen_jupyter_server_config(config: xcc.config.XCC_Config) -> List[str]:
+    """Returns the lines of the jupyter server configuration (jupyter_server_config.py) for the kernel pool and the kernel resource limits.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: python lines, empty if no configuration is required
+        :rtype: List[str]
+
+        """
+    lines: List[str] = []
+
+    if config.kernel_pool_size:
+        lines += ["import xcc_kernel_pool", "xcc_kernel_pool.prewarm()"]
+
+    if config.kernel_cull_idle_timeout:
+        lines += [
+            "c.MappingKernelManager.cull_idle_timeout = "
+            + str(config.kernel_cull_idle_timeout),
+            "c.MappingKernelManager.cull_interval = "
+            + str(min(60, config.kernel_cull_idle_timeout)),
+            # abandoned browser tabs keep the kernel connected
+            "c.MappingKernelManager.cull_connected = True",
+            "c.MappingKernelManager.cull_busy = False",
+        ]
+
+    if config.kernel_max_count:
+        # the prestarted kernels of all xeus-cling kernelspecs count against
+        # the limit (see xcc/data/xcc_kernel_limits.py)
+        pooled_kernels = (
+            config.kernel_pool_size
+            * len(default_kernel_standards)
+            * len(default_kernel_backends.get("xeus-cling", []))
+        )
+        if config.kernel_max_count <= pooled_kernels:
+            raise ValueError(
+                "kernel_max_count have to be greater than the "
+                + str(pooled_kernels)
+                + " prestarted kernels of the kernel pool"
+            )
+        lines += [
+            'c.ServerApp.kernel_manager_class = "xcc_kernel_limits.LimitedKernelManager"',
+            "c.LimitedKernelManager.max_kernels = " + str(config.kernel_max_count),
+        ]
+
+    return lines
+
+
+def build_jupyter_server_config(config: xcc.config.XCC_Config) -> List[str]:
+    """Returns instructions to write the jupyter server configuration (see gen_jupyter_server_config()) in the miniconda installation.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands, empty if no configuration is required
+        :rtype: List[str]
+
+        """
+    lines = gen_jupyter_server_config(config)
+    if not lines:
+        return []
+
+    config_path = config.get_miniconda_path() + "/etc/jupyter/jupyter_server_config.py"
+    cm = [
+        "",
+        "#/////////////////////////////",
+        "#// Jupyter server config   //",
+        "#/////////////////////////////",
+        "mkdir -p " + config.get_miniconda_path() + "/etc/jupyter",
+    ]
+    redirect = " > "
+    for line in lines:
+        cm.append("echo '" + line + "'" + redirect + config_path)
+        redirect = " >> "
+
+    return cm
@@ -0,0 +1,45 @@
+"""Function to register the library folders of the release container with
+ldconfig and check the library resolution of the kernels.
+"""
+
+from typing import List
+
+import xcc.config
+
+# configuration file of the dynamic linker, which contains the library
+# folders of the installation
+ld_config_path = "/etc/ld.so.conf.d/xcc.conf"
+
+
+def build_ld_config(config: xcc.config.XCC_Config) -> List[str]:
+    """Return instructions, which register <install_prefix>/lib in the cache of the dynamic linker and check with ldd that all shared libraries of cling, xcpp, the cling jupyter kernel and openssl are found without LD_LIBRARY_PATH. The libraries in the miniconda installation are not registered, because they would shadow the system libraries of all processes in the container. They are found via the RPATH of the projects (see xcc.config.XCC_Config.get_cmake_rpath_args()).
+
+    :param config: Configuration object, which contains different information for the stage
+    :type config: xcc.config.XCC_Config
+    :returns: list of bash commands
+    :rtype: List[str]
+
+    """
+    binaries = [
+        config.install_prefix + "/bin/cling",
+        config.get_miniconda_path() + "/bin/xcpp",
+        config.install_prefix + "/lib/libclingJupyter.so",
+        config.install_prefix + "/lib/libssl.so",
+        config.install_prefix + "/lib/libcrypto.so",
+        config.install_prefix + "/bin/openssl",
+    ]
+
+    return [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Register libraries                                    //",
+        "#///////////////////////////////////////////////////////////",
+        "echo " + config.install_prefix + "/lib > " + ld_config_path,
+        "ldconfig",
+        # the pipe hides the exit code of ldd for files, which are not
+        # dynamic executables
+        "for f in "
+        + " ".join(binaries)
+        + "; do if [ -e $f ] && env -u LD_LIBRARY_PATH ldd $f | grep 'not found'; "
+        + "then echo \"unresolved libraries of $f\"; exit 1; fi; done",
+    ]
@@ -0,0 +1,151 @@
+"""Functions to generate a whole matrix of recipes in one call. Steps, which
+are shared by different recipes, are only computed once (see
+xcc.helper.pure_step()).
+
+"""
+
+from typing import Dict, List, Union
+import hashlib
+import itertools
+import json
+import os
+
+import xcc.generator
+
+
+def get_recipe_name(
+    kind: str,
+    container: str,
+    clang_version: int,
+    build_libcxx: bool,
+    build_type: str,
+    cpu_target: str = "",
+) -> str:
+    """Returns the file name of a recipe in the matrix.
+
+        :param kind: 'rel' or 'dev'
+        :type kind: str
+        :param container: 'docker' or 'singularity'
+        :type container: str
+        :param clang_version: version of the project clang compiler
+        :type clang_version: int
+        :param build_libcxx: build the stack with libc++
+        :type build_libcxx: bool
+        :param build_type: CMAKE_BUILD_TYPE
+        :type build_type: str
+        :param cpu_target: target cpu (see xcc.config.XCC_Config), empty for the portable recipe
+        :type cpu_target: str
+        :returns: file name
+        :rtype: str
+
+        """
+    return "{0}-{1}-clang{2}-{3}-{4}{5}.{6}".format(
+        kind,
+        container,
+        clang_version,
+        "libcxx" if build_libcxx else "libstdcxx",
+        build_type.lower(),
+        "-" + cpu_target if cpu_target else "",
+        "def" if container == "singularity" else "dockerfile",
+    )
+
+
+def gen_recipe_matrix(
+    out_dir: str,
+    containers: List[str] = ["singularity"],
+    clang_versions: List[int] = [8, 9],
+    build_libcxx: List[bool] = [False, True],
+    build_types: List[str] = ["RELEASE"],
+    kinds: List[str] = ["rel", "dev"],
+    project_path: str = "/tmp/xcc_project",
+    threads: Union[int, None] = None,
+    linker_threads: Union[int, None] = None,
+    cpu_targets: List[str] = [""],
+) -> List[Dict]:
+    """Generate the recipes of all combinations of kind x container x clang version x libc++ x build type x cpu target and write them to out_dir. The list of recipes is also stored in out_dir/manifest.json. The development container only supports singularity, therefore docker is skipped for kind 'dev'.
+
+        :param out_dir: folder of the recipes and the manifest, will be created if not existing
+        :type out_dir: str
+        :param containers: 'docker' and/or 'singularity'
+        :type containers: List[str]
+        :param clang_versions: versions of the project clang compiler
+        :type clang_versions: List[int]
+        :param build_libcxx: build the stack with libc++ and/or libstdc++
+        :type build_libcxx: List[bool]
+        :param build_types: CMAKE_BUILD_TYPEs
+        :type build_types: List[str]
+        :param kinds: 'rel' and/or 'dev'
+        :type kinds: List[str]
+        :param project_path: project path of the development container
+        :type project_path: str
+        :param threads: number of build threads for make (None for all available threads)
+        :type threads: int
+        :param linker_threads: number of linker threads for ninja (if None, same number like threads)
+        :type linker_threads: int
+        :param cpu_targets: target cpus (see xcc.config.XCC_Config), the empty string is the portable recipe
+        :type cpu_targets: List[str]
+        :returns: manifest entries
+        :rtype: List[Dict]
+
+        """
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest: List[Dict] = []
+
+    for (
+        kind,
+        container,
+        clang_version,
+        libcxx,
+        build_type,
+        cpu_target,
+    ) in itertools.product(
+        kinds, containers, clang_versions, build_libcxx, build_types, cpu_targets
+    ):
+        if kind == "dev" and container != "singularity":
+            continue
+
+        xcc_gen = xcc.generator.XCC_gen(
+            container=container,
+            build_type=build_type,
+            threads=threads,
+            linker_threads=linker_threads,
+            clang_version=clang_version,
+            build_libcxx=libcxx,
+            cpu_target=cpu_target,
+        )
+
+        if kind == "rel":
+            stage = xcc_gen.gen_release_single_stage()
+        elif kind == "dev":
+            stage = xcc_gen.gen_devel_stage(project_path=project_path)
+        else:
+            raise ValueError("unknown recipe kind: " + kind)
+
+        # the container format is a global setting of hpccm, therefore
+        # the recipe has to be rendered before the next recipe is generated
+        recipe = str(stage)
+
+        name = get_recipe_name(
+            kind, container, clang_version, libcxx, build_type, cpu_target
+        )
+        with open(os.path.join(out_dir, name), "w") as recipe_file:
+            recipe_file.write(recipe)
+
+        manifest.append(
+            {
+                "file": name,
+                "kind": kind,
+                "container": container,
+                "clang_version": clang_version,
+                "build_libcxx": libcxx,
+                "build_type": build_type,
+                "cpu_target": cpu_target,
+                "sha256": hashlib.sha256(recipe.encode("utf-8")).hexdigest(),
+            }
+        )
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    return manifest
@@ -6,6 +6,35 @@ from typing import Tuple, List, Dict
 from hpccm.templates.rm import rm
 
 import xcc.config
+from xcc.helper import fetch_step
+
+# test and test data folders of the packages, some of them contain files with
+# invalid syntax (e.g. python 2 files of lib2to3), therefore they are not
+# compiled and not checked
+bytecode_exclude = "/(tests?|test_data|testdata)/"
+
+# test suites in site-packages, which are not imported at runtime and are
+# removed by the cleanup
+cleanup_test_dirs = [
+    "IPython/*/tests",
+    "IPython/*/*/tests",
+    "ipykernel/tests",
+    "ipywidgets/widgets/tests",
+    "jupyter_client/tests",
+    "jupyter_core/tests",
+    "jupyterlab/tests",
+    "jupyterlab_server/tests",
+    "nbconvert/tests",
+    "nbconvert/*/tests",
+    "nbformat/tests",
+    "nbformat/*/tests",
+    "notebook/tests",
+    "notebook/*/tests",
+    "tornado/test",
+    "traitlets/tests",
+    "traitlets/*/tests",
+    "zmq/tests",
+]
 
 
 def build_miniconda(config: xcc.config.XCC_Config) -> Tuple[List[str], Dict[str, str]]:
@@ -19,13 +48,20 @@ def build_miniconda(config: xcc.config.XCC_Config) -> Tuple[List[str], Dict[str,
         """
     conda_bin = config.install_prefix + "/miniconda3/bin/"
     conda_exe = conda_bin + "conda"
+    download = "wget https://repo.continuum.io/miniconda/Miniconda3-latest-Linux-x86_64.sh"
     cm = [
         "",
         "#///////////////////////////////////////////////////////////",
         "#// Install Miniconda 3                                   //",
         "#///////////////////////////////////////////////////////////",
         "cd /tmp",
-        "wget https://repo.continuum.io/miniconda/Miniconda3-latest-Linux-x86_64.sh",
+        fetch_step(
+            config,
+            "/tmp/Miniconda3-latest-Linux-x86_64.sh",
+            # the prefetch step does not run in /tmp
+            "cd /tmp && " + download if config.prefetch else download,
+            "test -s /tmp/Miniconda3-latest-Linux-x86_64.sh",
+        ),
         "chmod u+x Miniconda3-latest-Linux-x86_64.sh",
         "./Miniconda3-latest-Linux-x86_64.sh -b -p "
         + config.install_prefix
@@ -36,9 +72,139 @@ def build_miniconda(config: xcc.config.XCC_Config) -> Tuple[List[str], Dict[str,
         conda_exe + " install -y -c conda-forge jupyterlab",
         conda_exe + " install -y -c biobuilds libuuid",
         conda_exe + " install -y widgetsnbextension -c conda-forge",
-        conda_bin + "jupyter labextension install @jupyter-widgets/jupyterlab-manager",
         "rm /tmp/Miniconda3-latest-Linux-x86_64.sh",
         "cd -",
     ]
 
     return cm, {"PATH": "$PATH:" + conda_bin}
+
+
+def build_conda_packages(
+    config: xcc.config.XCC_Config, packages: List[str]
+) -> List[str]:
+    """Return instructions to install prebuilt packages from conda-forge in a single conda transaction.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param packages: pinned package specs (e.g. xtl=0.6.9)
+        :type packages: List[str]
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    conda_exe = config.get_miniconda_path() + "/bin/conda"
+    return [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Install prebuilt conda packages                       //",
+        "#///////////////////////////////////////////////////////////",
+        # the packages of the miniconda installation (e.g. python, openssl
+        # and libstdc++) are not replaced by conda-forge builds
+        conda_exe
+        + " install -y --freeze-installed -c conda-forge "
+        + " ".join(packages),
+    ]
+
+
+def build_miniconda_cleanup(config: xcc.config.XCC_Config) -> List[str]:
+    """Return instructions to reduce the size of the miniconda installation. Have to be executed after all conda and pip installations and after building the jupyterlab extensions.
+
+    * remove build-only packages (nodejs)
+    * remove the package cache and tarballs
+    * remove the test suites of cleanup_test_dirs, static libraries with a shared counterpart and .pyc files of not used optimization levels
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    miniconda_path = config.get_miniconda_path()
+    conda_exe = miniconda_path + "/bin/conda"
+
+    cm = [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Reduce Miniconda Size                                 //",
+        "#///////////////////////////////////////////////////////////",
+        'echo "miniconda size before cleanup: $(du -sh ' + miniconda_path + ' | cut -f1)"',
+        # nodejs is only required to build the jupyterlab extensions
+        conda_exe + " remove -y --force-remove nodejs",
+        conda_exe + " clean -y --all",
+        "cd " + miniconda_path + "/lib/python3*/site-packages",
+        "rm -rf " + " ".join(cleanup_test_dirs),
+        "cd -",
+        # static libraries without shared library are kept, e.g. for projects
+        # which are linked against the prebuilt conda packages
+        "for a in "
+        + miniconda_path
+        + '/lib/*.a; do if [ -e "${a%.a}.so" ]; then echo "remove $a"; rm "$a"; fi; done',
+    ]
+    # the .pyc files of the optimization level 0 are used by default
+    for level in [1, 2]:
+        if level not in config.bytecode_optimize:
+            cm.append(
+                "find "
+                + miniconda_path
+                + " -name '*.opt-"
+                + str(level)
+                + ".pyc' -delete"
+            )
+    cm.append(
+        'echo "miniconda size after cleanup: $(du -sh ' + miniconda_path + ' | cut -f1)"'
+    )
+
+    return cm
+
+
+def build_python_bytecode(config: xcc.config.XCC_Config) -> List[str]:
+    """Return instructions to compile the python bytecode of the miniconda installation and the cling jupyter kernel ahead of time. The container is read-only, therefore python cannot write __pycache__ at runtime and compiles all imported modules at every start. Test folders (see bytecode_exclude) are skipped. Afterwards, a check fails the build if .pyc files of the other sources are stale or missing.
+
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :returns: list of bash commands
+        :rtype: List[str]
+
+        """
+    python_exe = config.get_miniconda_path() + "/bin/python"
+    # the stdlib and site-packages folder depends on the python version
+    # of the latest miniconda
+    source_dirs = [config.get_miniconda_path() + "/lib/python3*"]
+    for build in config.get_cling_build():
+        source_dirs.append(build.install_path + "/share/cling/Jupyter/kernel")
+
+    opt_levels = [str(level) for level in config.bytecode_optimize]
+
+    cm = [
+        "",
+        "#///////////////////////////////////////////////////////////",
+        "#// Compile Python Bytecode                               //",
+        "#///////////////////////////////////////////////////////////",
+        # compile errors are printed, the check below decides if the build
+        # fails
+        python_exe
+        + " -m compileall -q -j 0 "
+        + " ".join(["-o " + level for level in opt_levels])
+        + " -x '"
+        + bytecode_exclude
+        + "' "
+        + " ".join(source_dirs)
+        + " || echo 'compileall reported errors'",
+        python_exe
+        + ' -c "import os, re, sys, importlib.util as u; '
+        + "lv = [int(l) for l in sys.argv[1].split(',')]; "
+        + "src = [p for d in sys.argv[3:] for r, _, fs in os.walk(d) for f in fs if f.endswith('.py') "
+        + "for p in [os.path.join(r, f)] if not re.search(sys.argv[2], p)]; "
+        + "bad = [(s, l) for s in src for l in lv for c in [u.cache_from_source(s, optimization='' if l == 0 else l)] "
+        + "if not os.path.exists(c) or os.path.getmtime(c) < os.path.getmtime(s)]; "
+        + "print('pyc check: ' + str(len(src)) + ' sources, ' + str(len(bad)) + ' stale or missing .pyc files'); "
+        + "[print('  ' + s + ' (optimization ' + str(l) + ')') for s, l in bad[:20]]; "
+        + "sys.exit(1 if bad else 0)\" "
+        + ",".join(opt_levels)
+        + " '"
+        + bytecode_exclude
+        + "' "
+        + " ".join(source_dirs),
+    ]
+
+    return cm
@@ -7,10 +7,11 @@ from hpccm.templates.wget import wget
 from hpccm.templates.tar import tar
 
 import xcc.config
+from xcc.helper import fingerprint_configure_step, fetch_step
 
 
 def build_openssl(
-    name: str, config: xcc.config.XCC_Config,
+    name: str, config: xcc.config.XCC_Config, opts: List[str] = [],
 ) -> Tuple[List[str], Dict[str, str]]:
     """install openssl
 
@@ -18,6 +19,8 @@ def build_openssl(
         :type name: str
         :param config: Configuration object, which contains different information for the stage
         :type config: xcc.config.XCC_Config
+        :param opts: additional arguments of the configure script (e.g. no-tests)
+        :type opts: List[str]
         :returns: list of bash commands and dictionary of environment variables
         :rtype: List[str], {str,str}
 
@@ -32,27 +35,77 @@ def build_openssl(
     ]
     wget_ssl = wget()
     tar_ssl = tar()
-    cm.append(
-        wget_ssl.download_step(
-            url="https://www.openssl.org/source/" + name + ".tar.gz",
-            directory=config.build_prefix,
-        )
+    download_step = wget_ssl.download_step(
+        url="https://www.openssl.org/source/" + name + ".tar.gz",
+        directory=config.build_prefix,
     )
-    cm.append(
-        tar_ssl.untar_step(
-            tarball=config.build_prefix + "/" + name + ".tar.gz",
-            directory=config.build_prefix,
-        )
+    tarball = config.build_prefix + "/" + name + ".tar.gz"
+    untar_step = tar_ssl.untar_step(tarball=tarball, directory=config.build_prefix,)
+    # the configure script of openssl uses the LDFLAGS environment variable
+    ldflags = (
+        "LDFLAGS=" + config.get_linker_flag() + " " if config.get_linker_flag() else ""
     )
-    cm.append("cd " + config.build_prefix + "/" + name)
-    cm.append(
-        "./config --prefix=" + config.install_prefix + " -Wl,-rpath=/usr/local/lib"
+    configure_step = (
+        ldflags
+        + "./config --prefix="
+        + config.install_prefix
+        # relative RPATH like the cmake projects (see
+        # XCC_Config.get_cmake_rpath_args()), make turns $$ into $ and the
+        # backslash protects $ORIGIN from the shell of the link command
+        + (" '-Wl,-rpath,\\$$ORIGIN/../lib'" if config.rpath else " -Wl,-rpath=/usr/local/lib")
+        + "".join(" " + f for f in config.get_cpu_target_flags())
+        + "".join(" " + o for o in opts)
     )
-    cm.append("make -j" + make_threads)
-    cm.append("make install -j" + make_threads)
+
+    if config.incremental:
+        # openssl builds in source, therefore the source folder is also
+        # the build folder
+        source_path = config.build_prefix + "/" + name
+        if config.prefetch:
+            cm.append(
+                fetch_step(
+                    config,
+                    tarball,
+                    # the group keeps the precedence, if the command is
+                    # chained with && by the prefetch step
+                    "[ -d " + source_path + " ] || { " + download_step + "; }",
+                    "[ -d " + source_path + " ] || { gzip -t " + tarball + "; }",
+                )
+            )
+            cm.append("if [ ! -d " + source_path + " ]; then " + untar_step + "; fi")
+        else:
+            cm.append(
+                "if [ ! -d "
+                + source_path
+                + " ]; then "
+                + download_step
+                + " && "
+                + untar_step
+                + "; fi"
+            )
+        cm.append("cd " + source_path)
+        cm += fingerprint_configure_step(
+            config=config,
+            configure_step=configure_step,
+            build_directory=source_path,
+            clean_step="make clean > /dev/null 2>&1 || true",
+        )
+    else:
+        cm.append(fetch_step(config, tarball, download_step, "gzip -t " + tarball))
+        cm.append(untar_step)
+        cm.append("cd " + config.build_prefix + "/" + name)
+        cm.append(configure_step)
+    if config.slim_build:
+        # build and install only the libraries and programs without the
+        # documentation and man pages
+        cm.append("make build_sw -j" + make_threads)
+        cm.append("make install_sw -j" + make_threads)
+    else:
+        cm.append("make -j" + make_threads)
+        cm.append("make install -j" + make_threads)
     cm.append("cd -")
     if not config.keep_build:
         config.paths_to_delete.append(config.build_prefix + "/" + name)
-        config.paths_to_delete.append(config.build_prefix + "/" + name + ".tar.gz")
+        config.paths_to_delete.append(tarball)
 
     return cm, {"OPENSSL_ROOT_DIR": config.install_prefix}
@@ -0,0 +1,439 @@
+"""Functions to estimate the resources of a container build before it runs.
+The estimates are based on a built-in cost table, which can be refined with
+the data of past builds (see load_cost_table()).
+
+"""
+
+from typing import Dict, List, Union
+from copy import deepcopy
+import json
+import os
+import shutil
+
+import xcc.config
+
+# costs of the projects
+# * base_gb: memory independent of the number of jobs in GB (optional, default 0)
+# * compile_gb: memory per compile job in GB
+# * link_gb: memory per link job in GB (only projects with a separate link pool)
+# * disk_gb: disk usage of the source and build folder in GB
+# * core_hours: CPU time of the build in hours
+# * serial_hours: time of the not parallelized parts (e.g. downloads, configure)
+# projects, which depends on the CMAKE_BUILD_TYPE, contains an entry per build type
+# projects, which are not in the table, use the entry "default"
+default_cost_table: Dict[str, Dict] = {
+    "default": {
+        "compile_gb": 0.3,
+        "link_gb": 0.3,
+        "disk_gb": 0.2,
+        "core_hours": 0.05,
+        "serial_hours": 0.02,
+    },
+    "miniconda3": {
+        "base_gb": 1.0,
+        "compile_gb": 0.0,
+        "link_gb": 0.0,
+        "disk_gb": 3.0,
+        "core_hours": 0.0,
+        "serial_hours": 0.3,
+    },
+    "jupyterlab": {
+        "base_gb": 2.0,
+        "compile_gb": 0.0,
+        "link_gb": 0.0,
+        "disk_gb": 0.5,
+        "core_hours": 0.0,
+        "serial_hours": 0.1,
+    },
+    "openssl": {
+        "compile_gb": 0.3,
+        "link_gb": 0.3,
+        "disk_gb": 0.5,
+        "core_hours": 0.15,
+        "serial_hours": 0.02,
+    },
+    "cling": {
+        "RELEASE": {
+            "compile_gb": 1.0,
+            "link_gb": 6.0,
+            "disk_gb": 12.0,
+            "core_hours": 8.0,
+            "serial_hours": 0.2,
+        },
+        "DEBUG": {
+            "compile_gb": 1.5,
+            "link_gb": 9.0,
+            "disk_gb": 80.0,
+            "core_hours": 10.0,
+            "serial_hours": 0.3,
+        },
+        "RELWITHDEBINFO": {
+            "compile_gb": 1.5,
+            "link_gb": 8.0,
+            "disk_gb": 40.0,
+            "core_hours": 10.0,
+            "serial_hours": 0.3,
+        },
+        "MINSIZEREL": {
+            "compile_gb": 1.0,
+            "link_gb": 5.0,
+            "disk_gb": 10.0,
+            "core_hours": 8.0,
+            "serial_hours": 0.2,
+        },
+    },
+    "clangd-indexer": {
+        "compile_gb": 1.0,
+        "link_gb": 3.0,
+        "disk_gb": 6.0,
+        "core_hours": 3.0,
+        "serial_hours": 0.1,
+    },
+    "jupyter_kernel": {
+        "compile_gb": 0.0,
+        "link_gb": 0.0,
+        "disk_gb": 0.0,
+        "core_hours": 0.0,
+        "serial_hours": 0.01,
+    },
+    "miniconda_cleanup": {
+        "compile_gb": 0.0,
+        "link_gb": 0.0,
+        "disk_gb": 0.0,
+        "core_hours": 0.0,
+        "serial_hours": 0.05,
+    },
+    "python_bytecode": {
+        "compile_gb": 0.05,
+        "link_gb": 0.0,
+        "disk_gb": 0.1,
+        "core_hours": 0.1,
+        "serial_hours": 0.01,
+    },
+    "xeus-cling": {
+        "compile_gb": 2.0,
+        "link_gb": 2.0,
+        "disk_gb": 1.0,
+        "core_hours": 0.5,
+        "serial_hours": 0.02,
+    },
+    "xeus": {
+        "compile_gb": 1.0,
+        "link_gb": 1.0,
+        "disk_gb": 0.3,
+        "core_hours": 0.2,
+        "serial_hours": 0.02,
+    },
+    "libzmq": {
+        "compile_gb": 0.5,
+        "link_gb": 0.5,
+        "disk_gb": 0.3,
+        "core_hours": 0.2,
+        "serial_hours": 0.02,
+    },
+}
+
+
+# memory usage of a link job relative to gold
+linker_memory_factor = {"gold": 1.0, "lld": 0.6, "default": 1.5}
+
+
+def load_cost_table(path: str = "") -> Dict[str, Dict]:
+    """Returns the built-in cost table. If a path is set, the entries of the json file overwrite the built-in entries, e.g. {"cling" : {"RELEASE" : {"core_hours" : 6.5}}}.
+
+        :param path: path to a json file with costs of past builds
+        :type path: str
+        :returns: cost table
+        :rtype: Dict[str, Dict]
+
+        """
+    table = deepcopy(default_cost_table)
+    if not path:
+        return table
+
+    with open(path) as cost_file:
+        refined = json.load(cost_file)
+
+    for name, costs in refined.items():
+        entry = table.setdefault(name, deepcopy(table["default"]))
+        for key, value in costs.items():
+            if isinstance(value, dict):
+                if key not in entry:
+                    # the costs of a new build type start with the flat costs
+                    # of the project or the default costs
+                    flat = {k: v for k, v in entry.items() if not isinstance(v, dict)}
+                    entry[key] = flat if flat else deepcopy(table["default"])
+                entry[key].update(value)
+            else:
+                entry[key] = value
+
+    return table
+
+
+def get_project_costs(
+    cost_table: Dict[str, Dict], name: str, build_type: str
+) -> Dict[str, float]:
+    """Returns the costs of a project for a build type.
+
+        :param cost_table: cost table (see load_cost_table())
+        :type cost_table: Dict[str, Dict]
+        :param name: name of the project
+        :type name: str
+        :param build_type: CMAKE_BUILD_TYPE
+        :type build_type: str
+        :returns: costs of the project
+        :rtype: Dict[str, float]
+
+        """
+    entry = cost_table.get(name, cost_table["default"])
+    if build_type in entry:
+        return entry[build_type]
+    return entry
+
+
+def get_host_resources(path: str) -> Dict[str, float]:
+    """Returns the number of threads, the memory in GB and the free disk space in GB of the host system.
+
+        :param path: path of the build folder, the next existing parent folder is used for the disk space
+        :type path: str
+        :returns: threads, memory_gb and disk_gb
+        :rtype: Dict[str, float]
+
+        """
+    memory_gb = 0.0
+    if os.path.exists("/proc/meminfo"):
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemTotal:"):
+                    memory_gb = int(line.split()[1]) / 1024 ** 2
+
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+
+    return {
+        "threads": float(os.cpu_count() or 1),
+        "memory_gb": memory_gb,
+        "disk_gb": shutil.disk_usage(path).free / 1024 ** 3,
+    }
+
+
+def plan_build(
+    project_list: List[Dict],
+    config: xcc.config.XCC_Config,
+    cost_table: Dict[str, Dict],
+    threads: int,
+    runscript_projects: List[str] = [],
+) -> List[Dict]:
+    """Estimate peak memory, disk usage and wall time of each project.
+
+        :param project_list: project list of the generator (XCC_gen.project_list)
+        :type project_list: List[Dict]
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param cost_table: cost table (see load_cost_table())
+        :type cost_table: Dict[str, Dict]
+        :param threads: number of compile threads, which are used if config.compiler_threads is 0 or None
+        :type threads: int
+        :param runscript_projects: names of the projects, which are built by the runscript of the dev container
+        :type runscript_projects: List[str]
+        :returns: list of estimates with name, location, memory_gb, disk_gb and hours
+        :rtype: List[Dict]
+
+        """
+    compile_jobs = config.compiler_threads if config.compiler_threads else threads
+    link_jobs = config.linker_threads if config.linker_threads else compile_jobs
+
+    build_types = [config.build_type]
+    if config.second_build_type:
+        build_types.append(config.second_build_type)
+
+    plan: List[Dict] = []
+    for p in project_list:
+        # prebuilt conda packages are not built
+        if p.get("provider") == "conda":
+            continue
+        # only cling and xeus-cling support a dual build
+        types = build_types if p["name"] in ["cling", "xeus-cling"] else build_types[:1]
+        estimate = {
+            "name": p["name"],
+            "location": "runscript" if p["name"] in runscript_projects else "container",
+            "memory_gb": 0.0,
+            "disk_gb": 0.0,
+            "hours": 0.0,
+        }
+        for build_type in types:
+            costs = get_project_costs(cost_table, p["name"], build_type)
+            # only cling uses a separate link pool, the other projects link
+            # with the compile jobs
+            jobs = link_jobs if p["name"] == "cling" else compile_jobs
+            link_gb = costs["link_gb"] * linker_memory_factor[config.linker]
+            estimate["memory_gb"] = max(
+                estimate["memory_gb"],
+                costs.get("base_gb", 0.0)
+                + max(costs["compile_gb"] * compile_jobs, link_gb * jobs),
+            )
+            estimate["disk_gb"] += costs["disk_gb"]
+            estimate["hours"] += (
+                costs["core_hours"] / compile_jobs + costs["serial_hours"]
+            )
+        plan.append(estimate)
+
+    return plan
+
+
+def check_plan(
+    plan: List[Dict],
+    config: xcc.config.XCC_Config,
+    cost_table: Dict[str, Dict],
+    host: Dict[str, float],
+    threads: int,
+) -> List[str]:
+    """Compare the estimates with the resources of the host and returns warnings and suggestions.
+
+        :param plan: estimates of plan_build()
+        :type plan: List[Dict]
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param cost_table: cost table (see load_cost_table())
+        :type cost_table: Dict[str, Dict]
+        :param host: resources of the host (see get_host_resources())
+        :type host: Dict[str, float]
+        :param threads: number of compile threads, which are used if config.compiler_threads is 0 or None
+        :type threads: int
+        :returns: list of warnings
+        :rtype: List[str]
+
+        """
+    warnings: List[str] = []
+    # leave some memory for the system
+    memory_limit = host["memory_gb"] * 0.9
+
+    compile_jobs = config.compiler_threads if config.compiler_threads else threads
+    if compile_jobs > host["threads"]:
+        warnings.append(
+            "{0} compile threads, but the host has only {1:.0f} threads".format(
+                compile_jobs, host["threads"]
+            )
+        )
+
+    for estimate in plan:
+        if estimate["memory_gb"] > memory_limit:
+            warnings.append(
+                "{0}: estimated peak memory {1:.1f} GB exceeds {2:.1f} GB".format(
+                    estimate["name"], estimate["memory_gb"], memory_limit
+                )
+            )
+
+    for build_type in set([config.build_type, config.second_build_type]) - set([""]):
+        costs = get_project_costs(cost_table, "cling", build_type)
+        max_compile = int(memory_limit / max(costs["compile_gb"], 0.01))
+        link_gb = costs["link_gb"] * linker_memory_factor[config.linker]
+        max_link = int(memory_limit / max(link_gb, 0.01))
+        linker_jobs = config.linker_threads if config.linker_threads else compile_jobs
+        if compile_jobs > max_compile or linker_jobs > max_link:
+            warnings.append(
+                "suggestion for cling {0}: -j {1} -l {2}".format(
+                    build_type,
+                    max(1, min(compile_jobs, max_compile)),
+                    max(1, min(linker_jobs, max_link)),
+                )
+            )
+
+    # the paths to delete are removed in the last step of the recipe,
+    # therefore all source and build folders exist at the same time, only
+    # the projects in the tmpfs are removed directly after their build
+    disk_peak = sum(
+        [
+            estimate["disk_gb"]
+            for estimate in plan
+            if config.keep_build
+            or not config.tmpfs_size
+            or estimate["disk_gb"] > config.tmpfs_size
+        ]
+    )
+    if disk_peak > host["disk_gb"]:
+        warnings.append(
+            "estimated disk usage {0:.1f} GB exceeds the free disk space {1:.1f} GB".format(
+                disk_peak, host["disk_gb"]
+            )
+        )
+
+    return warnings
+
+
+def format_plan(
+    plan: List[Dict], host: Dict[str, float], warnings: List[str]
+) -> str:
+    """Returns a human readable table of the plan.
+
+        :param plan: estimates of plan_build()
+        :type plan: List[Dict]
+        :param host: resources of the host (see get_host_resources())
+        :type host: Dict[str, float]
+        :param warnings: warnings of check_plan()
+        :type warnings: List[str]
+        :returns: table
+        :rtype: str
+
+        """
+    s = "host: {0:.0f} threads, {1:.1f} GB memory, {2:.1f} GB free disk\n\n".format(
+        host["threads"], host["memory_gb"], host["disk_gb"]
+    )
+    s += "{:<20}{:<12}{:>12}{:>12}{:>12}\n".format(
+        "project", "location", "memory [GB]", "disk [GB]", "time [h]"
+    )
+    for estimate in plan:
+        s += "{:<20}{:<12}{:>12.1f}{:>12.1f}{:>12.2f}\n".format(
+            estimate["name"],
+            estimate["location"],
+            estimate["memory_gb"],
+            estimate["disk_gb"],
+            estimate["hours"],
+        )
+    s += "{:<32}{:>12.1f}{:>12.1f}{:>12.2f}\n".format(
+        "total (peak/sum/sum)",
+        max([estimate["memory_gb"] for estimate in plan] + [0.0]),
+        sum([estimate["disk_gb"] for estimate in plan]),
+        sum([estimate["hours"] for estimate in plan]),
+    )
+
+    if warnings:
+        s += "\nwarnings:\n"
+        for w in warnings:
+            s += "  " + w + "\n"
+    else:
+        s += "\nthe build fits on this host\n"
+
+    return s
+
+
+def gen_plan_report(
+    project_list: List[Dict],
+    config: xcc.config.XCC_Config,
+    build_path: str,
+    cost_file: str = "",
+    runscript_projects: List[str] = [],
+) -> str:
+    """Estimate the resources of the build, compare them with the host and returns a report.
+
+        :param project_list: project list of the generator (XCC_gen.project_list)
+        :type project_list: List[Dict]
+        :param config: Configuration object, which contains different information for the stage
+        :type config: xcc.config.XCC_Config
+        :param build_path: path, where the projects are built (used for the free disk space)
+        :type build_path: str
+        :param cost_file: json file with costs of past builds (see load_cost_table())
+        :type cost_file: str
+        :param runscript_projects: names of the projects, which are built by the runscript of the dev container
+        :type runscript_projects: List[str]
+        :returns: report
+        :rtype: str
+
+        """
+    cost_table = load_cost_table(cost_file)
+    host = get_host_resources(build_path)
+    threads = int(host["threads"])
+    plan = plan_build(project_list, config, cost_table, threads, runscript_projects)
+    warnings = check_plan(plan, config, cost_table, host, threads)
+    return format_plan(plan, host, warnings)
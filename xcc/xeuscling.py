@@ -7,11 +7,16 @@ from hpccm.templates.git import git
 from hpccm.templates.CMakeBuild import CMakeBuild
 
 import xcc.config
-from xcc.helper import add_libcxx_cmake_arg
+from xcc.helper import (
+    add_libcxx_cmake_arg,
+    add_cpu_target_cmake_args,
+    git_clone_step,
+    fingerprint_configure_step,
+)
 
 
 def build_xeus_cling(
-    url: str, branch: str, config: xcc.config.XCC_Config,
+    url: str, branch: str, config: xcc.config.XCC_Config, opts: List[str] = [],
 ) -> List[str]:
     """Return Cling build instructions.
 
@@ -21,6 +26,8 @@ def build_xeus_cling(
         :type branch: str
         :param config: Configuration object, which contains different information for the stage
         :type config: xcc.config.XCC_Config
+        :param opts: additional CMake arguments (e.g. -DBUILD_TESTS=OFF)
+        :type opts: List[str]
         :returns:  a list of build instructions
         :rtype: List[str]
 
@@ -31,9 +38,9 @@ def build_xeus_cling(
         "#// Install Xeus-Cling                                    //",
         "#///////////////////////////////////////////////////////////",
     ]
-    git_conf = git()
     cm.append(
-        git_conf.clone_step(
+        git_clone_step(
+            config=config,
             repository=url,
             branch=branch,
             path=config.build_prefix,
@@ -57,24 +64,36 @@ def build_xeus_cling(
 
         cmake_opts = [
             "-DCMAKE_INSTALL_LIBDIR=" + config.get_miniconda_path() + "/lib",
-            "-DCMAKE_LINKER=/usr/bin/gold",
             "-DCMAKE_BUILD_TYPE=" + build.build_type,
             "-DDISABLE_ARCH_NATIVE=ON",
             "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON",
-            "-DCMAKE_PREFIX_PATH=" + build.cling_install_path,
+            '-DCMAKE_PREFIX_PATH="'
+            + ";".join([build.cling_install_path] + config.get_cmake_prefix_path())
+            + '"',
             '-DCMAKE_CXX_FLAGS="-I ' + build.cling_install_path + '/include"',
         ]
+        cmake_opts += config.get_cmake_linker_args()
+        # xcpp and libxeus-cling are installed in the miniconda installation
+        # and link the libraries of the other projects
+        cmake_opts += config.get_cmake_rpath_args(
+            config.get_miniconda_path(),
+            [config.install_prefix + "/lib", build.cling_install_path + "/lib"],
+        )
+        cmake_opts += opts
 
         if config.build_libcxx:
             cmake_opts = add_libcxx_cmake_arg(cmake_opts)
+        cmake_opts = add_cpu_target_cmake_args(config, cmake_opts)
 
         cmake_conf = CMakeBuild(prefix=config.get_miniconda_path())
-        cm.append(
-            cmake_conf.configure_step(
+        cm += fingerprint_configure_step(
+            config=config,
+            configure_step=cmake_conf.configure_step(
                 build_directory=build.build_path,
                 directory=config.build_prefix + "/xeus-cling",
                 opts=cmake_opts,
-            )
+            ),
+            build_directory=build.build_path,
         )
         cm.append(
             cmake_conf.build_step(